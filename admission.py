@@ -0,0 +1,201 @@
+# admission.py
+"""
+Admission control หน้า OMR pipeline (ทั้ง request แบบ sync และงานใน jobs)
+
+- รันพร้อมกันได้ ADMIT_SLOTS งาน ; ที่เหลือรอในคิวเดียวทั้ง process (จำกัด ADMIT_QUEUE_MAX)
+- คิวเรียงตาม priority (ผู้ใช้ที่เคยซื้อเครดิตก่อน ผู้ใช้ทดลองฟรี) แล้วตามลำดับมาถึง
+- รอเกิน budget / คาดว่าจะรอเกิน budget / คิวเต็ม -> Rejected ทันที (ให้ตอบ 503 + Retry-After)
+- คิวเต็มแต่มีคน priority ต่ำกว่ารออยู่ -> คนที่มาหลังสุดในกลุ่มนั้นถูกตัดออกแทน
+  (ยกเว้นที่ขอ evictable=False เช่นงาน async ที่ตอบ 202 ไปแล้ว)
+"""
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+ADMIT_SLOTS = int(os.getenv("ADMIT_SLOTS", "2"))
+ADMIT_QUEUE_MAX = int(os.getenv("ADMIT_QUEUE_MAX", "32"))
+ADMIT_BUDGET_PAID_SEC = float(os.getenv("ADMIT_BUDGET_PAID_SEC", "30"))
+ADMIT_BUDGET_FREE_SEC = float(os.getenv("ADMIT_BUDGET_FREE_SEC", "10"))
+
+PRIORITY_PAID = 0
+PRIORITY_FREE = 1
+PRIORITY_NAMES = {PRIORITY_PAID: "paid", PRIORITY_FREE: "free"}
+
+
+class Rejected(Exception):
+    """ไม่ได้คิว: reason = full | budget | timeout ; retry_after = วินาทีที่แนะนำให้ลองใหม่"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"admission rejected ({reason})")
+        self.reason = reason
+        self.retry_after = int(retry_after)
+
+
+class _Waiter:
+    __slots__ = ("priority", "evictable", "event", "granted", "cancelled", "evicted", "t_enqueue")
+
+    def __init__(self, priority, evictable=True):
+        self.priority = priority
+        self.evictable = evictable
+        self.event = threading.Event()
+        self.granted = False
+        self.cancelled = False
+        self.evicted = False
+        self.t_enqueue = time.perf_counter()
+
+
+_lock = threading.Lock()
+_heap = []                   # (priority, seq, waiter)
+_seq = itertools.count()
+_running = 0
+_queued = {PRIORITY_PAID: 0, PRIORITY_FREE: 0}
+_service_ema = None          # เวลาถือ slot เฉลี่ย (วินาที)
+_waits = deque(maxlen=4096)  # เวลารอคิว (ms)
+_counters = {"admitted": 0, "rejected_full": 0, "rejected_budget": 0, "rejected_timeout": 0}
+
+
+def budget_for(priority: int) -> float:
+    return ADMIT_BUDGET_PAID_SEC if priority == PRIORITY_PAID else ADMIT_BUDGET_FREE_SEC
+
+
+def _estimate_wait_locked(priority: int):
+    """วินาทีที่คาดว่าจะได้เริ่ม (None = ยังไม่มีข้อมูลเวลาเฉลี่ย)"""
+    if _running < ADMIT_SLOTS and not any(_queued.values()):
+        return 0.0
+    if _service_ema is None:
+        return None
+    ahead = sum(n for p, n in _queued.items() if p <= priority)
+    return (ahead + 1) * _service_ema / ADMIT_SLOTS
+
+
+def _retry_after_locked():
+    total = sum(_queued.values())
+    return max(1, math.ceil((total + 1) * (_service_ema or 1.0) / ADMIT_SLOTS))
+
+
+def _reject_locked(reason: str):
+    _counters["rejected_" + reason] += 1
+    return Rejected(reason, _retry_after_locked())
+
+
+def _evict_lower_locked(priority: int):
+    """ตัดคนที่ priority ต่ำกว่าและมาหลังสุดออกจากคิว ; True ถ้าตัดได้"""
+    victims = [(p, seq, w) for p, seq, w in _heap if not w.cancelled and w.evictable and p > priority]
+    if not victims:
+        return False
+    _, _, w = max(victims, key=lambda v: (v[0], v[1]))
+    w.cancelled = True
+    w.evicted = True
+    _queued[w.priority] -= 1
+    w.event.set()
+    return True
+
+
+def _has_room_locked(priority: int):
+    return sum(_queued.values()) < ADMIT_QUEUE_MAX or any(
+        not w.cancelled and w.evictable and p > priority for p, _, w in _heap
+    )
+
+
+def check(priority: int, budget: float = None):
+    """ตรวจล่วงหน้า (ไม่จองคิว): คิวเต็ม/คาดว่ารอเกิน budget -> Rejected"""
+    budget = budget_for(priority) if budget is None else budget
+    with _lock:
+        if not _has_room_locked(priority):
+            raise _reject_locked("full")
+        est = _estimate_wait_locked(priority)
+        if est is not None and est > budget:
+            raise _reject_locked("budget")
+
+
+def acquire(priority: int, budget: float = None, evictable: bool = True):
+    """รอ slot ; คืนเวลาเริ่ม (ส่งให้ release) หรือ raise Rejected"""
+    global _running
+    budget = budget_for(priority) if budget is None else budget
+
+    with _lock:
+        if _running < ADMIT_SLOTS and not any(_queued.values()):
+            _running += 1
+            _counters["admitted"] += 1
+            _waits.append(0.0)
+            return time.perf_counter()
+
+        est = _estimate_wait_locked(priority)
+        if est is not None and est > budget:
+            raise _reject_locked("budget")
+        if sum(_queued.values()) >= ADMIT_QUEUE_MAX and not _evict_lower_locked(priority):
+            raise _reject_locked("full")
+
+        waiter = _Waiter(priority, evictable)
+        heapq.heappush(_heap, (priority, next(_seq), waiter))
+        _queued[priority] += 1
+
+    waiter.event.wait(budget)
+
+    with _lock:
+        if waiter.evicted:
+            raise _reject_locked("full")
+        if not waiter.granted:
+            waiter.cancelled = True
+            _queued[priority] -= 1
+            raise _reject_locked("timeout")
+        _counters["admitted"] += 1
+        _waits.append((time.perf_counter() - waiter.t_enqueue) * 1000)
+    return time.perf_counter()
+
+
+def release(t_start: float):
+    """คืน slot ; ส่งต่อให้คนถัดไปในคิว (priority สูงสุด มาก่อน)"""
+    global _running, _service_ema
+    held = time.perf_counter() - t_start
+    with _lock:
+        _service_ema = held if _service_ema is None else 0.8 * _service_ema + 0.2 * held
+        while _heap:
+            _, _, waiter = heapq.heappop(_heap)
+            if waiter.cancelled:
+                continue
+            _queued[waiter.priority] -= 1
+            waiter.granted = True  # slot ส่งต่อตรง ๆ (_running ไม่เปลี่ยน)
+            waiter.event.set()
+            return
+        _running -= 1
+
+
+class slot:
+    """with admission.slot(priority): ... (raise Rejected ถ้าไม่ได้คิว)"""
+
+    def __init__(self, priority: int, budget: float = None, evictable: bool = True):
+        self.priority = priority
+        self.budget = budget
+        self.evictable = evictable
+
+    def __enter__(self):
+        self._t = acquire(self.priority, self.budget, self.evictable)
+        return self
+
+    def __exit__(self, *exc):
+        release(self._t)
+        return False
+
+
+def stats():
+    with _lock:
+        waits = np.asarray(_waits, dtype=np.float64)
+        return {
+            "slots": ADMIT_SLOTS,
+            "running": _running,
+            "queue_max": ADMIT_QUEUE_MAX,
+            "queued": {PRIORITY_NAMES[p]: n for p, n in _queued.items()},
+            "service_ms_ema": (_service_ema * 1000) if _service_ema is not None else None,
+            "wait_ms": {
+                "p50": float(np.percentile(waits, 50)) if len(waits) else 0.0,
+                "p95": float(np.percentile(waits, 95)) if len(waits) else 0.0,
+            },
+            **_counters,
+        }
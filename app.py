@@ -3,24 +3,30 @@ from flask import Flask, render_template, request, redirect, session, send_from_
 from werkzeug.exceptions import RequestEntityTooLarge
 import cv2
 import numpy as np
-import base64
 import os
 import random
 import uuid
 import time
 import requests
 import re
+import json
 from dotenv import load_dotenv
 
 # Import modules
 import utils
-import omr60
-import omr80
+import omr
+import model_loader
 import os
 import csv
 import io
 from flask import request, abort, render_template, redirect, Response
 import db
+import jobs
+import admission
+import corners
+import results
+import image_store
+import grade_cache
 
 
 load_dotenv()
@@ -37,6 +43,15 @@ app.config["MAX_CONTENT_LENGTH"] = int(os.getenv("MAX_UPLOAD_MB", "8")) * 1024 *
 
 ALLOWED_IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp"}
 
+# ความละเอียดที่ server ใช้งานจริง (ด้านยาว px) ; upload.html ให้ browser ย่อ + encode ใหม่ให้เท่านี้ก่อนส่ง
+AUTO_MAX_SIDE = int(os.getenv("AUTO_MAX_SIDE", "2000"))
+MANUAL_MAX_SIDE = int(os.getenv("MANUAL_MAX_SIDE", "2400"))
+UPLOAD_JPEG_QUALITY = float(os.getenv("UPLOAD_JPEG_QUALITY", "0.9"))   # คุณภาพ JPEG ฝั่ง browser (0-1)
+CLIENT_RESIZE = (os.getenv("CLIENT_RESIZE", "1") == "1")
+
+# เก็บคำตอบที่อ่านได้ต่อแผ่น (เฉพาะที่ระบุวิชา) ไว้ตรวจใหม่ด้วยเฉลยใหม่ผ่าน /regrade
+SAVE_GRADED_SHEETS = (os.getenv("SAVE_GRADED_SHEETS", "1") == "1")
+
 
 @app.errorhandler(RequestEntityTooLarge)
 def handle_file_too_large(e):
@@ -57,35 +72,34 @@ def is_allowed_image_filename(filename: str) -> bool:
     return ext in ALLOWED_IMAGE_EXTS
 
 
-def read_image_from_filestorage(file_storage):
+def _upload_config():
+    """ขนาด/คุณภาพที่ browser ควรย่อรูปก่อนส่ง (ส่งให้ upload.html -> static/resize.js)"""
+    return {
+        "enabled": CLIENT_RESIZE,
+        "auto_max_side": AUTO_MAX_SIDE,
+        "manual_max_side": MANUAL_MAX_SIDE,
+        "quality": UPLOAD_JPEG_QUALITY,
+        "max_bytes": app.config["MAX_CONTENT_LENGTH"],
+    }
+
+
+def read_image_from_filestorage(file_storage, max_side=None):
     """
     อ่านรูปจาก Flask FileStorage แบบปลอดภัย
-    คืนค่า: img (BGR) หรือ None
+    - ตรวจ header ก่อน decode (ไฟล์เสีย/ใหญ่เกิน ปฏิเสธเลย)
+    - JPEG ใหญ่ decode แบบย่อให้ใกล้ max_side ทันที
+    คืนค่า: (img BGR, None) หรือ (None, ข้อความ error)
     """
     try:
         data = file_storage.read()
         file_storage.stream.seek(0)  # reset pointer เผื่อใช้ต่อ
         if not data:
-            return None
-        arr = np.frombuffer(data, np.uint8)
-        img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
-        return img
+            return None, "❌ ไม่สามารถอ่านไฟล์รูปได้ (ไฟล์ว่างเปล่า) กรุณาลองถ่าย/เลือกใหม่"
+        return utils.decode_image_bytes(data, max_side=max_side), None
+    except utils.ImageRejected as e:
+        return None, str(e)
     except Exception:
-        return None
-
-
-def downscale_image(img, max_side=2000):
-    """
-    ลดขนาดรูปก่อนประมวลผล เพื่อให้เร็วขึ้น/นิ่งขึ้น
-    """
-    try:
-        h, w = img.shape[:2]
-        if max(h, w) > max_side:
-            scale = max_side / float(max(h, w))
-            img = cv2.resize(img, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
-        return img
-    except Exception:
-        return img
+        return None, "❌ ไม่สามารถอ่านไฟล์รูปได้ (ไฟล์เสียหรือไม่รองรับ) กรุณาลองถ่าย/เลือกใหม่"
 
 
 # -------------------------
@@ -102,8 +116,21 @@ PENDING_OTP = {}
 SLIP_API_KEY = os.getenv("SLIP_API_KEY", "")
 EASYSLIP_VERIFY_URL = os.getenv("EASYSLIP_VERIFY_URL", "https://developer.easyslip.com/api/v1/verify")
 
-# Init DB
-db.init_db()
+# DB schema สร้างตอนต่อ DB ครั้งแรก (db.ensure_db) ; model โหลด + warmup ใน background
+# ไม่ block การ import (cold start) -> ดูสถานะได้ที่ /readyz
+WARMUP_ON_START = (os.getenv("WARMUP_ON_START", "1") == "1")
+if WARMUP_ON_START:
+    omr.start_warmup()
+
+
+WARP_FAIL_MESSAGE = (
+    "❌ ระบบไม่สามารถตรวจจับมุมกระดาษคำตอบได้<br><br>"
+    "💡 คำแนะนำ:<br>"
+    "- ถ่ายในที่แสงสว่างเพียงพอ<br>"
+    "- ให้เห็นกระดาษทั้ง 4 มุมชัดเจน<br>"
+    "- วางกระดาษบนพื้นหลังเรียบ/ตัดของรกออก<br><br>"
+    "หรือเลือก <b>โหมด Manual</b> เพื่อกำหนดมุมเอง"
+)
 
 
 # -------------------------
@@ -127,6 +154,23 @@ def ensure_logged_in():
     return username, user, None
 
 
+def _priority_for(username):
+    # ผู้ใช้ที่เคยซื้อเครดิตได้คิวก่อนผู้ใช้ทดลองฟรี
+    return admission.PRIORITY_PAID if db.has_paid_order(username) else admission.PRIORITY_FREE
+
+
+def _busy_response(e):
+    """503 + Retry-After เมื่อคิวตรวจเต็ม/รอนานเกิน budget (แทนการค้างจน timeout)"""
+    resp = app.make_response((
+        "<h3>⏳ ระบบกำลังตรวจงานจำนวนมาก</h3>"
+        f"<p>กรุณาลองใหม่ในอีกประมาณ {e.retry_after} วินาที</p>"
+        "<a href='/'>กลับหน้าหลัก</a>",
+        503,
+    ))
+    resp.headers["Retry-After"] = str(e.retry_after)
+    return resp
+
+
 def _safe_float(x, default=None):
     try:
         return float(x)
@@ -139,6 +183,12 @@ def _last4_digits(s: str) -> str:
     return digits[-4:] if len(digits) >= 4 else ""
 
 
+def _engine_from_request(default=None):
+    """engine ที่ขอมากับ request (form/query) ; ไม่รู้จัก -> None ; ปิดอยู่ (ไม่มี weights) -> DEFAULT_ENGINE"""
+    name = omr.resolve_engine(request.values.get("engine") or default)
+    return name if name in omr.ENGINES else None
+
+
 def _norm_name(s: str) -> str:
     s = (s or "").strip().lower()
     s = re.sub(r"[^a-z0-9ก-๙]+", "", s)
@@ -249,14 +299,14 @@ def maybe_cleanup():
         pass
 
 
-# ✅ per-session manual upload helpers
-def _ensure_upload_dir():
-    os.makedirs("uploads", exist_ok=True)
+# ✅ per-session manual upload helpers (รูปอยู่ใน image_store ; session เก็บแค่ token)
+def _pop_manual_upload():
+    """เอา token ของรูป Manual ออกจาก session -> (token, created_at)"""
+    return session.pop("manual_upload_token", None), session.pop("manual_upload_created_at", None)
 
 
-def _new_manual_upload_path():
-    _ensure_upload_dir()
-    return os.path.join("uploads", f"sheet_{uuid.uuid4().hex}.jpg")
+def _manual_expired(created_at):
+    return bool(created_at) and (time.time() - float(created_at)) > image_store.MANUAL_FILE_TTL_SEC
 
 
 def normalize_slip_to_jpg(upload_file, max_width=1600, jpeg_quality=92):
@@ -396,6 +446,39 @@ def verify_slip_with_easyslip(file_path: str, expected_amount: float):
 # -------------------------
 # Routes
 # -------------------------
+@app.route("/healthz")
+def healthz():
+    # process ยังตอบได้ (liveness)
+    return jsonify({"ok": True})
+
+
+@app.route("/readyz")
+def readyz():
+    # พร้อมรับงานตรวจเมื่อ model โหลด + warmup เสร็จแล้ว
+    st = model_loader.model_state()
+    return jsonify({"ok": st["state"] == "ready", **st}), (200 if st["state"] == "ready" else 503)
+
+
+@app.route("/metrics")
+def metrics():
+    # ตัวเลขสำหรับจูนระบบ (JSON): model / micro-batching / cascade / หามุม / คิวงาน
+    # มี path model / error / สถานะภายใน -> admin เท่านั้น (?token=ADMIN_TOKEN)
+    require_admin()
+    return jsonify({
+        "model": model_loader.model_state(),
+        "pool": model_loader.pool_stats(),
+        "batcher": model_loader.batcher_stats(),
+        "cascade": omr.cascade_stats(),
+        "corners": corners.corner_stats(),
+        "results": results.stats(),
+        "manual_store": image_store.stats(),
+        "decode": utils.decode_stats(),
+        "grade_cache": grade_cache.stats(),
+        "jobs": {"pending": jobs.pending_count(), "queue_max": jobs.JOB_QUEUE_MAX, "admit_max": jobs.JOB_ADMIT_MAX},
+        "admission": admission.stats(),
+    })
+
+
 @app.route("/login", methods=["GET", "POST"])
 def login():
     cleanup_expired_otp()
@@ -496,13 +579,8 @@ def verify():
 def logout():
     session.pop("username", None)
 
-    # cleanup manual file (ถ้าค้างอยู่)
-    manual_path = session.pop("manual_upload_path", None)
-    try:
-        if manual_path and os.path.exists(manual_path):
-            os.remove(manual_path)
-    except Exception:
-        pass
+    # cleanup manual image (ถ้าค้างอยู่)
+    image_store.discard(_pop_manual_upload()[0])
 
     return redirect("/login")
 
@@ -557,6 +635,9 @@ def upload_page():
         subjects=subjects,
         selected_subject=selected_subject,
         warp_fail_message=warp_fail_message,
+        layout_choices=omr.available_layouts(),
+        engine=_engine_from_request() or omr.DEFAULT_ENGINE,
+        upload_config=_upload_config(),
     )
 
 
@@ -607,6 +688,67 @@ def api_answer_key():
     return jsonify({"ok": True, "subject": subject, "num_questions": num_questions, "key_str": key_str})
 
 
+@app.route("/regrade", methods=["POST"])
+def regrade_subject():
+    """
+    ตรวจใหม่ทุกแผ่นของวิชา (subject + num_questions) จากคำตอบที่เก็บไว้ ไม่ต้องถ่าย/inference ใหม่ ไม่ใช้เครดิต
+    - answer_key ส่งมา -> บันทึกเป็นเฉลยของวิชาก่อนแล้วใช้ตรวจ ; ไม่ส่ง -> ใช้เฉลยที่บันทึกไว้
+    -> JSON: คะแนนรายแผ่น + จำนวนแผ่นที่ตอบถูกรายข้อ
+    """
+    username, user, resp = ensure_logged_in()
+    if resp:
+        return jsonify({"ok": False, "message": "กรุณาเข้าสู่ระบบ"}), 401
+
+    subject = (request.form.get("subject") or "").strip()
+    try:
+        num_questions = int(request.form.get("num_questions", "60"))
+    except (TypeError, ValueError):
+        return jsonify({"ok": False, "message": "❌ จำนวนข้อไม่ถูกต้อง"}), 400
+    if not subject:
+        return jsonify({"ok": False, "message": "missing subject"}), 400
+    if num_questions not in omr.available_layouts():
+        return jsonify({"ok": False, "message": f"❌ ไม่รองรับกระดาษแบบ {num_questions} ข้อ"}), 400
+
+    key_str = utils.normalize_answer_key_str(request.form.get("answer_key") or "", num_questions)
+    if key_str:
+        db.upsert_saved_key(username, subject, num_questions, key_str)
+    else:
+        key_str = db.get_saved_key(username, subject, num_questions) or ""
+    if not key_str:
+        return jsonify({"ok": False, "message": "❌ ยังไม่มีเฉลยของวิชานี้"}), 400
+
+    t0 = time.perf_counter()
+    sheets = db.list_graded_sheets(username, subject, num_questions)
+    graded = omr.regrade_packed([s["answers"] for s in sheets], key_str, omr.get_layout(num_questions))
+    total = graded["total"]
+    scores = graded["correct"].tolist()
+    db.update_graded_scores(username, key_str, [(s["id"], score, total) for s, score in zip(sheets, scores)])
+
+    return jsonify({
+        "ok": True,
+        "subject": subject,
+        "num_questions": num_questions,
+        "key_str": key_str,
+        "count": len(sheets),
+        "total": total,
+        "ms": round((time.perf_counter() - t0) * 1000, 1),
+        "mean": round(sum(scores) / len(scores), 2) if scores else None,
+        "per_question": graded["per_question"].tolist(),
+        "sheets": [
+            {
+                "id": s["id"],
+                "created_at": s["created_at"],
+                "previous": s["score"],
+                "correct": score,
+                "wrong": int(w),
+                "blank": int(b),
+                "multi": int(m),
+            }
+            for s, score, w, b, m in zip(sheets, scores, graded["wrong"], graded["blank"], graded["multi"])
+        ],
+    })
+
+
 @app.route("/buy", methods=["GET", "POST"])
 def buy_credits():
     username, user, resp = ensure_logged_in()
@@ -793,11 +935,78 @@ def buy_credits():
     )
 
 
+# -------------------------
+# Grade cache (ส่งรูปเดิมซ้ำ -> ผลเดิม ไม่ตรวจใหม่ ไม่ตัดเครดิตซ้ำ)
+# -------------------------
+def _grade_form():
+    """
+    ค่าจากฟอร์มตรวจ -> (num_questions, key_str, subject, engine)
+    ไม่ถูกต้อง -> ValueError (ข้อความพร้อมแสดงผู้ใช้)
+    """
+    try:
+        num_questions = int(request.form.get("num_questions", "60"))
+    except (TypeError, ValueError):
+        raise ValueError("❌ จำนวนข้อไม่ถูกต้อง")
+    if num_questions not in omr.available_layouts():
+        raise ValueError(f"❌ ไม่รองรับกระดาษแบบ {num_questions} ข้อ")
+
+    engine = _engine_from_request()
+    if engine is None:
+        raise ValueError("❌ ไม่รู้จัก engine ที่เลือก")
+
+    key_str = (request.form.get("answer_key") or "").strip()
+    subject = (request.form.get("subject") or "").strip()
+    return num_questions, key_str, subject, engine
+
+
+def _grade_scope(username, num_questions, key_str, engine, points=None):
+    return grade_cache.scope(
+        username, num_questions, utils.normalize_answer_key_str(key_str, num_questions),
+        engine or omr.DEFAULT_ENGINE, points,
+    )
+
+
+def _idempotency_key(scope):
+    return grade_cache.idempotency_key(scope, request.form.get("idempotency_key") or request.headers.get("Idempotency-Key"))
+
+
+def _cached_grade(owner, *keys, count_miss=True):
+    """ผลตรวจที่เคยได้จาก key ใด key หนึ่ง ; overlay หมดอายุไปก่อน -> แสดงผลโดยไม่มีรูป debug"""
+    result = grade_cache.lookup(*keys, count_miss=count_miss)
+    if result is not None and result.get("overlay_url"):
+        if results.get(result["overlay_url"].split("/")[2], owner) is None:
+            result.update(overlay_url=None, marks=None)
+    return result
+
+
+def _points_from_form():
+    """points "x,y;x,y;x,y;x,y" -> list 4 จุด ; รูปแบบผิด -> ValueError"""
+    pts = [list(map(float, p.split(","))) for p in request.form.get("points", "").split(";")]
+    if len(pts) != 4:
+        raise ValueError("points must be 4")
+    return pts
+
+
 @app.route("/auto_grade", methods=["POST"])
 def auto_grade():
     username, user, resp = ensure_logged_in()
     if resp:
         return resp
+
+    # ✅ scope ของ idempotency สร้างจากค่าที่ตรวจแล้ว (เฉลย normalize แล้ว : ช่องว่าง/ตัวเล็กต่างกันได้ key เดียวกัน)
+    try:
+        num_questions, key_str, subject, engine = _grade_form()
+    except ValueError as e:
+        session["warp_fail_message"] = str(e)
+        return redirect("/")
+
+    # ✅ ส่งซ้ำด้วย idempotency key เดิม -> ผลเดิมทันที (ไม่ต้องมีเครดิตเหลือ)
+    scope = _grade_scope(username, num_questions, key_str, engine)
+    idem = _idempotency_key(scope)
+    cached = _cached_grade(username, idem, count_miss=False)
+    if cached is not None:
+        return render_template("result.html", **cached, username=username, credits=user["credits"])
+
     if user["credits"] <= 0:
         return redirect("/buy")
 
@@ -809,6 +1018,7 @@ def auto_grade():
         session["warp_fail_message"] = "⏳ ระบบกำลังตรวจอยู่ กรุณารอสักครู่ (อย่ากดซ้ำ)"
         return redirect("/")
 
+    admit_t = None
     try:
         file = request.files.get("sheet")
         if not file or file.filename == "":
@@ -819,59 +1029,51 @@ def auto_grade():
             session["warp_fail_message"] = "❌ รองรับเฉพาะไฟล์รูป .jpg .jpeg .png .webp"
             return redirect("/")
 
-        num_questions = int(request.form.get("num_questions", "60"))
-        key_str = (request.form.get("answer_key") or "").strip()
-        subject = (request.form.get("subject") or "").strip()
-
         session["last_answer_key"] = utils.normalize_answer_key_str(key_str, num_questions)
         session["last_subject"] = subject
         session["last_num_questions"] = num_questions
 
-        img = read_image_from_filestorage(file)
+        # ✅ รูปเดิม + เฉลยเดิม -> ผลจาก cache (ไม่ decode / warp / YOLO)
+        content_key = grade_cache.content_key(scope, file.read())
+        file.stream.seek(0)
+        cached = _cached_grade(username, content_key)
+        if cached is not None:
+            grade_cache.put(cached, idem)
+            return render_template("result.html", **cached, username=username, credits=user["credits"])
+
+        # ✅ คิวกลางหน้า pipeline (priority ตามประเภทผู้ใช้) ; รอไม่ไหว -> 503
+        try:
+            admit_t = admission.acquire(_priority_for(username))
+        except admission.Rejected as e:
+            return _busy_response(e)
+
+        img, err = read_image_from_filestorage(file, max_side=AUTO_MAX_SIDE)
         if img is None:
-            session["warp_fail_message"] = "❌ ไม่สามารถอ่านไฟล์รูปได้ (ไฟล์เสียหรือไม่รองรับ) กรุณาลองถ่าย/เลือกใหม่"
+            session["warp_fail_message"] = err
             return redirect(f"/?num_questions={num_questions}&subject={subject}" if subject else f"/?num_questions={num_questions}")
 
-        img = downscale_image(img, max_side=2000)
-
-        warped = utils.auto_detect_and_warp(img)
-        if warped is None:
-            session["warp_fail_message"] = (
-                "❌ ระบบไม่สามารถตรวจจับมุมกระดาษคำตอบได้<br><br>"
-                "💡 คำแนะนำ:<br>"
-                "- ถ่ายในที่แสงสว่างเพียงพอ<br>"
-                "- ให้เห็นกระดาษทั้ง 4 มุมชัดเจน<br>"
-                "- วางกระดาษบนพื้นหลังเรียบ/ตัดของรกออก<br><br>"
-                "หรือเลือก <b>โหมด Manual</b> เพื่อกำหนดมุมเอง"
-            )
+        geom = utils.detect_sheet(img, layout=omr.get_layout(num_questions))
+        if geom is None:
+            session["warp_fail_message"] = WARP_FAIL_MESSAGE
             return redirect(f"/?num_questions={num_questions}&subject={subject}" if subject else f"/?num_questions={num_questions}")
 
         try:
-            omr = omr60 if num_questions == 60 else omr80
-            answers, eff_key, detail, stats, debug_img = omr.process_auto(warped, key_str)
+            answers, eff_key, detail, stats, debug_img = omr.process_sheet(geom, key_str, num_questions, engine, debug="lazy")
         except Exception as e:
             session["warp_fail_message"] = f"❌ ตรวจไม่สำเร็จ: {e}"
             return redirect(f"/?num_questions={num_questions}&subject={subject}" if subject else f"/?num_questions={num_questions}")
 
-        db.set_user_credits(username, user["credits"] - 1)
-
-        _, buf = cv2.imencode(".jpg", debug_img)
-        debug_b64 = base64.b64encode(buf).decode("utf-8")
-
-        return render_template(
-            "result.html",
-            answers=answers,
-            stats=stats,
-            detail=detail,
-            debug_image=debug_b64,
-            num_questions=num_questions,
-            answer_key=eff_key,
-            answer_key_str_raw=utils.normalize_answer_key_str(key_str, num_questions),
-            username=username,
-            credits=user["credits"] - 1,
-        )
+        result = _grade_result(username, answers, eff_key, detail, stats, debug_img, num_questions, key_str)
+        # ✅ ตัดเครดิตก่อนเก็บผลลง cache (ตัดไม่สำเร็จ -> ส่งซ้ำต้องตรวจ/ตัดใหม่ ไม่ได้ผลฟรี)
+        credits = db.adjust_user_credits(username, -1)
+        grade_cache.put(result, content_key, idem)
+        _save_graded_sheet(username, subject, num_questions, result, key_str)
+
+        return render_template("result.html", **result, username=username, credits=credits)
 
     finally:
+        if admit_t is not None:
+            admission.release(admit_t)
         end_action_lock("auto_grade")
 
 
@@ -901,32 +1103,27 @@ def select_corners():
     session["last_subject"] = subject
     session["last_num_questions"] = num_questions
 
-    img = read_image_from_filestorage(file)
+    img, err = read_image_from_filestorage(file, max_side=MANUAL_MAX_SIDE)
     if img is None:
-        session["warp_fail_message"] = "❌ ไม่สามารถอ่านไฟล์รูปได้ กรุณาลองถ่าย/เลือกใหม่"
+        session["warp_fail_message"] = err
         return redirect(f"/?num_questions={num_questions}&subject={subject}" if subject else f"/?num_questions={num_questions}")
 
-    img = downscale_image(img, max_side=2400)
-
-    # ✅ per-session manual image path (ไม่ชนกัน)
-    old_path = session.get("manual_upload_path")
-    if old_path and os.path.exists(old_path):
-        try:
-            os.remove(old_path)
-        except Exception:
-            pass
-
-    save_path = _new_manual_upload_path()
-    cv2.imwrite(save_path, img)
-    session["manual_upload_path"] = save_path
-
+    # ✅ per-session manual image (ในหน่วยความจำ ไม่เขียนไฟล์) ; หน้า select โหลด preview ตามขนาดจอจาก URL
+    image_store.discard(_pop_manual_upload()[0])
+    token = image_store.put(username, img)
+    session["manual_upload_token"] = token
     session["manual_upload_created_at"] = time.time()
-    _, buf = cv2.imencode(".jpg", img)
+
     return render_template(
         "select.html",
-        img_data=base64.b64encode(buf).decode("utf-8"),
+        preview_url=f"/manual/{token}/preview",
+        idempotency_key=uuid.uuid4().hex,
+        image_width=img.shape[1],
+        image_height=img.shape[0],
         answer_key_str=key_str,
+        subject=subject,
         num_questions=num_questions,
+        engine=_engine_from_request() or omr.DEFAULT_ENGINE,
         credits=user["credits"],
     )
 
@@ -936,6 +1133,25 @@ def grade():
     username, user, resp = ensure_logged_in()
     if resp:
         return resp
+
+    try:
+        num_questions, key_str, subject, engine = _grade_form()
+    except ValueError as e:
+        image_store.discard(_pop_manual_upload()[0])
+        session["warp_fail_message"] = str(e)
+        return redirect("/")
+
+    # ✅ กด back แล้วส่งซ้ำ (รูป manual ถูกลบไปแล้ว) -> ผลเดิมจาก idempotency key
+    try:
+        points = _points_from_form()
+    except ValueError:
+        points = None
+    scope = _grade_scope(username, num_questions, key_str, engine, points)
+    idem = _idempotency_key(scope)
+    cached = _cached_grade(username, idem, count_miss=False)
+    if cached is not None:
+        return render_template("result.html", **cached, username=username, credits=user["credits"])
+
     if user["credits"] <= 0:
         return redirect("/buy")
 
@@ -947,85 +1163,347 @@ def grade():
         session["warp_fail_message"] = "⏳ ระบบกำลังตรวจอยู่ กรุณารอสักครู่ (อย่ากดซ้ำ)"
         return redirect("/")
 
+    admit_t = None
     try:
-        manual_path = session.get("manual_upload_path")
-        if not manual_path or not os.path.exists(manual_path):
-            session["warp_fail_message"] = "❌ ไม่พบรูปสำหรับ Manual (กรุณาอัปโหลดใหม่)"
-            return redirect("/")
-        created_at = session.get("manual_upload_created_at")
-        ttl_sec = int(os.getenv("MANUAL_FILE_TTL_SEC", "900"))
-        if created_at and (time.time() - float(created_at)) > ttl_sec:
-            # ไฟล์เก่าเกินไป ลบทิ้งเพื่อความเป็นส่วนตัว
-            try:
-                if manual_path and os.path.exists(manual_path):
-                    os.remove(manual_path)
-            except Exception:
-                pass
-            session.pop("manual_upload_path", None)
-            session.pop("manual_upload_created_at", None)
+        manual_token = session.get("manual_upload_token")
+        if _manual_expired(session.get("manual_upload_created_at")):
+            # รูปเก่าเกินไป ลบทิ้งเพื่อความเป็นส่วนตัว
+            image_store.discard(_pop_manual_upload()[0])
             session["warp_fail_message"] = "⏳ รูปหมดอายุแล้ว (ระบบลบทิ้งอัตโนมัติ) กรุณาอัปโหลดใหม่"
             return redirect("/")
+        manual_entry = image_store.get(manual_token, username)
+        if manual_entry is None:
+            session["warp_fail_message"] = "❌ ไม่พบรูปสำหรับ Manual (กรุณาอัปโหลดใหม่)"
+            return redirect("/")
 
 
-        points_str = request.form.get("points", "")
-        if not points_str:
+        if not request.form.get("points", ""):
             session["warp_fail_message"] = "❌ กรุณาเลือก 4 มุมก่อน"
             return redirect("/")
 
-        try:
-            pts = [list(map(float, p.split(","))) for p in points_str.split(";")]
-            if len(pts) != 4:
-                raise ValueError("points must be 4")
-        except Exception:
+        if points is None:
             session["warp_fail_message"] = "❌ จุดมุมไม่ถูกต้อง กรุณาลองใหม่"
             return redirect("/")
 
-        img = cv2.imread(manual_path)
+        # ✅ รูปเดิม + มุมเดิม + เฉลยเดิม -> ผลจาก cache
+        content_key = grade_cache.content_key(scope, manual_entry["data"])
+        cached = _cached_grade(username, content_key)
+        if cached is not None:
+            grade_cache.put(cached, idem)
+            return render_template("result.html", **cached, username=username, credits=user["credits"])
+
+        try:
+            admit_t = admission.acquire(_priority_for(username))
+        except admission.Rejected as e:
+            return _busy_response(e)
+
+        img = image_store.load(manual_token, username)
         if img is None:
             session["warp_fail_message"] = "❌ ไม่สามารถอ่านรูปสำหรับ Manual ได้ กรุณาอัปโหลดใหม่"
             return redirect("/")
 
-        warped = utils.warp_from_four_points(img, pts)
-
-        num_questions = int(request.form.get("num_questions", "60"))
-        key_str = (request.form.get("answer_key") or "").strip()
+        warped = utils.warp_from_four_points(img, points)
 
         try:
-            omr = omr60 if num_questions == 60 else omr80
-            answers, eff_key, detail, stats, debug_img = omr.process_auto(warped, key_str)
+            answers, eff_key, detail, stats, debug_img = omr.process_auto(warped, key_str, num_questions, engine)
         except Exception as e:
             session["warp_fail_message"] = f"❌ ตรวจไม่สำเร็จ: {e}"
             return redirect(f"/?num_questions={num_questions}")
 
-        db.set_user_credits(username, user["credits"] - 1)
-
-        _, buf = cv2.imencode(".jpg", debug_img)
-        return render_template(
-            "result.html",
-            answers=answers,
-            stats=stats,
-            detail=detail,
-            debug_image=base64.b64encode(buf).decode("utf-8"),
-            num_questions=num_questions,
-            answer_key=eff_key,
-            answer_key_str_raw=utils.normalize_answer_key_str(key_str, num_questions),
-            username=username,
-            credits=user["credits"] - 1,
-        )
+        result = _grade_result(username, answers, eff_key, detail, stats, debug_img, num_questions, key_str)
+        # ✅ ตัดเครดิตก่อนเก็บผลลง cache (ตัดไม่สำเร็จ -> ส่งซ้ำต้องตรวจ/ตัดใหม่ ไม่ได้ผลฟรี)
+        credits = db.adjust_user_credits(username, -1)
+        grade_cache.put(result, content_key, idem)
+        _save_graded_sheet(username, subject, num_questions, result, key_str)
+
+        return render_template("result.html", **result, username=username, credits=credits)
 
     finally:
         # ✅ ลบทิ้งอัตโนมัติทุกกรณี (สำเร็จ/ไม่สำเร็จ)
-        try:
-            manual_path = session.get("manual_upload_path")
-            if manual_path and os.path.exists(manual_path):
-                os.remove(manual_path)
-        except Exception:
-            pass
-        session.pop("manual_upload_path", None)
-        session.pop("manual_upload_created_at", None)
+        image_store.discard(_pop_manual_upload()[0])
+        if admit_t is not None:
+            admission.release(admit_t)
         end_action_lock("manual_grade")
 
 
+# -------------------------
+# Async grading jobs
+# -------------------------
+def _grade_job(owner, image, points, num_questions, key_str, engine):
+    """งานตรวจ 1 แผ่น (รันใน jobs worker): image = bytes (auto) หรือรูป BGR (manual + points)"""
+    if points is None:
+        geom = utils.detect_sheet(utils.decode_image_bytes(image, max_side=AUTO_MAX_SIDE), layout=omr.get_layout(num_questions))
+        if geom is None:
+            raise ValueError(WARP_FAIL_MESSAGE)
+        answers, eff_key, detail, stats, debug_img = omr.process_sheet(geom, key_str, num_questions, engine, debug="lazy")
+    else:
+        warped = utils.warp_from_four_points(image, points)
+        answers, eff_key, detail, stats, debug_img = omr.process_auto(warped, key_str, num_questions, engine)
+
+    return _grade_result(owner, answers, eff_key, detail, stats, debug_img, num_questions, key_str)
+
+
+def _grade_result(owner, answers, eff_key, detail, stats, debug_img, num_questions, key_str):
+    """ผลตรวจ 1 แผ่น -> ตัวแปรของ result.html (ยกเว้น username/credits) ; เก็บลง grade_cache ได้"""
+    return {
+        "answers": answers,
+        "stats": stats,
+        "detail": detail,
+        **_overlay_fields(owner, debug_img),
+        "num_questions": num_questions,
+        "answer_key": eff_key,
+        "answer_key_str_raw": utils.normalize_answer_key_str(key_str, num_questions),
+    }
+
+
+def _save_graded_sheet(username, subject, num_questions, result, key_str):
+    """เก็บคำตอบของแผ่นที่ตรวจแล้ว (packed) ไว้ให้ /regrade ; ไม่ระบุวิชา -> ไม่เก็บ"""
+    if not subject or not SAVE_GRADED_SHEETS:
+        return
+    try:
+        db.add_graded_sheet(
+            username, subject, num_questions,
+            omr.pack_answers(result["answers"], num_questions),
+            utils.normalize_answer_key_str(key_str, num_questions),
+            result["stats"]["correct"], result["stats"]["total"],
+        )
+    except Exception as e:
+        print(f"[SHEETS] save failed: {e}")
+
+
+def _job_error(message, status=400):
+    return jsonify({"ok": False, "message": message}), status
+
+
+@app.route("/jobs/submit", methods=["POST"])
+def submit_grade_job():
+    """
+    ส่งงานตรวจเข้าคิว -> job_id ทันที (202)
+    - auto: ไฟล์ sheet
+    - manual: points (4 มุม) + รูปของ session จาก /select
+    """
+    username, user, resp = ensure_logged_in()
+    if resp:
+        return _job_error("กรุณาเข้าสู่ระบบ", 401)
+    if user["credits"] - jobs.pending_count(username) <= 0:
+        return jsonify({"ok": False, "message": "เครดิตไม่พอ", "redirect": "/buy"}), 402
+
+    maybe_cleanup()
+
+    try:
+        num_questions, key_str, subject, engine = _grade_form()
+    except ValueError as e:
+        return _job_error(str(e))
+
+    if request.form.get("points", ""):
+        try:
+            points = _points_from_form()
+        except ValueError:
+            return _job_error("❌ จุดมุมไม่ถูกต้อง กรุณาลองใหม่")
+
+        scope = _grade_scope(username, num_questions, key_str, engine, points)
+        idem = _idempotency_key(scope)
+        cached = _cached_grade(username, idem, count_miss=False)
+        if cached is not None:
+            return _job_accepted(jobs.submit_done(username, cached))
+
+        manual_token, created_at = _pop_manual_upload()
+        entry = image_store.get(manual_token, username)
+        image = image_store.load(manual_token, username)
+        image_store.discard(manual_token)
+        if _manual_expired(created_at):
+            return _job_error("⏳ รูปหมดอายุแล้ว (ระบบลบทิ้งอัตโนมัติ) กรุณาอัปโหลดใหม่")
+        if image is None:
+            return _job_error("❌ ไม่พบรูปสำหรับ Manual (กรุณาอัปโหลดใหม่)")
+        content_key = grade_cache.content_key(scope, entry["data"])
+    else:
+        points = None
+        file = request.files.get("sheet")
+        if not file or file.filename == "":
+            return _job_error("❌ กรุณาเลือกรูปกระดาษคำตอบก่อน")
+        if not is_allowed_image_filename(file.filename):
+            return _job_error("❌ รองรับเฉพาะไฟล์รูป .jpg .jpeg .png .webp")
+        image = file.read()
+        if not image:
+            return _job_error("❌ ไม่สามารถอ่านไฟล์รูปได้ กรุณาลองถ่าย/เลือกใหม่")
+        # ✅ ไฟล์เสีย/ใหญ่เกิน ปฏิเสธตั้งแต่ header ไม่ต้องเข้าคิว
+        try:
+            utils.check_image_header(image)
+        except utils.ImageRejected as e:
+            return _job_error(str(e))
+
+        session["last_answer_key"] = utils.normalize_answer_key_str(key_str, num_questions)
+        session["last_subject"] = subject
+        session["last_num_questions"] = num_questions
+
+        scope = _grade_scope(username, num_questions, key_str, engine)
+        idem = _idempotency_key(scope)
+        content_key = grade_cache.content_key(scope, image)
+
+    # ✅ ส่งซ้ำ (รูปเดิม / idempotency key เดิม) -> job ที่เสร็จแล้วจาก cache หรือ job เดิมที่กำลังตรวจ
+    cached = _cached_grade(username, content_key, idem)
+    if cached is not None:
+        grade_cache.put(cached, content_key, idem)
+        return _job_accepted(jobs.submit_done(username, cached))
+    running = jobs.get(grade_cache.inflight(content_key) or "", username)
+    if running is not None and running["state"] not in jobs.FINAL_STATES:
+        return _job_accepted(running["id"])
+
+    # ✅ คิวเต็ม/คาดว่ารอเกิน budget -> ปฏิเสธทันที ไม่ต้องรอให้งาน error ทีหลัง
+    priority = _priority_for(username)
+    try:
+        admission.check(priority, jobs.JOB_ADMIT_BUDGET_SEC)
+    except admission.Rejected as e:
+        resp = jsonify({"ok": False, "message": jobs.BUSY_MESSAGE, "retry_after": e.retry_after})
+        resp.headers["Retry-After"] = str(e.retry_after)
+        return resp, 503
+
+    def on_success(result):
+        # ✅ ตัดเครดิตเมื่อตรวจสำเร็จเท่านั้น แล้วจึงเก็บผลไว้ให้การส่งซ้ำ + /regrade
+        # (ตัดไม่สำเร็จ -> job error และไม่มีผลใน cache ให้ส่งซ้ำได้ฟรี)
+        db.adjust_user_credits(username, -1)
+        grade_cache.put(result, content_key, idem)
+        _save_graded_sheet(username, subject, num_questions, result, key_str)
+
+    job_id = jobs.submit(
+        username,
+        lambda: _grade_job(username, image, points, num_questions, key_str, engine),
+        on_success=on_success,
+        priority=priority,
+    )
+    if job_id is None:
+        resp = jsonify({"ok": False, "message": jobs.BUSY_MESSAGE})
+        resp.headers["Retry-After"] = "5"
+        return resp, 503
+    grade_cache.track(content_key, job_id)
+
+    return _job_accepted(job_id)
+
+
+def _job_accepted(job_id):
+    return jsonify({
+        "ok": True,
+        "job_id": job_id,
+        "status_url": f"/jobs/{job_id}",
+        "events_url": f"/jobs/{job_id}/events",
+        "result_url": f"/jobs/{job_id}/result",
+    }), 202
+
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = jobs.get(job_id, session.get("username") or "")
+    if job is None:
+        return _job_error("ไม่พบงาน (หมดอายุหรือไม่ใช่ของบัญชีนี้)", 404)
+    return jsonify({"ok": True, **jobs.public_status(job)})
+
+
+@app.route("/jobs/<job_id>/events")
+def job_events(job_id):
+    """Server-Sent Events: ส่งสถานะทุกครั้งที่เปลี่ยน จนงานจบ"""
+    job = jobs.get(job_id, session.get("username") or "")
+    if job is None:
+        return _job_error("ไม่พบงาน (หมดอายุหรือไม่ใช่ของบัญชีนี้)", 404)
+
+    def stream(job):
+        # จำกัดอายุ stream (ถือ thread ของ gunicorn ไว้) ; EventSource จะต่อใหม่เองตาม retry
+        deadline = time.time() + jobs.JOB_SSE_MAX_SEC
+        yield "retry: 1000\n\n"
+        while job is not None:
+            yield f"data: {json.dumps(jobs.public_status(job), ensure_ascii=False)}\n\n"
+            if job["state"] in jobs.FINAL_STATES:
+                return
+            version = job["version"]
+            job = jobs.wait(job_id, version)
+            while job is not None and job["version"] == version:
+                if time.time() > deadline:
+                    return
+                yield ": keep-alive\n\n"
+                job = jobs.wait(job_id, version)
+
+    return Response(stream(job), mimetype="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.route("/jobs/<job_id>/result")
+def job_result(job_id):
+    username, user, resp = ensure_logged_in()
+    if resp:
+        return resp
+
+    job = jobs.get(job_id, username)
+    if job is None:
+        session["warp_fail_message"] = "❌ ไม่พบผลตรวจ (หมดอายุแล้ว) กรุณาตรวจใหม่"
+        return redirect("/")
+    if job["state"] == "error":
+        session["warp_fail_message"] = job["error"]
+        return redirect("/")
+    if job["state"] != "done":
+        return jsonify({"ok": False, **jobs.public_status(job)}), 202
+
+    return render_template("result.html", **job["result"], username=username, credits=user["credits"])
+
+
+# -------------------------
+# Manual preview (รูปจาก image_store ย่อตามขนาดที่หน้า select ขอ)
+# -------------------------
+@app.route("/manual/<token>/preview")
+def manual_preview(token):
+    username = session.get("username")
+    if not username:
+        abort(401)
+    entry = image_store.get(token, username)
+    if entry is None:
+        abort(404)
+
+    data = image_store.preview(entry, request.args.get("w", type=int) or 1280)
+    return Response(data, mimetype="image/jpeg", headers={
+        "Cache-Control": f"private, max-age={image_store.MANUAL_FILE_TTL_SEC}",
+    })
+
+
+# -------------------------
+# Debug overlay (render เมื่อถูกขอ จาก result cache)
+# -------------------------
+def _overlay_fields(owner, debug_img):
+    """เก็บ overlay ลง result cache -> ตัวแปรของ result.html (overlay_url + marks ถ้า browser วาดเองได้)"""
+    result_id = results.put(owner, debug_img)
+    marks = debug_img.marks() if hasattr(debug_img, "marks") else None
+    return {"overlay_url": f"/results/{result_id}/overlay", "marks": marks}
+
+
+@app.route("/results/<result_id>/overlay")
+def result_overlay(result_id):
+    """
+    รูป debug ของผลตรวจ: ?w=ความกว้าง (px) &fmt=webp|jpeg (ไม่ระบุ = webp ถ้า browser รับได้)
+    &plain=1 = sheet เปล่า (result.html วาดรอยบน canvas จาก marks เอง)
+    render + encode ครั้งแรกที่ขอ ; ETag เดิม -> 304
+    """
+    username = session.get("username")
+    if not username:
+        abort(401)
+    entry = results.get(result_id, username)
+    if entry is None:
+        abort(404)
+
+    fmt = (request.args.get("fmt") or "").lower()
+    if fmt not in results.OVERLAY_FORMATS:
+        fmt = "webp" if "image/webp" in (request.headers.get("Accept") or "") else "jpeg"
+    width = results.clamp_width(request.args.get("w"))
+    plain = request.args.get("plain") == "1"
+
+    etag = results.etag(result_id, fmt, width, plain)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"private, max-age={results.RESULT_TTL_SEC}",
+        "Vary": "Accept",
+    }
+    if etag in (request.headers.get("If-None-Match") or ""):
+        return Response(status=304, headers=headers)
+
+    data, mimetype = results.overlay_bytes(entry, fmt, width, plain)
+    return Response(data, mimetype=mimetype, headers=headers)
+
+
 @app.route("/slips/<path:filename>")
 def slip_file(filename):
     return send_from_directory("slips", filename)
@@ -0,0 +1,152 @@
+# batcher.py
+"""
+Micro-batching หน้า model.predict
+
+หลาย thread เรียก predict() พร้อมกัน -> รวบคำขอที่มาถึงภายใน window_ms (สูงสุด max_batch รูป)
+-> เรียก model.predict ครั้งเดียวทั้งชุด -> แยกผลคืนให้แต่ละคนตามลำดับ
+
+- คำขอที่ kwargs ต่างกัน (conf / imgsz / ...) รันแยกกลุ่ม
+- เก็บ histogram ขนาด batch + เวลารอคิว ไว้จูน window (ดูที่ /metrics)
+"""
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class _Request:
+    __slots__ = ("images", "kwargs", "key", "future", "t_submit")
+
+    def __init__(self, images, kwargs):
+        self.images = images
+        self.kwargs = kwargs
+        self.key = tuple(sorted(kwargs.items()))
+        hash(self.key)  # kwargs ที่ hash ไม่ได้ -> error ที่ผู้เรียก ไม่ใช่ใน thread ของ batcher
+        self.future = Future()
+        self.t_submit = time.perf_counter()
+
+
+class MicroBatcher:
+    """ห่อ model ให้ predict() หน้าตาเดิม แต่รันเป็น batch ใน thread เดียวของ batcher"""
+
+    def __init__(self, model, window_ms: float = 5.0, max_batch: int = 8, name: str = "model", workers: int = 1):
+        self.model = model
+        self.window = max(float(window_ms), 0.0) / 1000.0
+        self.max_batch = max(int(max_batch), 1)
+        self.name = name
+
+        self._q = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._hist = {}                       # ขนาด batch (รูป) -> จำนวนครั้ง
+        self._waits = deque(maxlen=4096)      # เวลารอคิว (ms) ของคำขอล่าสุด
+        self._batches = 0
+        self._requests = 0
+        self._images = 0
+        self._predict_ms = 0.0
+
+        # workers > 1 เมื่อ model เป็น replica pool (แต่ละ thread เก็บ batch ของตัวเองแล้วยืม replica)
+        self._threads = [
+            threading.Thread(target=self._loop, name=f"batcher-{name}-{i}", daemon=True)
+            for i in range(max(int(workers), 1))
+        ]
+        for t in self._threads:
+            t.start()
+
+    # -------------------------
+    # API เดียวกับ YOLO.predict
+    # -------------------------
+    def predict(self, source, verbose: bool = False, **kwargs):
+        images = list(source) if isinstance(source, (list, tuple)) else [source]
+        if not images:
+            return []
+        req = _Request(images, kwargs)
+        self._q.put(req)
+        return req.future.result()
+
+    # -------------------------
+    # Scheduler
+    # -------------------------
+    def _collect(self):
+        """รอคำขอแรก แล้วเก็บเพิ่มจนครบ window หรือครบ max_batch รูป"""
+        batch = [self._q.get()]
+        n = len(batch[0].images)
+        deadline = batch[0].t_submit + self.window
+
+        while n < self.max_batch:
+            left = deadline - time.perf_counter()
+            try:
+                # เลย window แล้ว (เช่นรอ batch ก่อนหน้า) -> เก็บเฉพาะที่ค้างในคิวอยู่แล้ว
+                req = self._q.get(timeout=left) if left > 0 else self._q.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(req)
+            n += len(req.images)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            groups = {}
+            for req in batch:
+                groups.setdefault(req.key, []).append(req)
+            for reqs in groups.values():
+                try:
+                    self._run(reqs)
+                except Exception as e:
+                    # error ตอนแยกผล ฯลฯ : thread ต้องไม่ตาย (ไม่งั้น predict() ถัดไปรอตลอดไป)
+                    for req in reqs:
+                        if not req.future.done():
+                            req.future.set_exception(e)
+
+    def _run(self, reqs):
+        t0 = time.perf_counter()
+        images = [im for req in reqs for im in req.images]
+        try:
+            results = self.model.predict(source=images, verbose=False, **reqs[0].kwargs)
+            if len(results) != len(images):
+                raise RuntimeError(f"{self.name}: predict คืน {len(results)} ผล จาก {len(images)} รูป")
+        except Exception as e:
+            for req in reqs:
+                req.future.set_exception(e)
+            return
+        dt_ms = (time.perf_counter() - t0) * 1000
+
+        with self._stats_lock:
+            self._batches += 1
+            self._requests += len(reqs)
+            self._images += len(images)
+            self._predict_ms += dt_ms
+            self._hist[len(images)] = self._hist.get(len(images), 0) + 1
+            self._waits.extend((t0 - req.t_submit) * 1000 for req in reqs)
+
+        start = 0
+        for req in reqs:
+            req.future.set_result(list(results[start:start + len(req.images)]))
+            start += len(req.images)
+
+    # -------------------------
+    # Stats
+    # -------------------------
+    def stats(self):
+        with self._stats_lock:
+            waits = np.asarray(self._waits, dtype=np.float64)
+            return {
+                "name": self.name,
+                "window_ms": self.window * 1000,
+                "max_batch": self.max_batch,
+                "batches": self._batches,
+                "requests": self._requests,
+                "images": self._images,
+                "mean_batch": (self._images / self._batches) if self._batches else 0.0,
+                "batch_hist": {str(k): v for k, v in sorted(self._hist.items())},
+                "predict_ms_mean": (self._predict_ms / self._batches) if self._batches else 0.0,
+                "queue_wait_ms": {
+                    "p50": float(np.percentile(waits, 50)) if len(waits) else 0.0,
+                    "p95": float(np.percentile(waits, 95)) if len(waits) else 0.0,
+                    "max": float(waits.max()) if len(waits) else 0.0,
+                },
+                "queued": self._q.qsize(),
+            }
@@ -0,0 +1,1089 @@
+# bench.py
+"""
+สคริปต์วัดประสิทธิภาพ (รันเองบนเครื่อง ไม่ได้ใช้ใน production)
+
+ตัวอย่าง:
+    python bench.py batch --images sheets/ --num-questions 60
+    python bench.py backend --images sheets/ --backends torch,onnx,onnx-int8
+    python bench.py assign --num-questions 80
+    python bench.py engines --images sheets/ --engines yolo,fill,patch
+    python bench.py cascade --images sheets/ --num-questions 60
+    python bench.py tiles --images sheets/ --num-questions 60
+    python bench.py startup --images sheets/
+    python bench.py remote --images sheets/ --workers 1,2,4
+    python bench.py microbatch --images sheets/ --threads 8 --windows 0,2,5,10
+    python bench.py pool --images sheets/ --replicas 1,2,4 --threads 8
+    python bench.py decode --images photos/ --max-side 2000
+    python bench.py geometry --images photos/ --num-questions 60
+    python bench.py corners --images photos/ --modes legacy,contour,markers,auto
+    python bench.py overlay --images photos/ --num-questions 60
+    python bench.py manual --images photos/
+    python bench.py upload --images photos/ --max-side 2000 --mbps 1,5
+    python bench.py regrade --sheets 1000,5000 --num-questions 60
+"""
+import argparse
+import glob
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+import utils
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+# =========================
+# Helpers
+# =========================
+def load_images(folder, limit=None, warp=True):
+    """โหลดรูปทั้งโฟลเดอร์ -> list ของ (path, img) ; warp=True จะ warp ให้ถ้ายังไม่ใช่ขนาด sheet"""
+    paths = sorted(
+        p for p in glob.glob(os.path.join(folder, "*"))
+        if os.path.splitext(p.lower())[1] in IMAGE_EXTS
+    )
+    if limit:
+        paths = paths[:limit]
+
+    out = []
+    for p in paths:
+        img = cv2.imread(p)
+        if img is None:
+            print(f"[BENCH] skip (อ่านไม่ได้): {p}")
+            continue
+        if warp and img.shape[:2] != (utils.TARGET_HEIGHT, utils.TARGET_WIDTH):
+            img = utils.auto_detect_and_warp(img)
+            if img is None:
+                print(f"[BENCH] skip (warp ไม่ได้): {p}")
+                continue
+        out.append((p, img))
+    return out
+
+
+def get_omr():
+    import omr
+    return omr
+
+
+def timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    res = fn(*args, **kwargs)
+    return res, time.perf_counter() - t0
+
+
+def peak_rss_mb():
+    # Linux: ru_maxrss เป็น KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    i = min(len(values) - 1, max(0, int(round(q / 100.0 * (len(values) - 1)))))
+    return values[i]
+
+
+def run_worker(argv, env=None):
+    """รัน bench.py <argv> ใน process แยก แล้วอ่าน JSON บรรทัดสุดท้าย"""
+    full_env = dict(os.environ, **(env or {}))
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__)] + list(argv),
+        env=full_env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+# =========================
+# batch: single-sheet vs batched predict
+# =========================
+def bench_batch(args):
+    sheets = [img for _, img in load_images(args.images, args.limit)]
+    if not sheets:
+        print("[BENCH] ไม่พบรูป")
+        return
+
+    omr = get_omr()
+    nq = args.num_questions
+    omr.process_auto(sheets[0], args.key, nq)  # warmup
+
+    single_res, t_single = timed(lambda: [omr.process_auto(img, args.key, nq) for img in sheets])
+    batch_res, t_batch = timed(omr.process_batch, sheets, args.key, nq)
+
+    same = sum(1 for a, b in zip(single_res, batch_res) if a[0] == b[0])
+    n = len(sheets)
+    print(f"sheets          : {n}")
+    print(f"single (loop)   : {t_single * 1000:8.0f} ms  {n / t_single:6.2f} sheets/s")
+    print(f"batch           : {t_batch * 1000:8.0f} ms  {n / t_batch:6.2f} sheets/s")
+    print(f"speedup         : {t_single / t_batch:.2f}x")
+    print(f"same answers    : {same}/{n}")
+
+
+# =========================
+# backend: torch vs onnx (latency + RSS, แยก process)
+# =========================
+def bench_backend_worker(args):
+    t0 = time.perf_counter()
+    omr = get_omr()
+    omr.load_model()  # โหลด model ตาม MODEL_BACKEND
+    load_s = time.perf_counter() - t0
+
+    sheets = [img for _, img in load_images(args.images, args.limit)]
+    layout = omr.get_layout(args.num_questions)
+    omr.read_answers_from_image_bgr(sheets[0], layout)  # warmup
+
+    lat = []
+    answers = []
+    for _ in range(args.repeat):
+        for img in sheets:
+            (ans, _), dt = timed(omr.read_answers_from_image_bgr, img, layout)
+            lat.append(dt * 1000)
+            answers.append("".join((ans[q] or "-")[0] for q in sorted(ans)))
+
+    print(json.dumps({
+        "backend": os.getenv("MODEL_BACKEND", "torch"),
+        "load_s": load_s,
+        "p50_ms": percentile(lat, 50),
+        "p95_ms": percentile(lat, 95),
+        "rss_mb": peak_rss_mb(),
+        "answers": answers[:len(sheets)],
+    }))
+
+
+def bench_backend(args):
+    argv = ["backend-worker", "--images", args.images, "--num-questions", str(args.num_questions),
+            "--repeat", str(args.repeat)]
+    if args.limit:
+        argv += ["--limit", str(args.limit)]
+
+    rows = [run_worker(argv, env={"MODEL_BACKEND": b}) for b in args.backends.split(",")]
+
+    print(f"{'backend':<8} {'load s':>7} {'p50 ms':>8} {'p95 ms':>8} {'peak RSS MB':>12}")
+    for r in rows:
+        print(f"{r['backend']:<8} {r['load_s']:7.2f} {r['p50_ms']:8.1f} {r['p95_ms']:8.1f} {r['rss_mb']:12.0f}")
+
+    base = rows[0]["answers"]
+    for r in rows[1:]:
+        same = sum(1 for a, b in zip(base, r["answers"]) for x, y in zip(a, b) if x == y)
+        total = sum(len(a) for a in base)
+        print(f"agreement {rows[0]['backend']} vs {r['backend']}: {same}/{total} questions")
+
+
+# =========================
+# assign: loop find_nearest_slot + dict เดิม vs SlotIndex แบบ vectorized
+# =========================
+def _legacy_answers(boxes, confs, all_slots, slot_mapping, num_questions, max_dist):
+    """ทางเดิม: loop ทุก slot ต่อทุกกล่อง + dict-of-dict"""
+    answers = {q: None for q in range(1, num_questions + 1)}
+    marks_by_q = {q: {} for q in range(1, num_questions + 1)}
+    for (x1, y1, x2, y2), conf in zip(boxes, confs):
+        xc, yc = (x1 + x2) / 2.0, (y1 + y2) / 2.0
+        best_idx, best_d2 = None, max_dist * max_dist
+        for idx, (sx, sy) in all_slots.items():
+            d2 = (xc - sx) ** 2 + (yc - sy) ** 2
+            if d2 < best_d2:
+                best_d2, best_idx = d2, idx
+        qopt = slot_mapping.get(best_idx) if best_idx is not None else None
+        if qopt is None:
+            continue
+        qnum, opt = qopt
+        if float(conf) > marks_by_q[qnum].get(opt, 0.0):
+            marks_by_q[qnum][opt] = float(conf)
+    for q, oc in marks_by_q.items():
+        if oc:
+            answers[q] = next(iter(oc)) if len(oc) == 1 else "MULTI"
+    return answers
+
+
+def bench_assign(args):
+    import layouts
+    from slot_index import SlotIndex, answers_from_matrix, build_conf_matrix
+
+    layout = layouts.get_layout(args.num_questions)
+    all_slots, slot_mapping = layout.all_slots, layout.slot_mapping
+    slot_xy, slot_q, slot_opt = layout.slot_xy, layout.slot_q, layout.slot_opt
+    max_dist = layouts.MAX_SLOT_DIST
+    nq, no = layout.num_questions, layout.num_options
+
+    index, t_build = timed(SlotIndex, slot_xy, max_dist)
+    print(f"index build: {t_build * 1000:.2f} ms | cells={index.nx}x{index.ny} candidates/cell={index.candidates.shape[1]}")
+
+    rng = np.random.default_rng(0)
+    counts = [nq, len(slot_xy), 4 * len(slot_xy)]  # 1 รอย/ข้อ, ทุกช่อง, กล่องซ้อน/noise
+    print(f"{'marks':>6} {'legacy ms':>10} {'vector ms':>10} {'speedup':>8} same")
+    for n in counts:
+        centers = slot_xy[rng.integers(0, len(slot_xy), n)] + rng.normal(0, 8, (n, 2)).astype(np.float32)
+        boxes = np.concatenate([centers - 15, centers + 15], axis=1)
+        confs = rng.uniform(0.1, 1.0, n).astype(np.float32)
+
+        def vector():
+            mat = build_conf_matrix(index.assign((boxes[:, :2] + boxes[:, 2:]) / 2), confs,
+                                    slot_q, slot_opt, nq, no)
+            return answers_from_matrix(mat, layout.options)
+
+        def best_of(fn):
+            res, best = None, float("inf")
+            for _ in range(args.repeat):
+                res, dt = timed(fn)
+                best = min(best, dt)
+            return res, best
+
+        a, t_old = best_of(lambda: _legacy_answers(boxes, confs, all_slots, slot_mapping, nq, max_dist))
+        b, t_new = best_of(vector)
+        print(f"{n:6d} {t_old * 1000:10.2f} {t_new * 1000:10.3f} {t_old / t_new:7.1f}x {a == b}")
+
+
+# =========================
+# engines: yolo vs fill (latency + agreement)
+# =========================
+def answers_str(answers):
+    return "".join("*" if a == "MULTI" else (a or "-") for _, a in sorted(answers.items()))
+
+
+def bench_engines(args):
+    sheets = [img for _, img in load_images(args.images, args.limit)]
+    if not sheets:
+        print("[BENCH] ไม่พบรูป")
+        return
+
+    omr = get_omr()
+    layout = omr.get_layout(args.num_questions)
+    names = args.engines.split(",")
+
+    rows = {}
+    for name in names:
+        fn = omr.get_engine(name)
+        fn(sheets[0], layout, draw_template_points=False)  # warmup
+        lat, out = [], []
+        for _ in range(args.repeat):
+            out = []
+            for img in sheets:
+                (ans, _), dt = timed(fn, img, layout, draw_template_points=False)
+                lat.append(dt * 1000)
+                out.append(answers_str(ans))
+        rows[name] = (lat, out)
+
+    ref = names[0]
+    print(f"{'engine':<8} {'p50 ms':>8} {'p95 ms':>8} {'agree vs ' + ref:>16}")
+    for name in names:
+        lat, out = rows[name]
+        same = sum(x == y for a, b in zip(rows[ref][1], out) for x, y in zip(a, b))
+        total = sum(len(a) for a in rows[ref][1])
+        print(f"{name:<8} {percentile(lat, 50):8.1f} {percentile(lat, 95):8.1f} {same:>8}/{total:<7}")
+
+
+# =========================
+# cascade: low-res + crop vs high-res ทั้งแผ่น
+# =========================
+def bench_cascade(args):
+    sheets = [img for _, img in load_images(args.images, args.limit)]
+    if not sheets:
+        print("[BENCH] ไม่พบรูป")
+        return
+
+    omr = get_omr()
+    omr.CASCADE_BASELINE_EVERY = 0  # วัด baseline เองด้านล่าง
+    layout = omr.get_layout(args.num_questions)
+
+    def high_res(img):
+        boxes, confs = omr._predict_boxes(img, omr.CONF_THRES, omr.CASCADE_HIGH_IMGSZ)[0]
+        return omr.answers_from_detections(img, boxes, confs, layout, draw_template_points=False)[0]
+
+    def cascade(img):
+        return omr.read_answers_cascade(img, layout, draw_template_points=False)[0]
+
+    rows = {}
+    for name, fn in (("high-res", high_res), ("cascade", cascade)):
+        fn(sheets[0])  # warmup
+        lat, out = [], []
+        for img in sheets:
+            ans, dt = timed(fn, img)
+            lat.append(dt * 1000)
+            out.append(answers_str(ans))
+        rows[name] = (lat, out)
+
+    ref = rows["high-res"][1]
+    print(f"{'mode':<9} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'agree vs high-res':>18}")
+    for name, (lat, out) in rows.items():
+        same = sum(x == y for a, b in zip(ref, out) for x, y in zip(a, b))
+        total = sum(len(a) for a in ref)
+        print(f"{name:<9} {np.mean(lat):8.1f} {percentile(lat, 50):8.1f} {percentile(lat, 95):8.1f} {same:>9}/{total:<8}")
+
+    st = omr.cascade_stats()
+    n = max(st["sheets"], 1)
+    print(f"[BENCH] imgsz low={omr.CASCADE_LOW_IMGSZ} crop={omr.CASCADE_CROP_IMGSZ} high={omr.CASCADE_HIGH_IMGSZ}")
+    print(f"[BENCH] stage2 fired on {st['stage2_sheets']}/{st['sheets']} sheets "
+          f"({st['stage2_questions'] / n:.1f} questions/sheet, full fallback={st['stage2_full']})")
+    print(f"[BENCH] saved {np.mean(rows['high-res'][0]) - np.mean(rows['cascade'][0]):.1f} ms/sheet vs high-res")
+
+
+# =========================
+# tiles: pixel ที่เข้า model + engine tiled vs yolo
+# =========================
+def bench_tiles(args):
+    import layouts
+    import roi_tiles
+
+    layout = layouts.get_layout(args.num_questions)
+    shape = (layouts.SHEET_HEIGHT, layouts.SHEET_WIDTH)
+    st = roi_tiles.pixel_stats(roi_tiles.plan_tiles(layout, shape), shape)
+    print(f"[BENCH] sheet={st['sheet_px']:,} px | answer ROI={st['roi_px']:,} px "
+          f"({st['roi_px'] / st['sheet_px']:.0%} of sheet)")
+    print(f"[BENCH] model input: tiled={st['tile_px']:,} px in {st['tiles']} tiles "
+          f"(TILE_SCALE={roi_tiles.TILE_SCALE}) vs whole sheet@{roi_tiles.TILE_SIZE}={st['full_model_px']:,} px")
+    print(f"[BENCH] bubble scale: tiled={roi_tiles.TILE_SCALE:.2f} vs whole sheet="
+          f"{roi_tiles.TILE_SIZE / float(max(shape)):.2f}")
+
+    args.engines = "yolo,tiled"
+    bench_engines(args)
+
+
+# =========================
+# startup: import app -> ready -> แผ่นแรก (แยก process)
+# =========================
+def bench_startup_worker(args):
+    t0 = time.perf_counter()
+    import app  # noqa: F401
+    import_s = time.perf_counter() - t0
+
+    omr = get_omr()
+    if omr._warmup_thread is not None:
+        omr._warmup_thread.join()
+    ready_s = time.perf_counter() - t0
+
+    img = load_images(args.images, 1)[0][1]
+    _, first_s = timed(omr.process_auto, img, "", args.num_questions, "yolo")
+    _, second_s = timed(omr.process_auto, img, "", args.num_questions, "yolo")
+
+    print(json.dumps({
+        "mode": "warmup" if os.getenv("WARMUP_ON_START", "1") == "1" else "lazy",
+        "import_s": import_s,
+        "ready_s": ready_s,
+        "first_sheet_ms": first_s * 1000,
+        "second_sheet_ms": second_s * 1000,
+        "to_first_sheet_s": ready_s + first_s,  # ไม่นับเวลาโหลดรูปของ bench
+    }))
+
+
+def bench_startup(args):
+    argv = ["startup-worker", "--images", args.images, "--num-questions", str(args.num_questions)]
+    rows = [run_worker(argv, env={"WARMUP_ON_START": w}) for w in ("0", "1")]
+
+    print(f"{'mode':<7} {'import s':>9} {'ready s':>8} {'1st sheet ms':>13} {'2nd sheet ms':>13} {'start->1st s':>13}")
+    for r in rows:
+        print(f"{r['mode']:<7} {r['import_s']:9.2f} {r['ready_s']:8.2f} {r['first_sheet_ms']:13.0f} "
+              f"{r['second_sheet_ms']:13.0f} {r['to_first_sheet_s']:13.2f}")
+
+
+# =========================
+# remote: model ต่อ worker vs infer_server ตัวเดียว (throughput + RSS รวม)
+# =========================
+def proc_peak_rss_mb(pid):
+    """VmHWM ของ process อื่น (Linux)"""
+    with open(f"/proc/{pid}/status", "r") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024.0
+    return 0.0
+
+
+def bench_remote_worker(args):
+    omr = get_omr()
+    omr.load_model()
+    sheets = [img for _, img in load_images(args.images, args.limit)]
+    layout = omr.get_layout(args.num_questions)
+    omr.read_answers_from_image_bgr(sheets[0], layout, draw_template_points=False)
+
+    # barrier: รอทุก worker โหลดเสร็จก่อนเริ่มจับเวลาพร้อมกัน
+    open(os.path.join(args.sync_dir, f"ready-{os.getpid()}"), "w").close()
+    while not os.path.exists(os.path.join(args.sync_dir, "go")):
+        time.sleep(0.01)
+
+    start = time.time()
+    n = 0
+    for _ in range(args.repeat):
+        for img in sheets:
+            omr.read_answers_from_image_bgr(img, layout, draw_template_points=False)
+            n += 1
+    print(json.dumps({"start": start, "end": time.time(), "sheets": n, "rss_mb": peak_rss_mb()}))
+
+
+def _run_workers(n, argv, env):
+    with tempfile.TemporaryDirectory() as sync_dir:
+        full_env = dict(os.environ, **env)
+        procs = [
+            subprocess.Popen([sys.executable, os.path.abspath(__file__), "remote-worker", "--sync-dir", sync_dir] + argv,
+                             env=full_env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+            for _ in range(n)
+        ]
+        while len([f for f in os.listdir(sync_dir) if f.startswith("ready-")]) < n:
+            if any(p.poll() not in (None, 0) for p in procs):
+                raise RuntimeError("worker ล้มก่อนเริ่ม")
+            time.sleep(0.05)
+        open(os.path.join(sync_dir, "go"), "w").close()
+        rows = [json.loads(p.communicate()[0].strip().splitlines()[-1]) for p in procs]
+
+    sheets = sum(r["sheets"] for r in rows)
+    wall = max(r["end"] for r in rows) - min(r["start"] for r in rows)
+    return sheets / wall, sum(r["rss_mb"] for r in rows)
+
+
+def bench_remote(args):
+    import infer_server
+
+    argv = ["--images", args.images, "--num-questions", str(args.num_questions), "--repeat", str(args.repeat)]
+    if args.limit:
+        argv += ["--limit", str(args.limit)]
+    counts = [int(x) for x in args.workers.split(",")]
+    local_backend = os.getenv("MODEL_BACKEND", "torch")
+    sock = os.path.join(tempfile.gettempdir(), f"scangrade-bench-{os.getpid()}.sock")
+
+    print(f"{'mode':<16} {'workers':>7} {'sheets/s':>9} {'total RSS MB':>13}")
+    for n in counts:
+        tput, rss = _run_workers(n, argv, {"MODEL_BACKEND": local_backend})
+        print(f"{'per-worker ' + local_backend:<16} {n:7d} {tput:9.2f} {rss:13.0f}")
+
+    daemon = subprocess.Popen([sys.executable, infer_server.__file__, "--socket", sock, "--backend", local_backend],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        infer_server.wait_ready(sock)
+        for n in counts:
+            tput, rss = _run_workers(n, argv, {"MODEL_BACKEND": "remote", "INFER_SOCKET": sock})
+            rss_daemon = proc_peak_rss_mb(daemon.pid)
+            print(f"{'remote':<16} {n:7d} {tput:9.2f} {rss + rss_daemon:13.0f}  (daemon {rss_daemon:.0f} MB)")
+    finally:
+        daemon.terminate()
+        daemon.wait()
+    print("[BENCH] RSS ของ remote นับหน้า shared memory ของรูปซ้ำทั้งฝั่ง worker และ daemon")
+
+
+# =========================
+# microbatch: จูน window ของ MicroBatcher (throughput vs latency)
+# =========================
+def bench_microbatch(args):
+    from batcher import MicroBatcher
+
+    sheets = [img for _, img in load_images(args.images, args.limit)]
+    if not sheets:
+        print("[BENCH] ไม่พบรูป")
+        return
+
+    omr = get_omr()
+    raw = omr.load_model()
+    raw = raw.model if isinstance(raw, MicroBatcher) else raw
+    raw.predict(source=sheets[0], conf=omr.CONF_THRES, verbose=False)  # warmup
+
+    print(f"{'window ms':>9} {'sheets/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'mean batch':>11} {'wait p95':>9}  batch hist")
+    for w in [float(x) for x in args.windows.split(",")]:
+        model = raw if w <= 0 else MicroBatcher(raw, w, args.max_batch, name=f"bench-{w:g}")
+        lat = []
+        lat_lock = threading.Lock()
+
+        def client(i):
+            for k in range(args.repeat):
+                img = sheets[(i + k) % len(sheets)]
+                _, dt = timed(model.predict, source=img, conf=omr.CONF_THRES, verbose=False)
+                with lat_lock:
+                    lat.append(dt * 1000)
+
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(args.threads)]
+        t0 = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - t0
+
+        st = model.stats() if isinstance(model, MicroBatcher) else None
+        print(f"{w:9g} {len(lat) / wall:9.2f} {percentile(lat, 50):8.1f} {percentile(lat, 95):8.1f} "
+              f"{(st['mean_batch'] if st else 1.0):11.2f} {(st['queue_wait_ms']['p95'] if st else 0.0):9.1f}  "
+              f"{st['batch_hist'] if st else '-'}")
+
+
+# =========================
+# pool: replica pool ภายใต้ concurrency (ความถูกต้อง + throughput)
+# =========================
+def bench_pool(args):
+    import model_loader
+
+    sheets = [img for _, img in load_images(args.images, args.limit)]
+    if not sheets:
+        print("[BENCH] ไม่พบรูป")
+        return
+
+    omr = get_omr()
+    layout = omr.get_layout(args.num_questions)
+    backend = model_loader.MODEL_BACKEND
+
+    def answers_with(model, img):
+        det = model.predict(source=img, conf=omr.CONF_THRES, verbose=False)[0]
+        ans, _ = omr.answers_from_detections(
+            img, det.boxes.xyxy.cpu().numpy(), det.boxes.conf.cpu().numpy(), layout, draw_template_points=False
+        )
+        return answers_str(ans)
+
+    # คำตอบอ้างอิง: replica เดียว ทีละแผ่น
+    ref_model = model_loader.load_pool(omr.MODEL_PATH, backend, replicas=1)
+    ref = [answers_with(ref_model, img) for img in sheets]
+
+    print(f"{'replicas':>8} {'threads/rep':>11} {'client thr':>10} {'sheets/s':>9} {'p95 ms':>8} {'wait p95':>9} {'mismatch':>9}")
+    for n in [int(x) for x in args.replicas.split(",")]:
+        pool = model_loader.load_pool(omr.MODEL_PATH, backend, replicas=n)
+        answers_with(pool, sheets[0])  # warmup
+
+        lat, bad = [], [0]
+        lock = threading.Lock()
+
+        def client(i):
+            for k in range(args.repeat):
+                j = (i + k) % len(sheets)
+                got, dt = timed(answers_with, pool, sheets[j])
+                with lock:
+                    lat.append(dt * 1000)
+                    bad[0] += got != ref[j]
+
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(args.threads)]
+        t0 = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall = time.perf_counter() - t0
+
+        st = pool.stats()
+        print(f"{st['replicas']:8d} {st['threads_per_replica']:11d} {args.threads:10d} {len(lat) / wall:9.2f} "
+              f"{percentile(lat, 95):8.1f} {st['wait_ms_p95']:9.1f} {bad[0]:9d}")
+
+
+# =========================
+# decode: decode เต็ม + resize vs decode แบบย่อ (แยก process เพื่อวัด peak RSS)
+# =========================
+def bench_decode_worker(args):
+    paths = sorted(
+        p for p in glob.glob(os.path.join(args.images, "*"))
+        if os.path.splitext(p.lower())[1] in IMAGE_EXTS
+    )[:args.limit]
+    blobs = []
+    for p in paths:
+        with open(p, "rb") as f:
+            blobs.append(f.read())
+    base_rss = peak_rss_mb()
+
+    lat, sizes, rejected, warped = [], [], 0, 0
+    for k in range(args.repeat):
+        for data in blobs:
+            try:
+                img, dt = timed(utils.decode_image_bytes, data, args.max_side)
+            except utils.ImageRejected:
+                rejected += k == 0
+                continue
+            lat.append(dt * 1000)
+            if k == 0:
+                sizes.append(max(img.shape[:2]))
+                warped += utils.auto_detect_and_warp(img) is not None
+
+    print(json.dumps({
+        "mode": "reduced" if utils.REDUCED_DECODE else "full",
+        "p50_ms": percentile(lat, 50),
+        "p95_ms": percentile(lat, 95),
+        "rss_mb": peak_rss_mb() - base_rss,
+        "side": sizes,
+        "warped": warped,
+        "rejected": rejected,
+        "n": len(blobs),
+    }))
+
+
+def bench_decode(args):
+    argv = ["decode-worker", "--images", args.images, "--max-side", str(args.max_side),
+            "--repeat", str(args.repeat)]
+    if args.limit:
+        argv += ["--limit", str(args.limit)]
+
+    for p in sorted(glob.glob(os.path.join(args.images, "*")))[:args.limit]:
+        with open(p, "rb") as f:
+            info = utils.probe_image_header(f.read(1 << 18))
+        if info:
+            print(f"{os.path.basename(p):<32} {info[0]:<5} {info[1]}x{info[2]}")
+
+    rows = [run_worker(argv, env={"REDUCED_DECODE": v}) for v in ("0", "1")]
+    print(f"{'mode':<8} {'p50 ms':>8} {'p95 ms':>8} {'peak RSS +MB':>13} {'max side':>9} {'warped':>7} {'rejected':>9}")
+    for r in rows:
+        side = max(r["side"]) if r["side"] else 0
+        print(f"{r['mode']:<8} {r['p50_ms']:8.1f} {r['p95_ms']:8.1f} {r['rss_mb']:13.0f} {side:9d} "
+              f"{r['warped']:>4d}/{r['n']:<2d} {r['rejected']:9d}")
+
+
+# =========================
+# geometry: warp เต็ม + crop + resize + letterbox vs warp ตรงไปขนาด inference (เวลาแต่ละขั้น)
+# =========================
+def _stage(t, name, fn, *args):
+    res, dt = timed(fn, *args)
+    t.setdefault(name, []).append(dt * 1000)
+    return res
+
+
+def _legacy_sheet(img, t):
+    """ทางเดิม: copy รูปเต็ม -> หามุม -> warp 1600x2300 -> crop ขอบล่าง -> resize กลับ 1600x2300"""
+    orig = _stage(t, "copy", np.copy, img)
+    geom = _stage(t, "detect", utils.detect_sheet, orig, "legacy")
+    if geom is None:
+        return None
+    warped = _stage(t, "warp", utils.warp_from_four_points, orig, geom.corners)
+    hf, wf = warped.shape[:2]
+    crop = warped[utils.AUTO_CROP_TOP:hf - utils.AUTO_CROP_BOTTOM, utils.AUTO_CROP_LEFT:wf - utils.AUTO_CROP_RIGHT]
+    return _stage(t, "crop+resize", cv2.resize, crop, (utils.TARGET_WIDTH, utils.TARGET_HEIGHT))
+
+
+def bench_geometry(args):
+    import yolo_ops
+
+    photos = [img for _, img in load_images(args.images, args.limit, warp=False)]
+    if not photos:
+        print("[BENCH] ไม่พบรูป")
+        return
+
+    omr = get_omr()
+    layout = omr.get_layout(args.num_questions)
+    size = omr.direct_size()
+    imgsz = omr.DIRECT_IMGSZ
+
+    def read(boxes, confs):
+        return answers_str(omr.answers_from_matrix(omr.conf_matrix_from_detections(boxes, confs, layout)[0], layout.options))
+
+    omr._predict_boxes(omr.synthetic_sheet(layout), omr.CONF_THRES, imgsz)  # warmup
+
+    old_t, new_t, same, total, skipped = {}, {}, 0, 0, 0
+    for img in photos:
+        sheet = _legacy_sheet(img, old_t)
+        geom = _stage(new_t, "detect", utils.detect_sheet, img)
+        if sheet is None or geom is None:
+            skipped += 1
+            continue
+        _stage(old_t, "letterbox", yolo_ops.letterbox, sheet, imgsz)
+        boxes, confs = _stage(old_t, "predict", omr._predict_boxes, sheet, omr.CONF_THRES, imgsz)[0]
+        old_ans = _stage(old_t, "assign", read, boxes, confs)
+        _stage(old_t, "debug", omr.answers_from_detections, sheet, boxes, confs, layout)
+
+        small = _stage(new_t, "warp", geom.warp, size)
+        _stage(new_t, "letterbox", yolo_ops.letterbox, small, imgsz)
+        boxes, confs = _stage(new_t, "predict", omr._predict_boxes, small, omr.CONF_THRES, imgsz)[0]
+        boxes = boxes * np.array([utils.TARGET_WIDTH / size[0], utils.TARGET_HEIGHT / size[1]] * 2, np.float32)
+        new_ans = _stage(new_t, "assign", read, boxes, confs)
+        full = _stage(new_t, "debug warp", geom.warp)
+        _stage(new_t, "debug", omr.answers_from_detections, full, boxes, confs, layout)
+
+        same += sum(x == y for x, y in zip(old_ans, new_ans))
+        total += len(old_ans)
+
+    print(f"[BENCH] sheets={len(photos) - skipped} (skip {skipped}) | direct warp {size[0]}x{size[1]} @ imgsz {imgsz}")
+    print(f"{'stage':<13} {'before ms':>10} {'after ms':>9}")
+    for name in dict.fromkeys(list(old_t) + list(new_t)):
+        before = f"{np.mean(old_t[name]):10.1f}" if name in old_t else f"{'-':>10}"
+        after = f"{np.mean(new_t[name]):9.1f}" if name in new_t else f"{'-':>9}"
+        print(f"{name:<13} {before} {after}")
+    # letterbox วัดแยกให้เห็นเฉยๆ (predict ทำเองอยู่แล้ว) ไม่นับในผลรวม
+    for label, skip in (("total", ("letterbox",)), ("total no dbg", ("letterbox", "debug", "debug warp"))):
+        before = sum(np.mean(v) for k, v in old_t.items() if k not in skip)
+        after = sum(np.mean(v) for k, v in new_t.items() if k not in skip)
+        print(f"{label:<13} {before:10.1f} {after:9.1f}")
+    print(f"agreement     : {same}/{total} questions")
+
+
+# =========================
+# corners: หามุมแต่ละ mode (fiducial / strategy cascade) -> อัตราสำเร็จ + latency + strategy ที่ชนะ
+# =========================
+def bench_corners(args):
+    photos = load_images(args.images, args.limit, warp=False)
+    if not photos:
+        print("[BENCH] ไม่พบรูป")
+        return
+
+    layout = get_omr().get_layout(args.num_questions) if args.num_questions else None
+    print(f"[BENCH] photos={len(photos)} | detect side={utils.AUTO_DETECT_SIDE} | budget={args.budget_ms:.0f} ms "
+          f"| score={'template ' + layout.tag if layout else 'shape'}")
+    print(f"{'mode':<8} {'found':>9} {'p50 ms':>8} {'p95 ms':>8}  by method")
+    for mode in args.modes.split(","):
+        lat, methods, missed = [], {}, []
+        for _ in range(args.repeat):
+            for path, img in photos:
+                geom, dt = timed(utils.detect_sheet, img, mode, layout, args.budget_ms)
+                lat.append(dt * 1000)
+                if geom is None:
+                    missed.append(path)
+                else:
+                    methods[geom.method] = methods.get(geom.method, 0) + 1
+        n = len(photos)
+        found = n - len(missed) // args.repeat
+        by = ", ".join(f"{k}={v // args.repeat}" for k, v in sorted(methods.items()))
+        print(f"{mode:<8} {found:>4}/{n:<4} {percentile(lat, 50):8.1f} {percentile(lat, 95):8.1f}  {by}")
+        if args.verbose:
+            for p in sorted(set(missed)):
+                print(f"    miss: {p}")
+
+
+# =========================
+# overlay: debug JPEG เต็มขนาด base64 ในหน้า result vs overlay lazy จาก result cache vs canvas + marks
+# =========================
+def bench_overlay(args):
+    import base64
+
+    import results
+
+    photos = [img for _, img in load_images(args.images, args.limit, warp=False)]
+    omr = get_omr()
+    layout = omr.get_layout(args.num_questions)
+    geoms = [g for g in (utils.detect_sheet(img, layout=layout) for img in photos) if g is not None]
+    if not geoms:
+        print("[BENCH] ไม่พบรูปที่หามุมได้")
+        return
+    omr.process_sheet(geoms[0], "", args.num_questions, "yolo", debug=False)  # warmup
+
+    def inline(geom):
+        *_, debug_img = omr.process_sheet(geom, "", args.num_questions, "yolo", debug=True)
+        _, buf = cv2.imencode(".jpg", debug_img)
+        return len(base64.b64encode(buf)), 0
+
+    def lazy(geom, fmt=None, plain=False):
+        *_, overlay = omr.process_sheet(geom, "", args.num_questions, "yolo", debug="lazy")
+        rid = results.put("bench", overlay)
+        # plain: browser วาดเองจาก marks -> html มี JSON marks แทน
+        html = len(json.dumps(overlay.marks(), separators=(",", ":"))) if plain else 0
+        if fmt is None:  # ผู้ใช้ไม่ได้เปิดดูรูป
+            return html, 0
+        data, _ = results.overlay_bytes(results.get(rid), fmt, args.width, plain)
+        return html, len(data)
+
+    modes = [("inline jpeg", inline), ("lazy (no view)", lazy)]
+    modes += [(f"lazy {f}@{args.width}", lambda g, f=f: lazy(g, f)) for f in ("jpeg", "webp")]
+    modes += [(f"canvas {f}@{args.width}", lambda g, f=f: lazy(g, f, plain=True)) for f in ("jpeg", "webp")]
+
+    print(f"[BENCH] sheets={len(geoms)} | CPU = process_time ต่อแผ่น (รวม inference) | "
+          f"canvas = sheet เปล่า + marks JSON (เวลาวาดฝั่ง browser ดู window.overlayDrawMs / overlayReadyMs)")
+    print(f"{'mode':<16} {'CPU ms':>8} {'wall ms':>8} {'html KB':>8} {'image KB':>9}")
+    for name, fn in modes:
+        cpu, wall, html, img = [], [], [], []
+        for g in geoms:
+            c0, t0 = time.process_time(), time.perf_counter()
+            h, i = fn(g)
+            cpu.append((time.process_time() - c0) * 1000)
+            wall.append((time.perf_counter() - t0) * 1000)
+            html.append(h)
+            img.append(i)
+        print(f"{name:<16} {np.mean(cpu):8.1f} {np.mean(wall):8.1f} {np.mean(html) / 1024:8.1f} {np.mean(img) / 1024:9.1f}")
+
+
+# =========================
+# manual: ไฟล์ใน uploads/ + base64 ในหน้า select vs image_store + preview URL
+# =========================
+def bench_manual(args):
+    import base64
+
+    import image_store
+
+    photos = [img for _, img in load_images(args.images, args.limit, warp=False)]
+    if not photos:
+        print("[BENCH] ไม่พบรูป")
+        return
+    photos = [utils.decode_image_bytes(cv2.imencode(".jpg", img)[1].tobytes(), max_side=2400) for img in photos]
+
+    def disk(img, tmp):
+        path = os.path.join(tmp, "sheet.jpg")
+        cv2.imwrite(path, img)                                     # /select
+        page = len(base64.b64encode(cv2.imencode(".jpg", img)[1]))
+        written = os.path.getsize(path)
+        back = cv2.imread(path)                                    # /grade
+        os.remove(path)
+        return back, page, 0, written
+
+    def memory(img, _):
+        token = image_store.put("bench", img)                      # /select
+        page = len(f"/manual/{token}/preview")
+        shown = len(image_store.preview(image_store.get(token), args.preview_width))
+        back = image_store.load(token)                             # /grade
+        image_store.discard(token)
+        return back, page, shown, 0
+
+    print(f"[BENCH] photos={len(photos)} | preview w={args.preview_width}")
+    print(f"{'mode':<8} {'ms':>7} {'page KB':>8} {'preview KB':>11} {'disk KB':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, fn in (("disk", disk), ("memory", memory)):
+            lat, page, shown, written = [], [], [], []
+            for img in photos:
+                (_, p, sh, w), dt = timed(fn, img, tmp)
+                lat.append(dt * 1000)
+                page.append(p)
+                shown.append(sh)
+                written.append(w)
+            print(f"{name:<8} {np.mean(lat):7.1f} {np.mean(page) / 1024:8.1f} {np.mean(shown) / 1024:11.1f} "
+                  f"{np.mean(written) / 1024:8.1f}")
+    print(f"[BENCH] store: {image_store.stats()}")
+
+
+# =========================
+# upload: ส่งไฟล์จากกล้องตรง ๆ vs ย่อ + encode JPEG ใน browser ก่อนส่ง (จำลองด้วย cv2)
+# =========================
+def _client_resize(data, max_side, quality):
+    """จำลอง static/resize.js: ย่อด้านยาวเหลือ max_side แล้ว encode JPEG ; ไม่เล็กลง -> ไฟล์เดิม"""
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    h, w = img.shape[:2]
+    scale = min(1.0, max_side / float(max(h, w)))
+    if scale < 1.0:
+        img = cv2.resize(img, (int(round(w * scale)), int(round(h * scale))), interpolation=cv2.INTER_AREA)
+    out = cv2.imencode(".jpg", img, [int(cv2.IMWRITE_JPEG_QUALITY), int(round(quality * 100))])[1].tobytes()
+    return out if len(out) < len(data) else data
+
+
+def bench_upload(args):
+    paths = sorted(
+        p for p in glob.glob(os.path.join(args.images, "*"))
+        if os.path.splitext(p.lower())[1] in IMAGE_EXTS
+    )[:args.limit]
+    blobs = []
+    for p in paths:
+        with open(p, "rb") as f:
+            blobs.append(f.read())
+    if not blobs:
+        print("[BENCH] ไม่พบรูป")
+        return
+    mbps = [float(x) for x in args.mbps.split(",") if x.strip()]
+
+    variants = {
+        "original": blobs,
+        "resized": [_client_resize(d, args.max_side, args.quality) for d in blobs],
+    }
+
+    print(f"[BENCH] photos={len(blobs)} | max_side={args.max_side} quality={args.quality}")
+    head = "".join(f" {'up s @' + format(m, 'g') + 'Mb':>11}" for m in mbps)
+    print(f"{'mode':<9} {'avg KB':>8} {'decode p50':>11} {'decode p95':>11} {'warped':>7}{head}")
+    found = {}
+    for name, datas in variants.items():
+        lat, ok = [], []
+        for k in range(args.repeat):
+            for data in datas:
+                img, dt = timed(utils.decode_image_bytes, data, args.max_side)
+                lat.append(dt * 1000)
+                if k == 0:
+                    ok.append(utils.detect_sheet(img) is not None)
+        found[name] = ok
+        avg = float(np.mean([len(d) for d in datas]))
+        up = "".join(f" {avg * 8 / (m * 1e6):11.2f}" for m in mbps)
+        print(f"{name:<9} {avg / 1024:8.0f} {percentile(lat, 50):11.1f} {percentile(lat, 95):11.1f} "
+              f"{sum(ok):>4d}/{len(ok):<2d}{up}")
+
+    same = sum(a == b for a, b in zip(found["original"], found["resized"]))
+    print(f"[BENCH] หามุมได้ผลเหมือนกัน {same}/{len(blobs)} แผ่น")
+
+
+# =========================
+# regrade: ตรวจใหม่ทั้งวิชาจากคำตอบ packed ใน SQLite (numpy ทั้งชุด vs grade_answers ทีละแผ่น)
+# =========================
+def bench_regrade(args):
+    import random
+
+    import db
+
+    omr = get_omr()
+    layout = omr.get_layout(args.num_questions)
+    nq = layout.num_questions
+    choices = list(layout.options) + [None, "MULTI"]
+    rng = random.Random(0)
+    key_str = "".join(rng.choice(layout.options) for _ in range(nq))
+    key = omr.parse_answer_key_string(key_str, layout)
+
+    print(f"[BENCH] {layout}")
+    print(f"{'sheets':>7} {'fetch ms':>9} {'numpy ms':>9} {'loop ms':>8} {'update ms':>10} {'total ms':>9} {'match':>6}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in [int(x) for x in args.sheets.split(",") if x.strip()]:
+            db.DB_PATH = os.path.join(tmp, f"regrade_{n}.db")
+            db._db_ready = False
+            db.create_user("bench", 0)
+            conn = db.get_db_connection()
+            conn.executemany(
+                "INSERT INTO graded_sheets (username, subject, num_questions, answers, key_str) VALUES (?, ?, ?, ?, ?)",
+                [("bench", "bench", nq, omr.pack_answers({q: rng.choice(choices) for q in range(1, nq + 1)}, nq), "")
+                 for _ in range(n)],
+            )
+            conn.commit()
+            conn.close()
+
+            t0 = time.perf_counter()
+            sheets, t_fetch = timed(db.list_graded_sheets, "bench", "bench", nq)
+            graded, t_np = timed(omr.regrade_packed, [s["answers"] for s in sheets], key_str, layout)
+            scores = graded["correct"].tolist()
+            _, t_upd = timed(db.update_graded_scores, "bench", key_str,
+                             [(s["id"], c, graded["total"]) for s, c in zip(sheets, scores)])
+            t_all = time.perf_counter() - t0
+
+            loop, t_loop = timed(lambda: [omr.grade_answers(omr.unpack_answers(s["answers"]), key)[0] for s in sheets])
+            match = sum(a == b for a, b in zip(loop, scores))
+            print(f"{n:7d} {t_fetch * 1000:9.1f} {t_np * 1000:9.1f} {t_loop * 1000:8.1f} {t_upd * 1000:10.1f} "
+                  f"{t_all * 1000:9.1f} {match:>6d}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="ScanGrade benchmarks")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("batch", help="process_auto ทีละแผ่น vs process_batch")
+    p.add_argument("--images", required=True, help="โฟลเดอร์รูป (warp แล้ว หรือรูปถ่าย)")
+    p.add_argument("--num-questions", type=int, default=60)
+    p.add_argument("--key", default="")
+    p.add_argument("--limit", type=int, default=None)
+    p.set_defaults(func=bench_batch)
+
+    p = sub.add_parser("backend", help="MODEL_BACKEND torch vs onnx: latency + peak RSS")
+    p.add_argument("--images", required=True)
+    p.add_argument("--num-questions", type=int, default=60)
+    p.add_argument("--backends", default="torch,onnx")
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--limit", type=int, default=None)
+    p.set_defaults(func=bench_backend)
+
+    p = sub.add_parser("backend-worker", help=argparse.SUPPRESS)
+    p.add_argument("--images", required=True)
+    p.add_argument("--num-questions", type=int, default=60)
+    p.add_argument("--repeat", type=int, default=5)
+    p.add_argument("--limit", type=int, default=None)
+    p.set_defaults(func=bench_backend_worker)
+
+    p = sub.add_parser("assign", help="microbenchmark จับคู่รอยฝน -> slot (ไม่ต้องใช้ model)")
+    p.add_argument("--num-questions", type=int, default=80)
+    p.add_argument("--repeat", type=int, default=20)
+    p.set_defaults(func=bench_assign)
+
+    p = sub.add_parser("engines", help="เทียบ engine อ่านคำตอบ: latency + agreement กับ engine แรก")
+    p.add_argument("--images", required=True)
+    p.add_argument("--num-questions", type=int, default=60)
+    p.add_argument("--engines", default="yolo,fill")
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--limit", type=int, default=None)
+    p.set_defaults(func=bench_engines)
+
+    p = sub.add_parser("cascade", help="cascade (low-res + crop) vs high-res ทั้งแผ่น: latency + agreement + stage2 rate")
+    p.add_argument("--images", required=True)
+    p.add_argument("--num-questions", type=int, default=60)
+    p.add_argument("--limit", type=int, default=None)
+    p.set_defaults(func=bench_cascade)
+
+    p = sub.add_parser("tiles", help="ROI tiles: pixel ที่เข้า model + latency/agreement เทียบ yolo ทั้งแผ่น")
+    p.add_argument("--images", required=True)
+    p.add_argument("--num-questions", type=int, default=60)
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--limit", type=int, default=None)
+    p.set_defaults(func=bench_tiles)
+
+    p = sub.add_parser("startup", help="cold start: เวลา import app / ready / แผ่นแรก (lazy vs warmup)")
+    p.add_argument("--images", required=True)
+    p.add_argument("--num-questions", type=int, default=60)
+    p.set_defaults(func=bench_startup)
+
+    p = sub.add_parser("startup-worker", help=argparse.SUPPRESS)
+    p.add_argument("--images", required=True)
+    p.add_argument("--num-questions", type=int, default=60)
+    p.set_defaults(func=bench_startup_worker)
+
+    p = sub.add_parser("remote", help="model ต่อ worker vs infer_server: sheets/s + RSS รวมที่ 1/2/4 workers")
+    p.add_argument("--images", required=True)
+    p.add_argument("--num-questions", type=int, default=60)
+    p.add_argument("--workers", default="1,2,4")
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--limit", type=int, default=None)
+    p.set_defaults(func=bench_remote)
+
+    p = sub.add_parser("microbatch", help="MicroBatcher: sheets/s + latency + batch histogram ตาม window")
+    p.add_argument("--images", required=True)
+    p.add_argument("--threads", type=int, default=8)
+    p.add_argument("--windows", default="0,2,5,10")
+    p.add_argument("--max-batch", type=int, default=8)
+    p.add_argument("--repeat", type=int, default=4, help="จำนวนแผ่นต่อ thread")
+    p.add_argument("--limit", type=int, default=None)
+    p.set_defaults(func=bench_microbatch)
+
+    p = sub.add_parser("pool", help="replica pool: คำตอบตรงกับ replica เดียว + sheets/s ตามจำนวน replica")
+    p.add_argument("--images", required=True)
+    p.add_argument("--num-questions", type=int, default=60)
+    p.add_argument("--replicas", default="1,2,4")
+    p.add_argument("--threads", type=int, default=8, help="จำนวน thread ที่ยิงพร้อมกัน")
+    p.add_argument("--repeat", type=int, default=4, help="จำนวนแผ่นต่อ thread")
+    p.add_argument("--limit", type=int, default=None)
+    p.set_defaults(func=bench_pool)
+
+    p = sub.add_parser("decode", help="decode เต็ม + resize vs decode แบบย่อ: latency + peak RSS ต่อรูปถ่ายมือถือ")
+    p.add_argument("--images", required=True, help="โฟลเดอร์รูปถ่ายต้นฉบับ (ยังไม่ warp)")
+    p.add_argument("--max-side", type=int, default=2000)
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--limit", type=int, default=None)
+    p.set_defaults(func=bench_decode)
+
+    p = sub.add_parser("decode-worker", help=argparse.SUPPRESS)
+    p.add_argument("--images", required=True)
+    p.add_argument("--max-side", type=int, default=2000)
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--limit", type=int, default=None)
+    p.set_defaults(func=bench_decode_worker)
+
+    p = sub.add_parser("geometry", help="warp เต็ม+crop+resize vs warp ตรงไปขนาด inference: เวลาแต่ละขั้น + agreement")
+    p.add_argument("--images", required=True, help="โฟลเดอร์รูปถ่ายต้นฉบับ (ยังไม่ warp)")
+    p.add_argument("--num-questions", type=int, default=60)
+    p.add_argument("--limit", type=int, default=None)
+    p.set_defaults(func=bench_geometry)
+
+    p = sub.add_parser("corners", help="หามุมแต่ละ mode: อัตราสำเร็จ + latency + strategy ที่ชนะ")
+    p.add_argument("--images", required=True, help="โฟลเดอร์รูปถ่ายต้นฉบับ (ยังไม่ warp)")
+    p.add_argument("--modes", default="legacy,contour,markers,auto")
+    p.add_argument("--num-questions", type=int, default=60, help="layout ที่ใช้ให้คะแนน quad (0 = ใช้รูปทรงแทน)")
+    p.add_argument("--budget-ms", type=float, default=250.0)
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--limit", type=int, default=None)
+    p.add_argument("--verbose", action="store_true", help="แสดงไฟล์ที่หามุมไม่เจอ")
+    p.set_defaults(func=bench_corners)
+
+    p = sub.add_parser("overlay", help="debug base64 ในหน้า result vs overlay lazy: CPU + ขนาด response")
+    p.add_argument("--images", required=True, help="โฟลเดอร์รูปถ่ายต้นฉบับ (ยังไม่ warp)")
+    p.add_argument("--num-questions", type=int, default=60)
+    p.add_argument("--width", type=int, default=640)
+    p.add_argument("--limit", type=int, default=None)
+    p.set_defaults(func=bench_overlay)
+
+    p = sub.add_parser("manual", help="Manual mode: ไฟล์ uploads/ + base64 vs image_store + preview (เวลา + ขนาดหน้า + disk)")
+    p.add_argument("--images", required=True, help="โฟลเดอร์รูปถ่ายต้นฉบับ")
+    p.add_argument("--preview-width", type=int, default=960)
+    p.add_argument("--limit", type=int, default=None)
+    p.set_defaults(func=bench_manual)
+
+    p = sub.add_parser("upload", help="ไฟล์จากกล้อง vs ย่อใน browser ก่อนส่ง: ขนาดไฟล์ + เวลา decode + เวลาอัปโหลด")
+    p.add_argument("--images", required=True, help="โฟลเดอร์รูปถ่ายต้นฉบับ (ไฟล์จากกล้อง)")
+    p.add_argument("--max-side", type=int, default=2000, help="= AUTO_MAX_SIDE ของ app")
+    p.add_argument("--quality", type=float, default=0.9, help="= UPLOAD_JPEG_QUALITY ของ app")
+    p.add_argument("--mbps", default="1,5", help="ความเร็ว uplink (Mbit/s) ที่ใช้ประมาณเวลาอัปโหลด")
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--limit", type=int, default=None)
+    p.set_defaults(func=bench_upload)
+
+    p = sub.add_parser("regrade", help="ตรวจใหม่ทั้งวิชาจากคำตอบใน SQLite: numpy ทั้งชุด vs grade_answers ทีละแผ่น")
+    p.add_argument("--sheets", default="1000,5000", help="จำนวนแผ่นในวิชา (คั่นด้วย ,)")
+    p.add_argument("--num-questions", type=int, default=60)
+    p.set_defaults(func=bench_regrade)
+
+    p = sub.add_parser("remote-worker", help=argparse.SUPPRESS)
+    p.add_argument("--sync-dir", required=True)
+    p.add_argument("--images", required=True)
+    p.add_argument("--num-questions", type=int, default=60)
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--limit", type=int, default=None)
+    p.set_defaults(func=bench_remote_worker)
+
+    args = ap.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+# corners.py
+"""
+หามุมกระดาษแบบหลายวิธีภายใต้งบเวลา (เรียกผ่าน utils.detect_sheet)
+
+ลำดับ strategy (ทุกตัวรันบนรูป gray ที่ย่อแล้ว คืน quad ที่เป็นไปได้หลายอัน):
+1) markers   fiducial ที่พิมพ์ไว้ 4 มุม (fiducials.py)
+2) contour   Canny -> contour เรียงครั้งเดียว -> quad นูน K อันแรก
+3) adaptive  adaptive threshold -> contour -> quad
+4) hough     เส้นตรง Hough -> เส้นนอกสุดบน/ล่าง/ซ้าย/ขวา -> จุดตัด
+5) page      Otsu (กระดาษสว่าง) + morphology -> ก้อนกระดาษ -> 4 มุมของ hull
+
+ทุก quad ให้คะแนนด้วยการ warp ลงขนาดเล็กแล้ววัดว่าวง bubble ของ template ตรงกับหมึกแค่ไหน
+(ไม่มี layout -> ใช้สัดส่วนกระดาษ + พื้นที่แทน)
+- คะแนน >= CORNER_GOOD_SCORE -> หยุดทันที
+- หมดงบ CORNER_BUDGET_MS -> คืน quad ที่ดีที่สุดที่เจอแล้ว (strategy แรกรันเสมอ)
+"""
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+import bubble_reader
+import fiducials
+import layouts
+
+CORNER_BUDGET_MS = float(os.getenv("CORNER_BUDGET_MS", "250"))
+CORNER_GOOD_SCORE = float(os.getenv("CORNER_GOOD_SCORE", "0.10"))  # ring ink บน bubble - นอก bubble
+CORNER_TOPK = int(os.getenv("CORNER_TOPK", "4"))                    # quad ต่อ strategy ที่นำมาให้คะแนน
+SCORE_SCALE = 0.25                                                  # ขนาด sheet ตอนให้คะแนน (เทียบขนาดเต็ม)
+RING_OUTER = 1.6 * bubble_reader.FILL_HALF                          # กรอบครอบเส้นวง bubble (px ที่ขนาดเต็ม)
+RING_INNER = 0.8 * bubble_reader.FILL_HALF
+MIN_QUAD_RATIO = 0.02                                               # quad ต้องกินพื้นที่อย่างน้อยเท่านี้ของรูป
+
+_stats_lock = threading.Lock()
+CORNER_STATS = {
+    "sheets": 0,            # รูปที่หามุม
+    "failed": 0,            # ไม่เจอ quad เลย
+    "budget_hits": 0,       # หมดงบเวลาก่อนได้ quad ที่ดีพอ
+    "ms": 0.0,              # เวลารวม
+    "by_strategy": {},      # strategy ที่ชนะ -> จำนวน
+}
+
+
+# =========================
+# Strategies: gray -> list ของ quad (4x2 float32 พิกัด gray)
+# =========================
+def _top_quads(binary, k: int = CORNER_TOPK, min_ratio: float = MIN_QUAD_RATIO):
+    """contour ภายนอก เรียงตามพื้นที่ครั้งเดียว -> quad นูน k อันแรกที่ใหญ่พอ"""
+    contours, _ = cv2.findContours(binary, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    min_area = binary.shape[0] * binary.shape[1] * min_ratio
+    out = []
+    for cnt in sorted(contours, key=cv2.contourArea, reverse=True):
+        if cv2.contourArea(cnt) < min_area:
+            break
+        peri = cv2.arcLength(cnt, True)
+        approx = cv2.approxPolyDP(cnt, 0.02 * peri, True)
+        if len(approx) == 4 and cv2.isContourConvex(approx):
+            out.append(approx.reshape(4, 2).astype(np.float32))
+            if len(out) >= k:
+                break
+    return out
+
+
+def quads_markers(gray):
+    found = fiducials.find_sheet_corners(gray)
+    return [] if found is None else [found[0]]
+
+
+def quads_contour(gray):
+    edges = cv2.Canny(cv2.GaussianBlur(gray, (5, 5), 0), 50, 150)
+    edges = cv2.dilate(edges, None, iterations=2)
+    edges = cv2.erode(edges, None, iterations=1)
+    return _top_quads(edges)
+
+
+def quads_adaptive(gray):
+    block = max(3, (max(gray.shape[:2]) // 20) | 1)
+    binary = cv2.adaptiveThreshold(cv2.GaussianBlur(gray, (5, 5), 0), 255, cv2.ADAPTIVE_THRESH_MEAN_C,
+                                   cv2.THRESH_BINARY_INV, block, 5)
+    binary = cv2.morphologyEx(binary, cv2.MORPH_CLOSE, np.ones((5, 5), np.uint8))
+    return _top_quads(binary)
+
+
+def _line_intersection(l1, l2):
+    (r1, t1), (r2, t2) = l1, l2
+    A = np.array([[np.cos(t1), np.sin(t1)], [np.cos(t2), np.sin(t2)]])
+    if abs(np.linalg.det(A)) < 1e-6:
+        return None
+    return np.linalg.solve(A, np.array([r1, r2]))
+
+
+def quads_hough(gray):
+    h, w = gray.shape[:2]
+    edges = cv2.Canny(cv2.GaussianBlur(gray, (5, 5), 0), 50, 150)
+    lines = cv2.HoughLines(edges, 1, np.pi / 180, int(0.25 * min(h, w)))
+    if lines is None:
+        return []
+    lines = lines[:100, 0]
+    rho, theta = lines[:, 0], lines[:, 1]
+
+    # x cos + y sin = rho ; ตำแหน่งของเส้นที่กลางรูป ใช้เลือกเส้นนอกสุด
+    horiz = np.abs(np.sin(theta)) > 0.85
+    vert = np.abs(np.cos(theta)) > 0.85
+    if horiz.sum() < 2 or vert.sum() < 2:
+        return []
+    y_mid = (rho[horiz] - (w / 2.0) * np.cos(theta[horiz])) / np.sin(theta[horiz])
+    x_mid = (rho[vert] - (h / 2.0) * np.sin(theta[vert])) / np.cos(theta[vert])
+    hl, vl = lines[horiz], lines[vert]
+    top, bottom = hl[np.argmin(y_mid)], hl[np.argmax(y_mid)]
+    left, right = vl[np.argmin(x_mid)], vl[np.argmax(x_mid)]
+
+    pts = [_line_intersection(a, b) for a, b in ((top, left), (top, right), (bottom, right), (bottom, left))]
+    if any(p is None for p in pts):
+        return []
+    quad = np.array(pts, np.float32)
+    if not cv2.isContourConvex(quad.reshape(-1, 1, 2)) or cv2.contourArea(quad) < h * w * MIN_QUAD_RATIO:
+        return []
+    return [quad]
+
+
+def quads_page(gray):
+    h, w = gray.shape[:2]
+    _, page = cv2.threshold(cv2.GaussianBlur(gray, (7, 7), 0), 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    k = max(3, max(h, w) // 60)
+    page = cv2.morphologyEx(page, cv2.MORPH_CLOSE, np.ones((k, k), np.uint8))
+    page = cv2.morphologyEx(page, cv2.MORPH_OPEN, np.ones((k, k), np.uint8))
+
+    contours, _ = cv2.findContours(page, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    out = []
+    for cnt in sorted(contours, key=cv2.contourArea, reverse=True)[:CORNER_TOPK]:
+        if cv2.contourArea(cnt) < h * w * MIN_QUAD_RATIO:
+            break
+        hull = cv2.convexHull(cnt).reshape(-1, 2).astype(np.float32)
+        approx = cv2.approxPolyDP(hull.reshape(-1, 1, 2), 0.02 * cv2.arcLength(hull.reshape(-1, 1, 2), True), True)
+        if len(approx) == 4:
+            out.append(approx.reshape(4, 2).astype(np.float32))
+            continue
+        # hull ไม่ใช่ 4 มุมพอดี (มุมโค้ง/ถูกบัง) -> จุดสุดขั้ว 4 ทิศ
+        s, d = hull.sum(axis=1), hull[:, 1] - hull[:, 0]
+        quad = hull[[np.argmin(s), np.argmin(d), np.argmax(s), np.argmax(d)]]
+        if cv2.contourArea(quad) >= h * w * MIN_QUAD_RATIO:
+            out.append(quad)
+    return out
+
+
+STRATEGIES = (
+    ("markers", quads_markers),
+    ("contour", quads_contour),
+    ("adaptive", quads_adaptive),
+    ("hough", quads_hough),
+    ("page", quads_page),
+)
+
+# mode ของ utils.detect_sheet -> strategy ที่ใช้
+MODES = {
+    "auto": tuple(name for name, _ in STRATEGIES),
+    "markers": ("markers",),
+    "contour": ("contour", "adaptive", "hough", "page"),
+    "legacy": ("contour",),
+}
+
+
+# =========================
+# Scoring
+# =========================
+_ring_cache = {}
+
+
+def _ring_offsets(layout):
+    """ระยะเลื่อนจากจุด bubble ไปกลางช่องว่างระหว่าง bubble (ครึ่งระยะเพื่อนบ้านที่ใกล้สุด)"""
+    key = id(layout)
+    if key not in _ring_cache:
+        xy = layout.slot_xy.astype(np.float32)
+        d2 = ((xy[:, None, :] - xy[None, :, :]) ** 2).sum(axis=2)
+        np.fill_diagonal(d2, np.inf)
+        half = float(np.sqrt(np.median(d2.min(axis=1)))) / 2.0
+        _ring_cache[key] = np.array([[half, 0], [-half, 0], [0, half], [0, -half]], np.float32)
+    return _ring_cache[key]
+
+
+def _ring_ink(integral, xy, r):
+    so, ao = bubble_reader.box_sums(integral, xy[:, 0], xy[:, 1], RING_OUTER * r)
+    si, ai = bubble_reader.box_sums(integral, xy[:, 0], xy[:, 1], RING_INNER * r)
+    return (so - si) / np.maximum(ao - ai, 1)
+
+
+def alignment_score(gray, quad, layout, to_sheet):
+    """warp quad ลง sheet เล็ก -> หมึกบนเส้นวง bubble ของ template ลบหมึกที่ตำแหน่งระหว่าง bubble"""
+    size = (int(layouts.SHEET_WIDTH * SCORE_SCALE), int(layouts.SHEET_HEIGHT * SCORE_SCALE))
+    sheet = cv2.warpPerspective(gray, to_sheet(quad, size), size)
+    integral, r = bubble_reader.ink_integral(sheet, scale=1.0)
+    r *= size[0] / float(layouts.SHEET_WIDTH)
+
+    xy = layout.slot_xy.astype(np.float32) * r
+    on = _ring_ink(integral, xy, r).mean()
+    off = np.mean([_ring_ink(integral, xy + d * r, r).mean() for d in _ring_offsets(layout)])
+    return float(on - off)
+
+
+def shape_score(gray, quad):
+    """ไม่มี layout: quad ใหญ่ + สัดส่วนใกล้กระดาษ = ดี (0..1)"""
+    area = cv2.contourArea(quad) / float(gray.shape[0] * gray.shape[1])
+    sides = np.sqrt(((quad - np.roll(quad, 1, axis=0)) ** 2).sum(axis=1))
+    aspect = (sides[0] + sides[2]) / max(sides[1] + sides[3], 1e-6)
+    expected = layouts.SHEET_WIDTH / float(layouts.SHEET_HEIGHT)
+    ratio = min(aspect, 1 / max(aspect, 1e-6)) / min(expected, 1 / expected)
+    return float(area * min(ratio, 1 / max(ratio, 1e-6)))
+
+
+# =========================
+# Cascade
+# =========================
+def find_corners(gray, to_sheet, layout=None, mode: str = "auto", budget_ms: float = None):
+    """
+    gray (ย่อแล้ว) -> (quad 4x2 พิกัด gray, strategy ที่ชนะ, คะแนน) หรือ None
+    to_sheet(quad, (w, h)) -> 3x3 transform ไป sheet (รวม crop ขอบ) ใช้ตอนให้คะแนน
+    """
+    names = MODES.get(mode, MODES["auto"])
+    budget = (CORNER_BUDGET_MS if budget_ms is None else budget_ms) / 1000.0
+    good = CORNER_GOOD_SCORE if layout is not None else 0.0
+
+    t0 = time.perf_counter()
+    best = None
+    over_budget = False
+    for i, (name, fn) in enumerate(s for s in STRATEGIES if s[0] in names):
+        if i > 0 and time.perf_counter() - t0 > budget:
+            over_budget = True
+            break
+        for quad in fn(gray):
+            quad = quad.astype(np.float32)
+            try:
+                score = alignment_score(gray, quad, layout, to_sheet) if layout is not None else shape_score(gray, quad)
+            except cv2.error:
+                continue
+            if best is None or score > best[2]:
+                best = (quad, name, score)
+        if best is not None and best[2] >= good:
+            break
+
+    dt_ms = (time.perf_counter() - t0) * 1000
+    with _stats_lock:
+        st = CORNER_STATS
+        st["sheets"] += 1
+        st["ms"] += dt_ms
+        if best is None:
+            st["failed"] += 1
+        else:
+            st["by_strategy"][best[1]] = st["by_strategy"].get(best[1], 0) + 1
+        if over_budget:
+            st["budget_hits"] += 1
+
+    if best is not None:
+        print(f"[CORNERS] {best[1]} score={best[2]:.3f} | {dt_ms:.0f} ms{' (budget)' if over_budget else ''}")
+    return best
+
+
+def corner_stats():
+    with _stats_lock:
+        st = dict(CORNER_STATS)
+        st["by_strategy"] = dict(st["by_strategy"])
+    n = st["sheets"]
+    st["success_rate"] = (1 - st["failed"] / n) if n else 0.0
+    st["mean_ms"] = (st["ms"] / n) if n else 0.0
+    return st
@@ -1,6 +1,7 @@
 # db.py
 import os
 import sqlite3
+import threading
 from datetime import datetime
 
 # =========================
@@ -24,7 +25,25 @@ PACKAGES = {
 # =========================
 # DB CONNECTION
 # =========================
+_db_ready = False
+_db_lock = threading.Lock()
+
+
+def ensure_db():
+    """สร้าง schema ครั้งแรกที่มีการใช้ DB (ไม่ทำตอน import)"""
+    if _db_ready:
+        return
+    with _db_lock:
+        if not _db_ready:
+            init_db()
+
+
 def get_db_connection():
+    ensure_db()
+    return _connect()
+
+
+def _connect():
     # สร้างโฟลเดอร์อัตโนมัติ (กัน path ไม่อยู่)
     db_dir = os.path.dirname(DB_PATH)
     if db_dir:
@@ -47,7 +66,8 @@ def get_db_connection():
 # INIT DB
 # =========================
 def init_db():
-    conn = get_db_connection()
+    global _db_ready
+    conn = _connect()
     cur = conn.cursor()
 
     # USERS
@@ -112,8 +132,32 @@ def init_db():
         ON saved_keys(username, subject, num_questions)
     """)
 
+    # GRADED SHEETS (คำตอบที่อ่านได้ต่อแผ่น ผูกกับ saved_keys ด้วย username + subject + num_questions)
+    # answers = 1 ตัวอักษรต่อข้อ (omr.pack_answers) ; score/total/key_str = ผลตรวจล่าสุด
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS graded_sheets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            num_questions INTEGER NOT NULL,
+            answers TEXT NOT NULL,
+            key_str TEXT NOT NULL,
+            score INTEGER NOT NULL DEFAULT 0,
+            total INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT,
+            updated_at TEXT,
+            FOREIGN KEY(username) REFERENCES users(username)
+        )
+    """)
+
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_graded_sheets_subject
+        ON graded_sheets(username, subject, num_questions)
+    """)
+
     conn.commit()
     conn.close()
+    _db_ready = True
 
 
 # =========================
@@ -254,6 +298,17 @@ def mark_device_used_free(device_id):
 # =========================
 # ORDERS
 # =========================
+def has_paid_order(username):
+    """เคยซื้อเครดิต (มี order ที่อนุมัติแล้ว) -> ได้ priority ในคิวตรวจ"""
+    conn = get_db_connection()
+    row = conn.execute(
+        "SELECT 1 FROM orders WHERE username = ? AND status = 'approved' LIMIT 1",
+        (username,)
+    ).fetchone()
+    conn.close()
+    return row is not None
+
+
 def is_slip_ref_used(slip_ref):
     if not slip_ref:
         return False
@@ -388,4 +443,45 @@ def list_saved_subjects(username, num_questions):
     conn.close()
     return [dict(r) for r in rows]
 
+# =========================
+# GRADED SHEETS
+# =========================
+def add_graded_sheet(username, subject, num_questions, answers, key_str, score, total):
+    now = datetime.utcnow().isoformat()
+    conn = get_db_connection()
+    cur = conn.execute("""
+        INSERT INTO graded_sheets
+        (username, subject, num_questions, answers, key_str, score, total, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (username, subject, num_questions, answers, key_str, score, total, now, now))
+    conn.commit()
+    sheet_id = cur.lastrowid
+    conn.close()
+    return sheet_id
+
 
+def list_graded_sheets(username, subject, num_questions):
+    conn = get_db_connection()
+    rows = conn.execute("""
+        SELECT id, answers, score, total, created_at
+        FROM graded_sheets
+        WHERE username = ? AND subject = ? AND num_questions = ?
+        ORDER BY id
+    """, (username, subject, num_questions)).fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
+
+
+def update_graded_scores(username, key_str, scores):
+    """scores = [(sheet_id, score, total), ...] ; อัปเดตทั้งชุดใน transaction เดียว"""
+    now = datetime.utcnow().isoformat()
+    conn = get_db_connection()
+    try:
+        conn.executemany("""
+            UPDATE graded_sheets
+            SET key_str = ?, score = ?, total = ?, updated_at = ?
+            WHERE id = ? AND username = ?
+        """, [(key_str, score, total, now, sheet_id, username) for sheet_id, score, total in scores])
+        conn.commit()
+    finally:
+        conn.close()
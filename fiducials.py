@@ -0,0 +1,122 @@
+# fiducials.py
+"""
+หามุมกระดาษจาก fiducial ที่พิมพ์ไว้ 4 มุม (แทนการหาขอบกระดาษด้วย Canny + contour)
+
+แผ่นที่รองรับ: จุดศูนย์กลาง marker อยู่ห่างขอบ sheet FIDUCIAL_INSET px (พิกัด 1600x2300)
+- ArUco DICT_4X4_50 id 0/1/2/3 = มุมซ้ายบน / ขวาบน / ขวาล่าง / ซ้ายล่าง
+- หรือสี่เหลี่ยมทึบสีดำ (ด้านละ ~FIDUCIAL_SIZE px) 4 มุม
+
+รันบนรูป gray ที่ย่อแล้ว (รูปเดียวกับที่ใช้หาขอบ) -> homography จากศูนย์กลาง marker
+-> แปลงกลับเป็นมุมกระดาษในรูป (ใช้กับ utils.SheetGeometry ได้เลย)
+"""
+import os
+
+import cv2
+import numpy as np
+
+import layouts
+
+FIDUCIAL_INSET = float(os.getenv("FIDUCIAL_INSET", "60"))   # ศูนย์กลาง marker ห่างขอบ sheet (px ที่ขนาดเต็ม)
+FIDUCIAL_SIZE = float(os.getenv("FIDUCIAL_SIZE", "80"))     # ด้านของ marker (px ที่ขนาดเต็ม)
+FIDUCIAL_IDS = (0, 1, 2, 3)                                 # ArUco id ของ TL, TR, BR, BL
+SQUARE_MIN_FILL = 0.85      # พื้นที่ contour / minAreaRect (วงกลม ~0.79 จึงไม่ผ่าน)
+SQUARE_MIN_DARK = 0.80      # สัดส่วน pixel มืดในสี่เหลี่ยม
+SQUARE_MAX_ASPECT = 1.4
+
+_aruco_detector = None
+
+
+def marker_targets(inset: float = FIDUCIAL_INSET):
+    """ศูนย์กลาง marker ในพิกัด sheet (TL, TR, BR, BL)"""
+    w, h = layouts.SHEET_WIDTH - 1, layouts.SHEET_HEIGHT - 1
+    return np.array([[inset, inset], [w - inset, inset], [w - inset, h - inset], [inset, h - inset]], np.float32)
+
+
+def corners_from_markers(centers):
+    """ศูนย์กลาง marker 4 จุด (TL, TR, BR, BL ในรูป) -> มุม sheet ในรูป ผ่าน homography"""
+    H = cv2.getPerspectiveTransform(np.asarray(centers, np.float32), marker_targets())
+    w, h = layouts.SHEET_WIDTH - 1, layouts.SHEET_HEIGHT - 1
+    sheet = np.array([[[0, 0], [w, 0], [w, h], [0, h]]], np.float32)
+    return cv2.perspectiveTransform(sheet, np.linalg.inv(H))[0]
+
+
+def _get_aruco_detector():
+    global _aruco_detector
+    aruco = getattr(cv2, "aruco", None)
+    if aruco is None:
+        return None
+    if _aruco_detector is None:
+        dictionary = aruco.getPredefinedDictionary(aruco.DICT_4X4_50)
+        if hasattr(aruco, "ArucoDetector"):  # OpenCV >= 4.7
+            _aruco_detector = aruco.ArucoDetector(dictionary, aruco.DetectorParameters()).detectMarkers
+        else:
+            params = aruco.DetectorParameters_create()
+            _aruco_detector = lambda img: aruco.detectMarkers(img, dictionary, parameters=params)  # noqa: E731
+    return _aruco_detector
+
+
+def find_aruco(gray):
+    """ArUco id 0-3 ครบ 4 ตัว -> ศูนย์กลาง (TL, TR, BR, BL) หรือ None"""
+    detect = _get_aruco_detector()
+    if detect is None:
+        return None
+    corners, ids, _ = detect(gray)
+    if ids is None:
+        return None
+
+    found = {}
+    for c, i in zip(corners, ids.ravel()):
+        if int(i) in FIDUCIAL_IDS:
+            found.setdefault(int(i), c.reshape(4, 2).mean(axis=0))
+    if len(found) < 4:
+        return None
+    return np.array([found[i] for i in FIDUCIAL_IDS], np.float32)
+
+
+def find_squares(gray):
+    """สี่เหลี่ยมทึบ 4 มุม -> ศูนย์กลาง (TL, TR, BR, BL) หรือ None"""
+    h, w = gray.shape[:2]
+    # ขนาด marker ที่คาดในรูปนี้: กระดาษกินพื้นที่ราว 30-100% ของด้านยาว
+    side = FIDUCIAL_SIZE * max(h, w) / float(max(layouts.SHEET_WIDTH, layouts.SHEET_HEIGHT))
+    min_area, max_area = (0.3 * side) ** 2, (1.6 * side) ** 2
+
+    _, ink = cv2.threshold(cv2.GaussianBlur(gray, (5, 5), 0), 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    contours, _ = cv2.findContours(ink, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    centers = []
+    for cnt in contours:
+        area = cv2.contourArea(cnt)
+        if not (min_area <= area <= max_area):
+            continue
+        (cx, cy), (rw, rh), _ = cv2.minAreaRect(cnt)
+        if min(rw, rh) <= 0 or max(rw, rh) / min(rw, rh) > SQUARE_MAX_ASPECT:
+            continue
+        if area / (rw * rh) < SQUARE_MIN_FILL:
+            continue
+        x, y, bw, bh = cv2.boundingRect(cnt)
+        if cv2.countNonZero(ink[y:y + bh, x:x + bw]) < SQUARE_MIN_DARK * area:
+            continue
+        centers.append((cx, cy))
+
+    if len(centers) < 4:
+        return None
+
+    # marker ที่อยู่ริมสุดของแต่ละมุม (เหมือน order_points)
+    pts = np.array(centers, np.float32)
+    s, d = pts.sum(axis=1), pts[:, 1] - pts[:, 0]
+    idx = [int(np.argmin(s)), int(np.argmin(d)), int(np.argmax(s)), int(np.argmax(d))]
+    if len(set(idx)) < 4:
+        return None
+    quad = pts[idx]
+    if cv2.contourArea(quad) < 0.1 * h * w or not cv2.isContourConvex(quad.reshape(-1, 1, 2)):
+        return None
+    return quad
+
+
+def find_sheet_corners(gray):
+    """gray (ย่อแล้ว) -> (มุม sheet 4x2 ในพิกัด gray, "aruco" | "squares") หรือ None"""
+    for kind, finder in (("aruco", find_aruco), ("squares", find_squares)):
+        centers = finder(gray)
+        if centers is not None:
+            return corners_from_markers(centers), kind
+    return None
@@ -0,0 +1,122 @@
+# grade_cache.py
+"""
+cache ผลตรวจตามเนื้อหา (ใน process) : ส่งรูปเดิมซ้ำ -> ได้ผลเดิมทันที ไม่ต้อง decode/warp/YOLO และไม่ตัดเครดิตซ้ำ
+
+- scope = ผู้ใช้ + จำนวนข้อ + เฉลย + engine (+ มุมที่เลือกใน manual) ; เปลี่ยนเฉลยแล้วส่งใหม่ = ตรวจใหม่
+- content key = hash(scope + bytes ของรูป)
+- idempotency key = hash(scope + key ที่ client ส่งมา) ใช้ได้แม้ไม่มีรูปให้ hash แล้ว
+  (เช่น กด back แล้วส่ง /grade ซ้ำ หลังรูป manual ถูกลบไปแล้ว)
+- เก็บ GRADE_CACHE_TTL_SEC วินาที / สูงสุด GRADE_CACHE_MAX ผลตรวจ (เก่าสุดออกก่อน)
+- งานใน jobs ที่ยังตรวจไม่เสร็จ จำ job_id ไว้ -> ส่งซ้ำระหว่างรอได้ job เดิม
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+GRADE_CACHE_TTL_SEC = int(os.getenv("GRADE_CACHE_TTL_SEC", "900"))
+GRADE_CACHE_MAX = int(os.getenv("GRADE_CACHE_MAX", "256"))
+IDEMPOTENCY_KEY_MAX = 128
+
+_lock = threading.Lock()
+_items = OrderedDict()      # key -> entry (หลาย key ชี้ entry เดียวกันได้)
+_inflight = OrderedDict()   # content key -> job_id
+_stats = {"hits": 0, "idem_hits": 0, "misses": 0, "stored": 0}
+
+
+def _digest(*parts) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    for p in parts:
+        h.update(p if isinstance(p, (bytes, bytearray, memoryview)) else str(p).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def scope(owner: str, num_questions: int, key_str: str, engine: str, points=None) -> str:
+    """ส่วนของ key ที่ไม่ใช่รูป (key_str ควร normalize มาแล้ว) ; มุม manual ปัดเป็น px"""
+    pts = ";".join(f"{float(x):.0f},{float(y):.0f}" for x, y in points) if points else ""
+    return f"{owner}|{num_questions}|{key_str}|{engine}|{pts}"
+
+
+def content_key(scope_str: str, data) -> str:
+    return "c:" + _digest(scope_str, data)
+
+
+def idempotency_key(scope_str: str, client_key):
+    """key จาก client -> cache key ; ว่าง/ยาวเกิน -> None"""
+    client_key = (client_key or "").strip()
+    if not client_key or len(client_key) > IDEMPOTENCY_KEY_MAX:
+        return None
+    return "i:" + _digest(scope_str, client_key)
+
+
+def _cleanup_locked(now):
+    # ผลหนึ่งมีได้ 2 key (content + idempotency)
+    while _items and (now - next(iter(_items.values()))["created_at"] > GRADE_CACHE_TTL_SEC
+                      or len(_items) > 2 * GRADE_CACHE_MAX):
+        _items.popitem(last=False)
+
+
+def lookup(*keys, count_miss: bool = True):
+    """
+    ผลตรวจจาก key แรกที่เจอ (ข้าม None) -> dict หรือ None
+    count_miss=False: ยังมีการค้นอีกรอบใน request เดียวกัน (นับ miss ครั้งเดียวต่อ request)
+    """
+    keys = [k for k in keys if k]
+    if not keys:
+        return None
+    with _lock:
+        _cleanup_locked(time.time())
+        for k in keys:
+            entry = _items.get(k)
+            if entry is not None:
+                _stats["idem_hits" if k.startswith("i:") else "hits"] += 1
+                return dict(entry["result"])
+        if count_miss:
+            _stats["misses"] += 1
+    return None
+
+
+def put(result: dict, *keys):
+    """เก็บผลตรวจไว้กับทุก key (ข้าม None)"""
+    keys = [k for k in keys if k]
+    if not keys:
+        return
+    now = time.time()
+    entry = {"result": dict(result), "created_at": now}
+    with _lock:
+        for k in keys:
+            _items.pop(k, None)
+            _items[k] = entry
+            _inflight.pop(k, None)
+        _stats["stored"] += 1
+        _cleanup_locked(now)
+
+
+def inflight(key):
+    """job_id ของงานที่กำลังตรวจรูปเดียวกัน (ผู้เรียกต้องเช็กเองว่างานยังไม่จบ) หรือ None"""
+    if not key:
+        return None
+    with _lock:
+        return _inflight.get(key)
+
+
+def track(key, job_id: str):
+    if not key:
+        return
+    with _lock:
+        _inflight.pop(key, None)
+        _inflight[key] = job_id
+        while len(_inflight) > GRADE_CACHE_MAX:
+            _inflight.popitem(last=False)
+
+
+def stats():
+    with _lock:
+        st = dict(_stats)
+        st["cached"] = len({id(e) for e in _items.values()})
+        st["inflight"] = len(_inflight)
+    hits = st["hits"] + st["idem_hits"]
+    st["hit_rate"] = round(hits / (hits + st["misses"]), 3) if hits + st["misses"] else 0.0
+    return st
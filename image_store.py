@@ -0,0 +1,137 @@
+# image_store.py
+"""
+ที่เก็บรูปของ Manual mode (/select -> /grade หรือ /jobs/submit) ในหน่วยความจำ แทนไฟล์ใน uploads/
+
+- เก็บเป็น JPEG bytes (ไม่ใช่ pixel) ; key = token สุ่มที่เก็บไว้ใน session ของผู้ใช้
+- หมดอายุตาม MANUAL_FILE_TTL_SEC (เท่าของเดิม)
+- ใช้หน่วยความจำรวมไม่เกิน MANUAL_STORE_MAX_BYTES ; เกินแล้วไล่ตัวที่ไม่ได้ใช้นานสุดออก (LRU)
+- preview(width) สำหรับหน้า select.html: ย่อ + encode ครั้งแรกที่ขอ แล้วเก็บไว้ (นับรวมใน budget)
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+MANUAL_FILE_TTL_SEC = int(os.getenv("MANUAL_FILE_TTL_SEC", "900"))
+MANUAL_STORE_MAX_BYTES = int(os.getenv("MANUAL_STORE_MAX_BYTES", str(64 * 1024 * 1024)))
+MANUAL_JPEG_QUALITY = int(os.getenv("MANUAL_JPEG_QUALITY", "92"))
+PREVIEW_QUALITY = int(os.getenv("MANUAL_PREVIEW_QUALITY", "80"))
+PREVIEW_STEP = 320      # ความกว้าง preview ปัดเป็นขั้น (จำกัดจำนวน preview ต่อรูป)
+
+_lock = threading.Lock()
+_items = OrderedDict()   # token -> entry (ลำดับ = ใช้ล่าสุดอยู่ท้าย)
+_total = 0
+_stats = {"put": 0, "hits": 0, "misses": 0, "evicted": 0, "expired": 0}
+
+
+def _size(entry):
+    return len(entry["data"]) + sum(len(b) for b in entry["previews"].values())
+
+
+def _drop_locked(token, reason=None):
+    global _total
+    entry = _items.pop(token, None)
+    if entry is not None:
+        _total -= _size(entry)
+        if reason:
+            _stats[reason] += 1
+    return entry
+
+
+def _cleanup_locked(now):
+    for token in [k for k, e in _items.items() if now - e["created_at"] > MANUAL_FILE_TTL_SEC]:
+        _drop_locked(token, "expired")
+    while _items and _total > MANUAL_STORE_MAX_BYTES:
+        _drop_locked(next(iter(_items)), "evicted")
+
+
+def put(owner: str, img_bgr) -> str:
+    """encode รูปเป็น JPEG แล้วเก็บ -> token"""
+    global _total
+    ok, buf = cv2.imencode(".jpg", img_bgr, [int(cv2.IMWRITE_JPEG_QUALITY), MANUAL_JPEG_QUALITY])
+    if not ok:
+        raise ValueError("encode failed")
+
+    h, w = img_bgr.shape[:2]
+    entry = {
+        "token": uuid.uuid4().hex,
+        "owner": owner,
+        "created_at": time.time(),
+        "data": buf.tobytes(),
+        "width": w,
+        "height": h,
+        "previews": {},
+    }
+    with _lock:
+        _items[entry["token"]] = entry
+        _total += _size(entry)
+        _stats["put"] += 1
+        _cleanup_locked(entry["created_at"])
+    return entry["token"]
+
+
+def get(token: str, owner: str = None):
+    """entry (dict) หรือ None ถ้าไม่พบ/หมดอายุ/ไม่ใช่เจ้าของ"""
+    if not token:
+        return None
+    with _lock:
+        _cleanup_locked(time.time())
+        entry = _items.get(token)
+        if entry is None or (owner is not None and entry["owner"] != owner):
+            _stats["misses"] += 1
+            return None
+        _items.move_to_end(token)
+        _stats["hits"] += 1
+        return entry
+
+
+def load(token: str, owner: str = None):
+    """decode รูปเต็มที่เก็บไว้ -> BGR หรือ None"""
+    entry = get(token, owner)
+    if entry is None:
+        return None
+    return cv2.imdecode(np.frombuffer(entry["data"], np.uint8), cv2.IMREAD_COLOR)
+
+
+def discard(token: str):
+    if token:
+        with _lock:
+            _drop_locked(token)
+
+
+def preview(entry, width: int):
+    """JPEG ด้านกว้าง width (ปัดขึ้นเป็นทวีคูณ PREVIEW_STEP, ไม่ขยายเกินรูปจริง) ; encode ครั้งแรกแล้ว cache ใน entry"""
+    global _total
+    width = min(-(-max(int(width), 1) // PREVIEW_STEP) * PREVIEW_STEP, entry["width"])
+    if width == entry["width"]:
+        return entry["data"]
+
+    data = entry["previews"].get(width)
+    if data is None:
+        img = cv2.imdecode(np.frombuffer(entry["data"], np.uint8), cv2.IMREAD_REDUCED_COLOR_2
+                           if width * 2 <= entry["width"] else cv2.IMREAD_COLOR)
+        height = int(round(entry["height"] * width / float(entry["width"])))
+        img = cv2.resize(img, (width, height), interpolation=cv2.INTER_AREA)
+        ok, buf = cv2.imencode(".jpg", img, [int(cv2.IMWRITE_JPEG_QUALITY), PREVIEW_QUALITY])
+        if not ok:
+            raise ValueError("encode failed")
+        data = buf.tobytes()
+        with _lock:
+            # นับ budget เฉพาะตอนยังอยู่ใน store (อาจถูกไล่ออกไประหว่าง encode)
+            if entry["previews"].setdefault(width, data) is data and _items.get(entry["token"]) is entry:
+                _total += len(data)
+            _cleanup_locked(time.time())
+    return data
+
+
+def stats():
+    with _lock:
+        st = dict(_stats)
+        st["items"] = len(_items)
+        st["bytes"] = _total
+        st["max_bytes"] = MANUAL_STORE_MAX_BYTES
+    return st
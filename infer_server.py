@@ -0,0 +1,294 @@
+# infer_server.py
+"""
+Inference daemon: process เดียวถือ model แล้วให้ web worker ทุกตัวเรียกผ่าน Unix socket
+
+- รูปส่งผ่าน shared memory (multiprocessing.shared_memory) ไม่ pickle/copy ผ่าน socket
+- socket ส่งแค่ header JSON (ชื่อ segment, offset, shape) และผล detection กลับ
+- client ฝั่ง web = RemoteModel (MODEL_BACKEND=remote) หน้าตาเหมือน YOLO.predict
+
+รัน:
+    python infer_server.py --socket /tmp/scangrade-infer.sock
+"""
+import argparse
+import atexit
+import contextlib
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+import layouts
+import model_loader
+from batcher import MicroBatcher
+from yolo_ops import Boxes, Results
+
+INFER_SOCKET = os.getenv("INFER_SOCKET", "/tmp/scangrade-infer.sock")
+INFER_TIMEOUT = float(os.getenv("INFER_TIMEOUT", "60"))
+PREDICT_KEYS = ("conf", "iou", "imgsz", "max_det")
+
+
+# =========================
+# Protocol: [4 byte length][JSON]
+# =========================
+def send_msg(sock, obj):
+    data = json.dumps(obj).encode("utf-8")
+    sock.sendall(struct.pack(">I", len(data)) + data)
+
+
+def _recv_exact(sock, n):
+    buf = bytearray()
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError("socket closed")
+        buf += chunk
+    return bytes(buf)
+
+
+def recv_msg(sock):
+    (n,) = struct.unpack(">I", _recv_exact(sock, 4))
+    return json.loads(_recv_exact(sock, n).decode("utf-8"))
+
+
+# =========================
+# Server
+# =========================
+class _Handler(socketserver.BaseRequestHandler):
+    """หนึ่ง connection = หนึ่ง thread ฝั่ง client ; segment ที่ attach แล้วเก็บไว้ใช้ซ้ำจนปิด connection"""
+
+    def handle(self):
+        segments = {}
+        try:
+            while True:
+                try:
+                    msg = recv_msg(self.request)
+                except (ConnectionError, struct.error):
+                    return
+                try:
+                    send_msg(self.request, self.server.dispatch(msg, segments))
+                except Exception as e:
+                    send_msg(self.request, {"ok": False, "error": f"{type(e).__name__}: {e}"})
+        finally:
+            for shm in segments.values():
+                try:
+                    shm.close()
+                except BufferError:
+                    pass
+
+
+class InferServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, model, backend):
+        if os.path.exists(path):
+            os.remove(path)
+        super().__init__(path, _Handler)
+        self.model = model
+        self.backend = backend
+        # YOLO.predict ไม่ thread-safe ; MicroBatcher / ModelPool กันให้อยู่แล้ว
+        # (ห้ามล็อกซ้อน ไม่งั้นคำขอจากหลาย connection จะไม่ถูกรวม batch / ไม่ได้ใช้ replica อื่น)
+        safe = isinstance(model, (MicroBatcher, model_loader.ModelPool))
+        self.predict_lock = contextlib.nullcontext() if safe else threading.Lock()
+        self.stats = {"requests": 0, "images": 0, "predict_ms": 0.0}
+        self._stats_lock = threading.Lock()  # handler หลาย thread อัปเดตพร้อมกัน
+
+    def attach(self, name, segments):
+        shm = segments.get(name)
+        if shm is None:
+            shm = shared_memory.SharedMemory(name=name)
+            # segment เป็นของ client ; กัน resource_tracker ฝั่งนี้ unlink ตอนปิด daemon
+            resource_tracker.unregister(shm._name, "shared_memory")
+            segments[name] = shm
+        return shm
+
+    def dispatch(self, msg, segments):
+        op = msg.get("op")
+        if op == "ping":
+            with self._stats_lock:
+                stats = dict(self.stats)
+            return {"ok": True, "pid": os.getpid(), "backend": self.backend, **stats,
+                    "batcher": model_loader.batcher_stats(), "pool": model_loader.pool_stats()}
+        if op != "predict":
+            raise ValueError(f"unknown op: {op}")
+
+        shm = self.attach(msg["shm"], segments)
+        images = [
+            np.ndarray(tuple(im["shape"]), dtype=np.uint8, buffer=shm.buf, offset=int(im["offset"]))
+            for im in msg["images"]
+        ]
+        kwargs = {k: msg[k] for k in PREDICT_KEYS if msg.get(k) is not None}
+
+        t0 = time.perf_counter()
+        with self.predict_lock:
+            results = self.model.predict(source=images, verbose=False, **kwargs)
+            out = [
+                {
+                    "xyxy": r.boxes.xyxy.cpu().numpy().tolist(),
+                    "conf": r.boxes.conf.cpu().numpy().tolist(),
+                    "cls": r.boxes.cls.cpu().numpy().tolist(),
+                }
+                for r in results
+            ]
+        dt_ms = (time.perf_counter() - t0) * 1000
+        with self._stats_lock:
+            self.stats["requests"] += 1
+            self.stats["images"] += len(images)
+            self.stats["predict_ms"] += dt_ms
+        return {"ok": True, "results": out}
+
+
+# =========================
+# Client (MODEL_BACKEND=remote)
+# =========================
+class RemoteModel:
+    """
+    ใช้แทน YOLO ใน process ของ web: predict() ส่งรูปผ่าน shared memory ไปที่ daemon
+    แต่ละ thread มี connection + segment ของตัวเอง (ใช้ซ้ำ ขยายเมื่อรูปใหญ่กว่าเดิม)
+    """
+
+    def __init__(self, socket_path: str = INFER_SOCKET, timeout: float = INFER_TIMEOUT):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._segments = set()
+        self._seg_lock = threading.Lock()
+        atexit.register(self.release_segments)
+
+    def release_segments(self):
+        """unlink segment ทุกอันที่ client นี้สร้าง (เรียกตอนปิด process)"""
+        with self._seg_lock:
+            for shm in list(self._segments):
+                self._drop_segment(shm)
+
+    def _drop_segment(self, shm):
+        self._segments.discard(shm)
+        try:
+            shm.close()
+            shm.unlink()
+        except (BufferError, FileNotFoundError):
+            pass
+
+    def _conn(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            self._local.sock = sock
+        return sock
+
+    def _segment(self, nbytes):
+        shm = getattr(self._local, "shm", None)
+        if shm is None or shm.size < nbytes:
+            with self._seg_lock:
+                if shm is not None:
+                    self._drop_segment(shm)
+                shm = shared_memory.SharedMemory(create=True, size=max(nbytes, 1 << 20) * 3 // 2)
+                self._segments.add(shm)
+            self._local.shm = shm
+        return shm
+
+    def _call(self, msg):
+        try:
+            send_msg(self._conn(), msg)
+            resp = recv_msg(self._conn())
+        except socket.timeout:
+            # daemon ยังรันคำขอเดิมอยู่ -> ไม่ส่งซ้ำ (ซ้ำ = inference 2 รอบ + รอ 2 เท่า)
+            # ทิ้ง connection ไม่ให้คำตอบที่มาช้าปนกับคำขอถัดไป
+            self.close_connection()
+            raise
+        except (ConnectionError, FileNotFoundError, BrokenPipeError):
+            # daemon restart / connection หลุด / socket ยังไม่มี -> ต่อใหม่ 1 ครั้ง
+            self.close_connection()
+            send_msg(self._conn(), msg)
+            resp = recv_msg(self._conn())
+        if not resp.get("ok"):
+            raise RuntimeError(f"infer_server: {resp.get('error')}")
+        return resp
+
+    def close_connection(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+            self._local.sock = None
+
+    def ping(self):
+        return self._call({"op": "ping"})
+
+    def predict(self, source, conf: float = 0.25, iou: float = None, imgsz=None, max_det: int = None,
+                verbose: bool = False, **_):
+        images = [np.ascontiguousarray(im, dtype=np.uint8) for im in (source if isinstance(source, (list, tuple)) else [source])]
+
+        offsets, total = [], 0
+        for im in images:
+            offsets.append(total)
+            total += (im.nbytes + 63) // 64 * 64
+
+        shm = self._segment(total)
+        for im, off in zip(images, offsets):
+            np.ndarray(im.shape, dtype=np.uint8, buffer=shm.buf, offset=off)[...] = im
+
+        resp = self._call({
+            "op": "predict",
+            "shm": shm.name,
+            "images": [{"offset": off, "shape": list(im.shape)} for im, off in zip(images, offsets)],
+            "conf": conf,
+            "iou": iou,
+            "imgsz": imgsz,
+            "max_det": max_det,
+        })
+        return [
+            Results(Boxes(r["xyxy"], r["conf"], r["cls"]), im.shape)
+            for r, im in zip(resp["results"], images)
+        ]
+
+
+def wait_ready(socket_path: str = INFER_SOCKET, timeout: float = 60.0):
+    """รอจน daemon ตอบ ping ได้ (ใช้ตอน start / bench)"""
+    deadline = time.time() + timeout
+    while True:
+        try:
+            client = RemoteModel(socket_path, timeout=5)
+            info = client.ping()
+            client.close_connection()
+            return info
+        except (OSError, ConnectionError, RuntimeError):
+            if time.time() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="ScanGrade inference daemon (Unix socket + shared memory)")
+    ap.add_argument("--socket", default=INFER_SOCKET)
+    ap.add_argument("--model", default=model_loader.DEFAULT_MODEL_PATH)
+    ap.add_argument("--backend", default=os.getenv("INFER_BACKEND", "torch"))
+    args = ap.parse_args()
+
+    if args.backend == "remote":
+        raise SystemExit("--backend ต้องเป็น model จริง (torch / onnx / onnx-int8)")
+
+    model = model_loader.get_model(args.model, backend=args.backend)
+    model.predict(source=[np.full((layouts.SHEET_HEIGHT, layouts.SHEET_WIDTH, 3), 255, np.uint8)], verbose=False)  # warmup
+
+    server = InferServer(args.socket, model, args.backend)
+    print(f"[INFER] listening on {args.socket} (backend={args.backend}, pid={os.getpid()})")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+# jobs.py
+"""
+คิวงานตรวจแบบ async (ไม่ผูกกับ request ที่สร้างงาน)
+
+- submit() คืน job_id ทันที ; แต่ละงานรอ slot จาก admission (เรียงตาม priority) แล้วจึงรัน
+- คิวจำกัด JOB_QUEUE_MAX งาน (รอ + กำลังรัน) ; เต็มแล้ว submit() คืน None
+- จำนวนงานที่รันพร้อมกันจริง = admission.ADMIT_SLOTS (ใช้ร่วมกับ request แบบ sync)
+- งานเข้าไปรอในคิว admission พร้อมกันได้ไม่เกิน JOB_ADMIT_MAX งาน (ที่เหลือรอฝั่ง jobs)
+  -> งาน async จำนวนมากไม่กินคิว admission จน request แบบ sync ได้ 503 / ถูกตัดออกทีหลังทั้งที่ได้ 202 แล้ว
+- on_success(result) ถูกเรียกเมื่องานสำเร็จเท่านั้น (ใช้ตัดเครดิต)
+- submit_done() ลงทะเบียนงานที่มีผลแล้ว (ผลจาก cache) ให้ client poll/ไปหน้าผลได้เหมือนงานปกติ
+- งานที่จบแล้วเก็บไว้ JOB_TTL_SEC วินาที แล้วลบทิ้ง
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import admission
+
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "32"))
+JOB_ADMIT_BUDGET_SEC = float(os.getenv("JOB_ADMIT_BUDGET_SEC", "120"))  # งาน async รอ slot ได้นานกว่า request
+JOB_ADMIT_MAX = int(os.getenv("JOB_ADMIT_MAX", str(max(1, admission.ADMIT_QUEUE_MAX // 4))))
+JOB_TTL_SEC = int(os.getenv("JOB_TTL_SEC", "900"))
+JOB_SSE_MAX_SEC = int(os.getenv("JOB_SSE_MAX_SEC", "30"))   # อายุสูงสุดของ SSE stream หนึ่งครั้ง
+
+# queued -> running -> done | error
+FINAL_STATES = ("done", "error")
+BUSY_MESSAGE = "⏳ ระบบกำลังตรวจงานจำนวนมาก กรุณาลองใหม่อีกครั้ง"
+
+_cond = threading.Condition()
+_jobs = {}
+_executor = None
+_admit_sem = threading.BoundedSemaphore(max(1, JOB_ADMIT_MAX))
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        # thread ต่องานที่รับไว้ ; thread ส่วนใหญ่แค่รอ slot จาก admission
+        _executor = ThreadPoolExecutor(max_workers=JOB_QUEUE_MAX, thread_name_prefix="grade-job")
+    return _executor
+
+
+def _cleanup_locked(now):
+    for job_id in [k for k, j in _jobs.items() if j["state"] in FINAL_STATES and now - j["finished_at"] > JOB_TTL_SEC]:
+        _jobs.pop(job_id, None)
+
+
+def _set_state(job, state, **fields):
+    with _cond:
+        job.update(fields, state=state)
+        job["version"] += 1
+        _cond.notify_all()
+
+
+def _run(job, fn, on_success, priority):
+    t0 = time.perf_counter()
+    try:
+        if not _admit_sem.acquire(timeout=JOB_ADMIT_BUDGET_SEC):
+            raise admission.Rejected("budget", 5)
+        try:
+            # budget รวมเวลาที่รอ JOB_ADMIT_MAX แล้ว
+            left = max(JOB_ADMIT_BUDGET_SEC - (time.perf_counter() - t0), 0.0)
+            # ตอบ 202 ไปแล้ว -> ไม่ให้ request ที่ priority สูงกว่าตัดออกจากคิว
+            with admission.slot(priority, left, evictable=False):
+                _set_state(job, "running", started_at=time.time())
+                result = fn()
+        finally:
+            _admit_sem.release()
+        if on_success is not None:
+            on_success(result)
+    except admission.Rejected as e:
+        print(f"[JOB] {job['id']} shed: {e}")
+        _set_state(job, "error", error=BUSY_MESSAGE, finished_at=time.time())
+        return
+    except Exception as e:
+        print(f"[JOB] {job['id']} failed: {e}")
+        _set_state(job, "error", error=str(e) or type(e).__name__, finished_at=time.time())
+        return
+    _set_state(job, "done", result=result, finished_at=time.time())
+
+
+def pending_count(owner: str = None):
+    """จำนวนงานที่ยังไม่จบ (ทั้งหมด หรือเฉพาะของ owner)"""
+    with _cond:
+        return sum(
+            1 for j in _jobs.values()
+            if j["state"] not in FINAL_STATES and (owner is None or j["owner"] == owner)
+        )
+
+
+def _new_job(owner, kind, priority, now):
+    return {
+        "id": uuid.uuid4().hex,
+        "owner": owner,
+        "kind": kind,
+        "priority": priority,
+        "state": "queued",
+        "version": 0,
+        "created_at": now,
+        "started_at": None,
+        "finished_at": None,
+        "error": None,
+        "result": None,
+    }
+
+
+def submit(owner: str, fn, on_success=None, kind: str = "grade", priority: int = admission.PRIORITY_FREE):
+    """ส่งงาน fn() เข้าคิว -> job_id (หรือ None ถ้าคิวเต็ม)"""
+    now = time.time()
+    job = _new_job(owner, kind, priority, now)
+    with _cond:
+        _cleanup_locked(now)
+        if sum(1 for j in _jobs.values() if j["state"] not in FINAL_STATES) >= JOB_QUEUE_MAX:
+            return None
+        _jobs[job["id"]] = job
+
+    _get_executor().submit(_run, job, fn, on_success, priority)
+    return job["id"]
+
+
+def submit_done(owner: str, result, kind: str = "grade"):
+    """งานที่มีผลอยู่แล้ว (เช่น จาก grade_cache) -> job_id ที่ state = done ทันที ไม่ใช้ slot/คิว"""
+    now = time.time()
+    job = _new_job(owner, kind, admission.PRIORITY_FREE, now)
+    job.update(state="done", started_at=now, finished_at=now, result=result)
+    with _cond:
+        _cleanup_locked(now)
+        _jobs[job["id"]] = job
+    return job["id"]
+
+
+def get(job_id: str, owner: str = None):
+    """snapshot ของงาน (dict) ; None ถ้าไม่พบ/หมดอายุ/ไม่ใช่เจ้าของ"""
+    with _cond:
+        _cleanup_locked(time.time())
+        job = _jobs.get(job_id)
+        if job is None or (owner is not None and job["owner"] != owner):
+            return None
+        return dict(job)
+
+
+def wait(job_id: str, version: int, timeout: float = 15.0):
+    """รอจนงานเปลี่ยนสถานะจาก version ที่เห็นล่าสุด (ใช้กับ SSE) -> snapshot หรือ None"""
+    deadline = time.time() + timeout
+    with _cond:
+        while True:
+            job = _jobs.get(job_id)
+            if job is None or job["version"] != version:
+                return dict(job) if job else None
+            left = deadline - time.time()
+            if left <= 0:
+                return dict(job)
+            _cond.wait(left)
+
+
+def public_status(job: dict):
+    """ข้อมูลสถานะที่ส่งให้ client (ไม่มีผลตรวจ/รูป)"""
+    now = time.time()
+    status = {k: job[k] for k in ("id", "state", "error", "created_at", "started_at", "finished_at")}
+    status["queued_sec"] = round((job["started_at"] or now) - job["created_at"], 3)
+    if job["started_at"]:
+        status["run_sec"] = round((job["finished_at"] or now) - job["started_at"], 3)
+    return status
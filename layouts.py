@@ -0,0 +1,210 @@
+# layouts.py
+"""
+Layout registry: questions_N.json -> Layout (compile ครั้งเดียว)
+
+- ทุก layout ใช้ engine เดียวกัน (omr.py) ต่างกันแค่ข้อมูล
+- เพิ่ม layout ใหม่ (เช่น 100/120 ข้อ) = วางไฟล์ questions_N.json อย่างเดียว
+- ผล compile ถูก cache เป็น .npy (structured array) ใน LAYOUT_CACHE_DIR แล้ว np.load แบบ mmap
+
+รูปแบบ template JSON:
+    {"1": {"x": .., "y": ..}, "2": {...}, ...}       # slot เรียง 1A..1E, 2A..2E, ...
+    {"_meta": {"options": "ABCD"}, ...}              # (ถ้ามี) กำหนดตัวเลือกต่อข้อ
+"""
+import glob
+import hashlib
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+from slot_index import SlotIndex
+
+TEMPLATE_DIR = os.getenv("TEMPLATE_DIR", ".")
+TEMPLATE_PATTERN = "questions_{n}.json"
+LAYOUT_CACHE_DIR = os.getenv("LAYOUT_CACHE_DIR", ".layout_cache")
+
+DEFAULT_OPTIONS = "ABCDE"
+MAX_SLOT_DIST = 150.0
+
+# ขนาดกระดาษหลัง warp ที่พิกัด template อ้างอิง
+SHEET_WIDTH = 1600
+SHEET_HEIGHT = 2300
+
+SLOT_DTYPE = np.dtype([
+    ("id", "<i4"),     # เลข slot ใน JSON
+    ("x", "<f4"),
+    ("y", "<f4"),
+    ("q", "<i2"),      # ข้อ (0-based), -1 = ไม่ได้ map
+    ("opt", "<i1"),    # ตัวเลือก (0-based), -1 = ไม่ได้ map
+])
+
+_lock = threading.Lock()
+_layouts = {}
+
+
+class Layout:
+    """template ที่ compile แล้ว: array พิกัด + ตาราง slot -> (ข้อ, ตัวเลือก) + SlotIndex"""
+
+    def __init__(self, num_questions: int, options: str, slots, template_file: str = ""):
+        self.num_questions = int(num_questions)
+        self.options = list(options)
+        self.num_options = len(self.options)
+        self.template_file = template_file
+        self.tag = f"[{self.num_questions}Q]"
+
+        self.slots = slots  # structured array (อาจเป็น memmap)
+        self.slot_ids = slots["id"]
+        self.slot_xy = np.stack([slots["x"], slots["y"]], axis=1)
+        self.slot_q = slots["q"].astype(np.int64)
+        self.slot_opt = slots["opt"].astype(np.int64)
+        self.index = SlotIndex(self.slot_xy, MAX_SLOT_DIST)
+
+        # กรอบของแต่ละข้อ (x0, y0, x1, y1) จากจุดกึ่งกลาง bubble ของข้อนั้น
+        self.question_bounds = np.zeros((self.num_questions, 4), dtype=np.float32)
+        mapped = self.slot_q >= 0
+        for q in range(self.num_questions):
+            pts = self.slot_xy[mapped & (self.slot_q == q)]
+            if len(pts):
+                self.question_bounds[q] = (*pts.min(axis=0), *pts.max(axis=0))
+
+        # กรอบของแต่ละคอลัมน์คำตอบ (B, 4) สำหรับ crop เฉพาะพื้นที่ที่มี bubble
+        self.blocks = column_blocks(self.question_bounds)
+
+    @property
+    def all_slots(self):
+        """รูปแบบเดิม {slot_index: (x, y)}"""
+        return {int(i): (float(x), float(y)) for i, x, y in zip(self.slot_ids, self.slots["x"], self.slots["y"])}
+
+    @property
+    def slot_mapping(self):
+        """รูปแบบเดิม {slot_index: (ข้อ, ตัวเลือก)}"""
+        return {
+            int(i): (int(q) + 1, self.options[o])
+            for i, q, o in zip(self.slot_ids, self.slot_q, self.slot_opt) if q >= 0
+        }
+
+    def __repr__(self):
+        return f"Layout({self.num_questions}Q, options={''.join(self.options)}, slots={len(self.slots)})"
+
+
+def column_blocks(question_bounds):
+    """จัดกลุ่มข้อเป็นคอลัมน์ตามจุดกึ่งกลางแกน x -> กรอบ (x0, y0, x1, y1) ของแต่ละคอลัมน์ เรียงซ้าย -> ขวา"""
+    b = question_bounds[(question_bounds[:, 2] > 0) | (question_bounds[:, 3] > 0)]
+    if not len(b):
+        return np.zeros((0, 4), dtype=np.float32)
+
+    cx = (b[:, 0] + b[:, 2]) / 2.0
+    order = np.argsort(cx, kind="stable")
+    # ข้อในคอลัมน์เดียวกัน x แทบไม่ต่างกัน ; ห่างเกินความกว้างของข้อ = คอลัมน์ใหม่
+    gap = max(float(np.median(b[:, 2] - b[:, 0])), 1.0)
+    groups = np.split(order, np.flatnonzero(np.diff(cx[order]) > gap) + 1)
+
+    return np.array(
+        [(b[g, 0].min(), b[g, 1].min(), b[g, 2].max(), b[g, 3].max()) for g in groups],
+        dtype=np.float32,
+    )
+
+
+# =========================
+# Compile
+# =========================
+def template_path(num_questions: int) -> str:
+    return os.path.join(TEMPLATE_DIR, TEMPLATE_PATTERN.format(n=int(num_questions)))
+
+
+def compile_template(raw: dict, num_questions: int):
+    """JSON dict -> (options, structured slots array) ; map ตามลำดับ slot index เหมือนเดิม"""
+    meta = raw.get("_meta") or {}
+    options = str(meta.get("options") or DEFAULT_OPTIONS)
+    num_questions = int(meta.get("num_questions") or num_questions)
+
+    ids = sorted(int(k) for k in raw.keys() if not str(k).startswith("_"))
+    slots = np.zeros(len(ids), dtype=SLOT_DTYPE)
+    for pos, idx in enumerate(ids):
+        v = raw[str(idx)]
+        qnum = pos // len(options)
+        mapped = qnum < num_questions
+        slots[pos] = (idx, v["x"], v["y"], qnum if mapped else -1, pos % len(options) if mapped else -1)
+    return options, num_questions, slots
+
+
+def _cache_paths(json_path: str, digest: str):
+    stem = os.path.splitext(os.path.basename(json_path))[0]
+    base = os.path.join(LAYOUT_CACHE_DIR, f"{stem}-{digest[:12]}")
+    return base + ".npy", base + ".meta.json"
+
+
+def load_layout(num_questions: int) -> Layout:
+    """โหลดจาก cache .npy (mmap) ถ้ามี ; ไม่งั้น compile จาก JSON แล้วเขียน cache"""
+    json_path = template_path(num_questions)
+    if not os.path.exists(json_path):
+        raise FileNotFoundError(f"ไม่พบไฟล์ template: {json_path}")
+
+    with open(json_path, "rb") as f:
+        data = f.read()
+    npy_path, meta_path = _cache_paths(json_path, hashlib.sha1(data).hexdigest())
+
+    if os.path.exists(npy_path) and os.path.exists(meta_path):
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            slots = np.load(npy_path, mmap_mode="r")
+            return Layout(meta["num_questions"], meta["options"], slots, json_path)
+        except Exception as e:
+            print(f"[LAYOUT] cache เสีย สร้างใหม่: {npy_path} ({e})")
+
+    options, nq, slots = compile_template(json.loads(data.decode("utf-8")), num_questions)
+
+    try:
+        os.makedirs(LAYOUT_CACHE_DIR, exist_ok=True)
+        tmp = npy_path + ".tmp.npy"
+        np.save(tmp, slots)
+        os.replace(tmp, npy_path)
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"num_questions": nq, "options": options, "source": os.path.basename(json_path)}, f)
+        os.replace(meta_path + ".tmp", meta_path)
+    except OSError as e:
+        print(f"[LAYOUT] เขียน cache ไม่ได้: {e}")
+
+    return Layout(nq, options, slots, json_path)
+
+
+# =========================
+# Registry
+# =========================
+def available_layouts():
+    """จำนวนข้อที่มี template ให้ใช้ (เรียงน้อย -> มาก)"""
+    out = []
+    for p in glob.glob(os.path.join(TEMPLATE_DIR, TEMPLATE_PATTERN.format(n="*"))):
+        m = re.search(r"questions_(\d+)\.json$", p)
+        if m:
+            out.append(int(m.group(1)))
+    return sorted(out)
+
+
+def get_layout(num_questions: int) -> Layout:
+    """✅ cache: compile ครั้งเดียวต่อ process ต่อ layout"""
+    num_questions = int(num_questions)
+    with _lock:
+        layout = _layouts.get(num_questions)
+        if layout is None:
+            layout = load_layout(num_questions)
+            _layouts[num_questions] = layout
+            print(f"[LAYOUT] {layout.tag} cached: {layout.template_file} | slots={len(layout.slots)} "
+                  f"mapping={int((layout.slot_q >= 0).sum())}")
+        return layout
+
+
+# =========================
+# Debug overlay
+# =========================
+def overlay_scale(img):
+    """
+    สเกลสำหรับวาด debug overlay บนรูปขนาดใดก็ได้ -> (sx, sy, font, thick, radius)
+    ขนาดตัวอักษร/เส้น/จุดตามความกว้างรูป (ทุก engine ได้ overlay หน้าตาเดียวกัน)
+    """
+    sx = img.shape[1] / float(SHEET_WIDTH)
+    sy = img.shape[0] / float(SHEET_HEIGHT)
+    return sx, sy, max(0.3, 0.6 * sx), max(1, int(round(2 * sx))), max(1, int(round(3 * sx)))
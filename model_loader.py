@@ -1,26 +1,285 @@
 # model_loader.py
+import hashlib
+import json
 import os
+import queue
 import threading
-from ultralytics import YOLO
+import time
+from collections import deque
+
+from batcher import MicroBatcher
 
 _lock = threading.Lock()
 _models = {}
 
-def get_model(model_path: str):
+# สถานะ model สำหรับ /readyz: idle -> loading -> loaded -> warming -> ready (หรือ error)
+MODEL_STATE = {
+    "state": "idle",
+    "backend": None,
+    "path": None,
+    "load_ms": None,
+    "warmup_ms": None,
+    "error": None,
+}
+
+DEFAULT_MODEL_PATH = "runs/detect/train_AE52/weights/bestX.pt"
+
+# torch = ultralytics YOLO (ค่าเดิม) | onnx = onnxruntime CPU (export จาก .pt ครั้งแรก)
+# onnx-int8 = ไฟล์ bestX.int8.onnx ที่สร้างด้วย quantize.py (ต้องผ่าน accuracy gate)
+# remote = ส่งไปให้ infer_server.py (daemon ตัวเดียวถือ model) ผ่าน Unix socket
+MODEL_BACKEND = os.getenv("MODEL_BACKEND", "torch").strip().lower()
+BACKENDS = ("torch", "onnx", "onnx-int8", "remote")
+
+# replica pool: YOLO.predict ไม่ thread-safe -> N instance ให้ thread ยืม/คืน (ทุก backend ยกเว้น remote)
+# MODEL_REPLICAS: 1 = instance เดียว (pool ขนาด 1 = predict ทีละ request), 0 = auto (ตามจำนวน core) ; จำกัดด้วย MODEL_MEMORY_BUDGET_MB
+# threads ต่อ replica = cores // N : onnx ตั้งแยกต่อ session ; torch ตั้งได้แค่ทั้ง process (_set_torch_threads)
+# -> ทุก replica ของ torch ใช้ค่าเดียวกันและแบ่ง thread pool เดียวกัน
+MODEL_REPLICAS = int(os.getenv("MODEL_REPLICAS", "1"))
+MODEL_MEMORY_BUDGET_MB = float(os.getenv("MODEL_MEMORY_BUDGET_MB", "0"))  # 0 = ไม่จำกัด
+
+# micro-batching หน้า model.predict (0 = ปิด) ; remote ไม่ห่อ (ให้ daemon ทำ batch เอง)
+BATCH_WINDOW_MS = float(os.getenv("BATCH_WINDOW_MS", "0"))
+BATCH_MAX = int(os.getenv("BATCH_MAX", "8"))
+
+# สัดส่วนข้อที่ INT8 ต้องตอบตรงกับ FP32 ขั้นต่ำ
+INT8_MIN_AGREEMENT = float(os.getenv("INT8_MIN_AGREEMENT", "0.995"))
+
+
+def int8_path_for(model_path: str) -> str:
+    return os.path.splitext(model_path)[0] + ".int8.onnx"
+
+
+def int8_report_path_for(model_path: str) -> str:
+    return os.path.splitext(model_path)[0] + ".int8.json"
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _check_int8_gate(model_path: str):
+    """
+    ไม่ยอมโหลด INT8 ที่ไม่มีผล gate / agreement ต่ำกว่าเกณฑ์ปัจจุบัน
+    / ไฟล์ไม่ตรงกับ sha256 ใน report (report เก่าของไฟล์อื่น หรือไฟล์ที่ copy มาเอง)
+    """
+    int8_path = int8_path_for(model_path)
+    report_path = int8_report_path_for(model_path)
+    if not os.path.exists(int8_path) or not os.path.exists(report_path):
+        raise FileNotFoundError(f"INT8 model not found: {int8_path} (รัน python quantize.py ก่อน)")
+
+    with open(report_path, "r", encoding="utf-8") as f:
+        report = json.load(f)
+
+    agreement = float(report.get("agreement", 0.0))
+    if agreement < INT8_MIN_AGREEMENT:
+        raise ValueError(f"INT8 model refused: agreement {agreement:.4f} < {INT8_MIN_AGREEMENT:.4f}")
+    if report.get("sha256") != file_sha256(int8_path):
+        raise ValueError(f"INT8 model refused: {int8_path} ไม่ตรงกับ {report_path} (รัน python quantize.py ใหม่)")
+    return int8_path
+
+
+def cpu_cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _rss_mb() -> float:
+    """RSS ปัจจุบันของ process (Linux: /proc/self/statm)"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return 0.0
+
+
+def _set_torch_threads(threads: int):
+    # torch ตั้ง intra-op threads ได้แค่ทั้ง process (ทุก replica ใช้ค่าเดียวกัน)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def _import_backend(backend: str):
+    """import library ของ backend ให้เสร็จก่อนวัด RSS (ไม่ให้ขนาด import ปนเป็นขนาดของ replica)"""
+    try:
+        if backend == "torch":
+            import torch  # noqa: F401
+            import ultralytics  # noqa: F401
+        elif backend in ("onnx", "onnx-int8"):
+            import onnx_backend  # noqa: F401
+            import onnxruntime  # noqa: F401
+    except ImportError:
+        pass  # ให้ _load แจ้ง error เอง
+
+
+def _load(model_path: str, backend: str, threads: int = None):
+    if backend == "onnx":
+        from onnx_backend import ONNX_THREADS, OnnxYOLO, export_onnx
+        return OnnxYOLO(export_onnx(model_path), threads or ONNX_THREADS)
+
+    if backend == "onnx-int8":
+        from onnx_backend import ONNX_THREADS, OnnxYOLO
+        return OnnxYOLO(_check_int8_gate(model_path), threads or ONNX_THREADS)
+
+    if backend == "remote":
+        from infer_server import RemoteModel
+        return RemoteModel()
+
+    from ultralytics import YOLO
+    if threads:
+        _set_torch_threads(threads)
+    return YOLO(model_path)
+
+
+class ModelPool:
+    """
+    N replica ของ model ; predict() ยืม replica ว่าง 1 ตัว (รอถ้าไม่ว่าง) แล้วคืนเมื่อเสร็จ
+    ใช้แทน model เดี่ยวได้เลย (API predict เหมือนเดิม)
+    """
+
+    def __init__(self, replicas, threads_per_replica: int, replica_mb: float = None):
+        self.replicas = list(replicas)
+        self.size = len(self.replicas)
+        self.threads_per_replica = threads_per_replica
+        self.replica_mb = replica_mb
+        self._free = queue.LifoQueue()  # ใช้ replica ที่เพิ่งคืน (cache อุ่นกว่า)
+        for m in self.replicas:
+            self._free.put(m)
+        self._stats_lock = threading.Lock()
+        self._checkouts = 0
+        self._waits = deque(maxlen=4096)
+
+    def checkout(self, timeout: float = None):
+        t0 = time.perf_counter()
+        model = self._free.get(timeout=timeout)
+        with self._stats_lock:
+            self._checkouts += 1
+            self._waits.append((time.perf_counter() - t0) * 1000)
+        return model
+
+    def checkin(self, model):
+        self._free.put(model)
+
+    def predict(self, source, **kwargs):
+        model = self.checkout()
+        try:
+            return model.predict(source=source, **kwargs)
+        finally:
+            self.checkin(model)
+
+    def stats(self):
+        with self._stats_lock:
+            waits = sorted(self._waits)
+            return {
+                "replicas": self.size,
+                "threads_per_replica": self.threads_per_replica,
+                "replica_mb": self.replica_mb,
+                "in_use": self.size - self._free.qsize(),
+                "checkouts": self._checkouts,
+                "wait_ms_p95": waits[int(0.95 * (len(waits) - 1))] if waits else 0.0,
+            }
+
+
+def load_pool(model_path: str, backend: str, replicas: int = None, memory_budget_mb: float = None):
+    """
+    โหลด replica แรกเพื่อวัดหน่วยความจำต่อ replica แล้วคำนวณ N ที่พอดี budget
+    (N ไม่เกินจำนวนที่ขอ ; threads ต่อ replica = cores // N ; ขอ 1 replica -> threads ค่าเดิมของ backend = None)
+    N ลดลงเพราะ budget -> threads เปลี่ยน -> ทิ้ง replica แรก แล้วสร้างทุกตัวด้วย threads ค่าสุดท้าย
+    """
+    cores = cpu_cores()
+    want = MODEL_REPLICAS if replicas is None else replicas
+    want = cores if want <= 0 else want
+    budget = MODEL_MEMORY_BUDGET_MB if memory_budget_mb is None else memory_budget_mb
+
+    _import_backend(backend)
+    threads = max(1, cores // want) if want > 1 else None
+    rss0 = _rss_mb()
+    first = _load(model_path, backend, threads)
+    replica_mb = max(_rss_mb() - rss0, 1.0)
+
+    n = want
+    if budget > 0:
+        n = max(1, min(want, int(budget // replica_mb)))
+    if n != want:
+        first = None  # สร้างด้วย threads เก่า (onnx ตั้งต่อ session) -> สร้างใหม่ทั้งหมด
+        threads = max(1, cores // n)
+        if backend == "torch":
+            _set_torch_threads(threads)
+
+    models = [first] if first is not None else []
+    models += [_load(model_path, backend, threads) for _ in range(n - len(models))]
+    print(f"[MODEL] pool: {n} replicas x {threads or 'default'} threads (~{replica_mb:.0f} MB/replica, cores={cores})")
+    return ModelPool(models, threads, replica_mb)
+
+
+def get_model(model_path: str, backend: str = None):
     """
     โหลด YOLO model แบบ singleton ต่อ process
     - ถ้าเรียกซ้ำด้วย model_path เดิม -> ได้ instance เดิมกลับ
+    - backend: torch / onnx / onnx-int8 / remote (default จาก env MODEL_BACKEND)
     """
     model_path = model_path.strip()
     if not model_path:
         raise ValueError("MODEL_PATH is empty")
 
-    # กัน path ผิดแบบเงียบ
-    if not os.path.exists(model_path):
+    backend = (backend or MODEL_BACKEND).strip().lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown MODEL_BACKEND: {backend} (รองรับ: {', '.join(BACKENDS)})")
+
+    # กัน path ผิดแบบเงียบ (remote: weights อยู่ฝั่ง daemon)
+    if backend != "remote" and not os.path.exists(model_path):
         raise FileNotFoundError(f"YOLO model not found: {model_path}")
 
+    key = (backend, model_path)
+    with _lock:
+        if key not in _models:
+            print(f"[MODEL] Loading YOLO once: {model_path} (backend={backend})")
+            set_model_state("loading", backend=backend, path=model_path, error=None)
+            t0 = time.perf_counter()
+            try:
+                if backend != "remote":
+                    # pool เสมอ (แม้ 1 replica) : predict ไม่ thread-safe ต้องไม่ถูกเรียกพร้อมกัน
+                    model = load_pool(model_path, backend)
+                else:
+                    model = _load(model_path, backend)
+                if BATCH_WINDOW_MS > 0 and backend != "remote":
+                    # pool: batch หลายชุดรันพร้อมกันได้เท่าจำนวน replica
+                    workers = model.size if isinstance(model, ModelPool) else 1
+                    model = MicroBatcher(model, BATCH_WINDOW_MS, BATCH_MAX, name=backend, workers=workers)
+                _models[key] = model
+            except Exception as e:
+                set_model_state("error", error=f"{type(e).__name__}: {e}")
+                raise
+            set_model_state("loaded", load_ms=round((time.perf_counter() - t0) * 1000, 1))
+        return _models[key]
+
+
+def set_model_state(state: str, **fields):
+    MODEL_STATE.update(fields, state=state)
+
+
+def model_state():
+    return dict(MODEL_STATE)
+
+
+def pool_stats():
+    """stats ของ replica pool (ว่างถ้าใช้ backend remote)"""
+    with _lock:
+        models = list(_models.values())
+    pools = [m.model if isinstance(m, MicroBatcher) else m for m in models]
+    return [p.stats() for p in pools if isinstance(p, ModelPool)]
+
+
+def batcher_stats():
+    """stats ของทุก model ที่ห่อด้วย MicroBatcher (ว่างถ้าปิด batching)"""
     with _lock:
-        if model_path not in _models:
-            print(f"[MODEL] Loading YOLO once: {model_path}")
-            _models[model_path] = YOLO(model_path)
-        return _models[model_path]
+        models = list(_models.values())
+    return [m.stats() for m in models if isinstance(m, MicroBatcher)]
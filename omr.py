@@ -0,0 +1,577 @@
+# omr.py
+"""
+OMR engine เดียวสำหรับทุก layout (60/80/... ข้อ)
+layout มาจาก layouts.get_layout(num_questions) ; ทุก layout ใช้ model ตัวเดียวกัน
+"""
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+import bubble_reader
+import layouts
+import patch_classifier
+import roi_tiles
+from model_loader import DEFAULT_MODEL_PATH, get_model, set_model_state
+from slot_index import answers_from_matrix, build_conf_matrix
+
+# =====================================
+# CONFIG
+# =====================================
+
+MODEL_PATH = DEFAULT_MODEL_PATH
+CONF_THRES = 0.10
+
+# engine อ่านคำตอบเริ่มต้น (เลือกต่อ request ได้): yolo | fill | patch | cascade | tiled
+DEFAULT_ENGINE = os.getenv("OMR_ENGINE", "yolo").strip().lower()
+
+# จำนวนแผ่นสูงสุดต่อการเรียก model.predict หนึ่งครั้ง (process_batch)
+PREDICT_BATCH = int(os.getenv("PREDICT_BATCH", "16"))
+
+# cascade: pass แรกความละเอียดต่ำทั้งแผ่น -> pass สองเฉพาะข้อที่ไม่ชัดแบบ crop ความละเอียดสูง
+CASCADE_LOW_IMGSZ = int(os.getenv("CASCADE_LOW_IMGSZ", "512"))
+CASCADE_HIGH_IMGSZ = int(os.getenv("CASCADE_HIGH_IMGSZ", "1280"))   # baseline "high-res ทั้งแผ่น"
+CASCADE_CROP_IMGSZ = int(os.getenv("CASCADE_CROP_IMGSZ", "416"))
+CASCADE_MARGIN = float(os.getenv("CASCADE_MARGIN", "0.15"))          # conf < CONF_THRES + margin = ไม่ชัด
+CASCADE_PAD = 40                                                     # px รอบกรอบของข้อ
+CASCADE_MAX_CROPS = int(os.getenv("CASCADE_MAX_CROPS", "24"))        # เกินนี้ -> high-res ทั้งแผ่นแทน
+CASCADE_BASELINE_EVERY = int(os.getenv("CASCADE_BASELINE_EVERY", "0"))  # วัด high-res จริงใน request ทุก N แผ่น (0 = ปิด ; ใช้ bench.py cascade แทน)
+
+# process_sheet (yolo): warp จากรูปถ่ายตรงไปที่ความละเอียด inference (ด้านยาว = DIRECT_IMGSZ)
+DIRECT_IMGSZ = int(os.getenv("DIRECT_IMGSZ", "640"))
+
+# ถ้าไม่กรอกเฉลย จะใช้ตัวนี้แทน
+ANSWER_KEY_DEFAULT = {
+    # 1: "A",
+}
+
+# engine ที่ใช้ warmup ตอน start (นอกจาก yolo)
+WARMUP_ENGINE = os.getenv("WARMUP_ENGINE", DEFAULT_ENGINE).strip().lower()
+
+# ✅ shared model: โหลดครั้งแรกที่ต้องใช้ (หรือใน warmup ตอน start) ไม่โหลดตอน import
+def load_model():
+    return get_model(MODEL_PATH)
+
+def __getattr__(name):
+    # โค้ดเดิมที่อ้าง omr.model ยังใช้ได้
+    if name == "model":
+        return load_model()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+get_layout = layouts.get_layout
+available_layouts = layouts.available_layouts
+
+# =====================================
+# YOLO → ANSWERS
+# =====================================
+
+def read_answers_from_image_bgr(
+    img_bgr,
+    layout,
+    conf_thres: float = CONF_THRES,
+    draw_template_points: bool = True
+):
+    results = load_model().predict(source=img_bgr, conf=conf_thres, verbose=False)
+    det = results[0]
+
+    boxes = det.boxes.xyxy.cpu().numpy()
+    confs = det.boxes.conf.cpu().numpy()
+    print(f"{layout.tag} YOLO marks: {len(boxes)}")
+
+    return answers_from_detections(
+        img_bgr, boxes, confs, layout,
+        draw_template_points=draw_template_points,
+    )
+
+def conf_matrix_from_detections(boxes, confs, layout):
+    """กล่อง YOLO -> (matrix ข้อ x ตัวเลือก ของ conf สูงสุด, จุดกึ่งกลางกล่อง, slot ที่จับคู่ได้)"""
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    centers = (boxes[:, :2] + boxes[:, 2:]) / 2.0
+    slot_pos = layout.index.assign(centers)
+
+    conf_mat = build_conf_matrix(
+        slot_pos, confs, layout.slot_q, layout.slot_opt, layout.num_questions, layout.num_options
+    )
+    return conf_mat, centers, slot_pos
+
+def answers_from_detections(
+    img_bgr,
+    boxes,
+    confs,
+    layout,
+    draw_template_points: bool = True
+):
+    """กล่อง YOLO (xyxy, conf) -> answers + debug image (ใช้ร่วมกันทั้ง single/batch)"""
+    conf_mat, centers, slot_pos = conf_matrix_from_detections(boxes, confs, layout)
+    answers = answers_from_matrix(conf_mat, layout.options)
+
+    return answers, draw_detections(img_bgr, centers, slot_pos, confs, layout, draw_template_points)
+
+def draw_detections(img_bgr, centers, slot_pos, confs, layout, draw_template_points: bool = True):
+    """debug image: จุด template + ป้าย "ข้อ+ตัวเลือก conf" (พิกัด template ; รูปขนาดอื่นจะถูก scale ให้)"""
+    debug_img = img_bgr.copy()
+    sx, sy, font, thick, radius = layouts.overlay_scale(img_bgr)
+
+    # debug: วาด template ทุกจุด (เปิด/ปิดได้)
+    if draw_template_points:
+        for x, y in layout.slot_xy:
+            cv2.circle(debug_img, (int(x * sx), int(y * sy)), radius, (255, 100, 0), -1)
+
+    for (xc, yc), pos, conf in zip(centers, slot_pos, confs):
+        if pos < 0 or layout.slot_q[pos] < 0:
+            continue
+        cv2.putText(
+            debug_img,
+            f"{layout.slot_q[pos] + 1}{layout.options[layout.slot_opt[pos]]} {float(conf):.2f}",
+            (int(xc * sx), int(yc * sy)),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            font,
+            (0, 255, 255),
+            thick,
+        )
+
+    return debug_img
+
+# =====================================
+# CASCADE (coarse -> fine)
+# =====================================
+
+_cascade_lock = threading.Lock()
+CASCADE_STATS = {
+    "sheets": 0,            # แผ่นที่ผ่าน cascade
+    "stage2_sheets": 0,     # แผ่นที่ต้องรัน pass สอง
+    "stage2_questions": 0,  # จำนวนข้อที่ส่งไป pass สอง
+    "stage2_full": 0,       # แผ่นที่ข้อไม่ชัดเยอะเกินจนต้องรัน high-res ทั้งแผ่น
+    "cascade_ms": 0.0,      # เวลารวมของ cascade
+    "high_res_ms_ema": None,  # เวลาเฉลี่ยของ high-res ทั้งแผ่น (วัดจริงเป็นระยะ)
+}
+
+def _predict_boxes(sources, conf_thres: float, imgsz: int):
+    results = load_model().predict(source=sources, conf=conf_thres, imgsz=imgsz, verbose=False)
+    return [(r.boxes.xyxy.cpu().numpy(), r.boxes.conf.cpu().numpy()) for r in results]
+
+def uncertain_questions(conf_mat, conf_thres: float = CONF_THRES, margin: float = CASCADE_MARGIN, questions=None):
+    """
+    ข้อ (0-based) ที่ไม่มีรอย / ฝนเกิน (MULTI) / มีรอยเดียวแต่ conf ใกล้ threshold
+    questions: ข้อ (1-based) ที่มีในเฉลย -> ไม่นับข้อนอกเฉลย (ข้อที่ไม่ได้ใช้ว่างเป็นปกติ) ; None = ทุกข้อ
+    """
+    n = (conf_mat > 0).sum(axis=1)
+    weak = (n == 1) & (conf_mat.max(axis=1) < conf_thres + margin)
+    flag = (n != 1) | weak
+    if questions is not None:
+        q = np.fromiter(questions, dtype=np.int64) - 1
+        keyed = np.zeros(len(flag), dtype=bool)
+        keyed[q[(q >= 0) & (q < len(flag))]] = True
+        flag &= keyed
+    return np.flatnonzero(flag)
+
+def cascade_stats():
+    with _cascade_lock:
+        st = dict(CASCADE_STATS)
+    ema = st["high_res_ms_ema"]
+    st["stage2_rate"] = (st["stage2_sheets"] / st["sheets"]) if st["sheets"] else 0.0
+    st["saved_ms"] = (ema * st["sheets"] - st["cascade_ms"]) if ema is not None else None
+    return st
+
+def read_answers_cascade(
+    img_bgr,
+    layout,
+    conf_thres: float = CONF_THRES,
+    draw_template_points: bool = True,
+    questions=None
+):
+    t0 = time.perf_counter()
+    boxes, confs = _predict_boxes(img_bgr, conf_thres, CASCADE_LOW_IMGSZ)[0]
+    conf_mat, centers, slot_pos = conf_matrix_from_detections(boxes, confs, layout)
+    flagged = uncertain_questions(conf_mat, conf_thres, questions=questions)
+
+    full = len(flagged) > CASCADE_MAX_CROPS
+    if full:
+        boxes, confs = _predict_boxes(img_bgr, conf_thres, CASCADE_HIGH_IMGSZ)[0]
+    elif len(flagged):
+        # เก็บกล่องของข้อที่ชัดแล้วจาก pass แรก แทนข้อที่ไม่ชัดด้วยผลจาก crop
+        keep = (slot_pos < 0) | ~np.isin(np.where(slot_pos >= 0, layout.slot_q[slot_pos], -1), flagged)
+        new_boxes, new_confs = [boxes[keep]], [confs[keep]]
+
+        h, w = img_bgr.shape[:2]
+        regions = layout.question_bounds[flagged] + np.array([-1, -1, 1, 1], np.float32) * CASCADE_PAD
+        regions = np.clip(np.round(regions), 0, [w, h, w, h]).astype(int)
+        crops = [img_bgr[y0:y1, x0:x1] for x0, y0, x1, y1 in regions]
+
+        for q, (x0, y0, _, _), (b, c) in zip(flagged, regions, _predict_boxes(crops, conf_thres, CASCADE_CROP_IMGSZ)):
+            b = b + np.array([x0, y0, x0, y0], np.float32)
+            pos = layout.index.assign((b[:, :2] + b[:, 2:]) / 2.0)
+            own = (pos >= 0) & (layout.slot_q[np.maximum(pos, 0)] == q)
+            new_boxes.append(b[own])
+            new_confs.append(c[own])
+
+        boxes, confs = np.concatenate(new_boxes), np.concatenate(new_confs)
+    dt_ms = (time.perf_counter() - t0) * 1000
+
+    with _cascade_lock:
+        st = CASCADE_STATS
+        st["sheets"] += 1
+        st["cascade_ms"] += dt_ms
+        if len(flagged):
+            st["stage2_sheets"] += 1
+            st["stage2_questions"] += int(len(flagged))
+        if full:
+            st["stage2_full"] += 1
+        sample = CASCADE_BASELINE_EVERY > 0 and (st["high_res_ms_ema"] is None or st["sheets"] % CASCADE_BASELINE_EVERY == 0)
+
+    if sample:
+        t1 = time.perf_counter()
+        _predict_boxes(img_bgr, conf_thres, CASCADE_HIGH_IMGSZ)
+        hi_ms = (time.perf_counter() - t1) * 1000
+        with _cascade_lock:
+            ema = CASCADE_STATS["high_res_ms_ema"]
+            CASCADE_STATS["high_res_ms_ema"] = hi_ms if ema is None else 0.8 * ema + 0.2 * hi_ms
+
+    print(f"{layout.tag} CASCADE marks: {len(boxes)} | stage2 questions={len(flagged)}{' (full)' if full else ''} | {dt_ms:.0f} ms")
+    return answers_from_detections(img_bgr, boxes, confs, layout, draw_template_points=draw_template_points)
+
+# =====================================
+# ROI TILES (เฉพาะพื้นที่คำตอบ)
+# =====================================
+
+def read_answers_tiled(
+    img_bgr,
+    layout,
+    conf_thres: float = CONF_THRES,
+    draw_template_points: bool = True
+):
+    plan = roi_tiles.plan_tiles(layout, img_bgr.shape)
+    tiles = roi_tiles.crop_tiles(img_bgr, plan)
+    dets = _predict_boxes(tiles, conf_thres, roi_tiles.TILE_SIZE)
+    boxes, confs = roi_tiles.stitch(dets, plan)
+
+    print(f"{layout.tag} TILED marks: {len(boxes)} | tiles={len(plan)}")
+    return answers_from_detections(img_bgr, boxes, confs, layout, draw_template_points=draw_template_points)
+
+# =====================================
+# ENGINES
+# =====================================
+
+# ทุก engine: (img_bgr, layout, draw_template_points=...) -> (answers, debug_img)
+ENGINES = {
+    "yolo": read_answers_from_image_bgr,
+    "fill": bubble_reader.read_answers_fill,
+    "cascade": read_answers_cascade,
+    "tiled": read_answers_tiled,
+}
+
+# engine ที่ต้องมี weights แยก : เปิดเฉพาะเมื่อโหลดได้ตอน start
+# ปิดอยู่ -> request ที่ขอได้ DEFAULT_ENGINE แทน (resolve_engine) ; get_engine ตรง ๆ (bench) -> error
+DISABLED_ENGINES = {}
+
+try:
+    patch_classifier.load_model()
+    ENGINES["patch"] = patch_classifier.read_answers_patch
+except (OSError, ValueError, KeyError) as e:
+    DISABLED_ENGINES["patch"] = str(e)
+    print(f"[ENGINE] patch disabled: {e}")
+
+def resolve_engine(name: str = None) -> str:
+    """ชื่อ engine ที่จะใช้จริง (engine ที่ปิดไว้ -> DEFAULT_ENGINE)"""
+    name = (name or DEFAULT_ENGINE).strip().lower()
+    return DEFAULT_ENGINE if name in DISABLED_ENGINES else name
+
+def get_engine(name: str = None):
+    name = (name or DEFAULT_ENGINE).strip().lower()
+    if name in DISABLED_ENGINES:
+        raise ValueError(f"Engine {name} disabled: {DISABLED_ENGINES[name]}")
+    if name not in ENGINES:
+        raise ValueError(f"Unknown engine: {name} (รองรับ: {', '.join(ENGINES)})")
+    return ENGINES[name]
+
+# =====================================
+# WARMUP
+# =====================================
+
+_warmup_lock = threading.Lock()
+_warmup_thread = None
+
+def synthetic_sheet(layout, seed: int = 0):
+    """sheet ขาวขนาดมาตรฐาน วงกลม bubble ทุก slot + ฝนทึบข้อละหนึ่งช่อง (ใช้ warmup / bench)"""
+    rng = np.random.default_rng(seed)
+    img = np.full((layouts.SHEET_HEIGHT, layouts.SHEET_WIDTH, 3), 255, dtype=np.uint8)
+    for x, y in layout.slot_xy:
+        cv2.circle(img, (int(x), int(y)), 20, (90, 90, 90), 2)
+
+    marks = rng.integers(0, layout.num_options, size=layout.num_questions)
+    for q, o in enumerate(marks):
+        x, y = layout.slot_xy[(layout.slot_q == q) & (layout.slot_opt == o)][0]
+        cv2.circle(img, (int(x), int(y)), 17, (20, 20, 20), -1)
+    return img
+
+def warmup(num_questions: int = None):
+    """โหลด model + รัน inference บน sheet สังเคราะห์ก่อนรับ traffic (torch lazy init ไม่ตกไปที่ request แรก)"""
+    num_questions = num_questions or (available_layouts() or [60])[0]
+    try:
+        layout = get_layout(num_questions)
+        img = synthetic_sheet(layout)
+        load_model()
+
+        set_model_state("warming")
+        t0 = time.perf_counter()
+        for name in dict.fromkeys(("yolo", WARMUP_ENGINE)):
+            get_engine(name)(img, layout, draw_template_points=False)
+        warmup_ms = round((time.perf_counter() - t0) * 1000, 1)
+    except Exception as e:
+        set_model_state("error", error=f"{type(e).__name__}: {e}")
+        print(f"[WARMUP] failed: {e}")
+        return False
+
+    set_model_state("ready", warmup_ms=warmup_ms)
+    print(f"[WARMUP] ready ({layout.tag}, {warmup_ms:.0f} ms)")
+    return True
+
+def start_warmup(num_questions: int = None):
+    """รัน warmup ใน background thread (เรียกซ้ำได้ จะรันแค่ครั้งเดียว)"""
+    global _warmup_thread
+    with _warmup_lock:
+        if _warmup_thread is None:
+            _warmup_thread = threading.Thread(target=warmup, args=(num_questions,), name="omr-warmup", daemon=True)
+            _warmup_thread.start()
+        return _warmup_thread
+
+# =====================================
+# GRADING
+# =====================================
+
+def grade_answers(answers: dict, answer_key: dict):
+    correct = 0
+    total = 0
+    detail = {}
+    blank = 0
+    multi = 0
+    wrong = 0
+
+    for q in sorted(answers):
+        correct_opt = answer_key.get(q)
+        if correct_opt is None:
+            continue
+
+        total += 1
+        stu_ans = answers.get(q)
+
+        if stu_ans is None:
+            detail[q] = ("-", None, correct_opt)
+            blank += 1
+        elif stu_ans == "MULTI":
+            detail[q] = ("M", stu_ans, correct_opt)
+            multi += 1
+        elif stu_ans == correct_opt:
+            detail[q] = ("✔", stu_ans, correct_opt)
+            correct += 1
+        else:
+            detail[q] = ("✘", stu_ans, correct_opt)
+            wrong += 1
+
+    stats = {"correct": correct, "wrong": wrong, "blank": blank, "multi": multi, "total": total}
+    return correct, total, detail, stats
+
+def parse_answer_key_string(s: str, layout):
+    s_clean = "".join(ch.upper() for ch in s if ch.upper() in layout.options)
+    key = {}
+    for i, ch in enumerate(s_clean, start=1):
+        if i > layout.num_questions:
+            break
+        key[i] = ch
+    return key
+
+def summarize_answers(answers: dict, effective_key: dict):
+    if effective_key:
+        _, _, detail, stats = grade_answers(answers, effective_key)
+    else:
+        blank = sum(1 for v in answers.values() if v is None)
+        multi = sum(1 for v in answers.values() if v == "MULTI")
+        answered = len(answers) - blank
+        stats = {"correct": 0, "wrong": 0, "blank": blank, "multi": multi, "total": answered}
+        detail = {}
+    return detail, stats
+
+# =====================================
+# คำตอบแบบ packed (เก็บใน db.graded_sheets) + ตรวจใหม่ทั้งชุด
+# =====================================
+PACK_BLANK = "-"
+PACK_MULTI = "*"
+
+def pack_answers(answers: dict, num_questions: int) -> str:
+    """{q: "A".. | None | "MULTI"} -> 1 ตัวอักษรต่อข้อ ("-" = ไม่ฝน, "*" = ฝนหลายช่อง)"""
+    out = []
+    for q in range(1, num_questions + 1):
+        v = answers.get(q)
+        out.append(PACK_BLANK if v is None else PACK_MULTI if v == "MULTI" else str(v)[:1])
+    return "".join(out)
+
+def unpack_answers(packed: str) -> dict:
+    return {
+        q: None if ch == PACK_BLANK else "MULTI" if ch == PACK_MULTI else ch
+        for q, ch in enumerate(packed, start=1)
+    }
+
+def regrade_packed(packed_list, answer_key_str: str, layout):
+    """
+    ตรวจคำตอบ packed หลายแผ่นกับเฉลยเดียว (numpy ทีเดียวทั้งชุด ไม่ต้อง inference)
+    -> correct/wrong/blank/multi (array ยาว N), total (จำนวนข้อที่มีเฉลย), per_question (จำนวนแผ่นที่ตอบถูกรายข้อ)
+    ผลตรงกับ grade_answers(unpack_answers(p), key) ทีละแผ่น
+    """
+    nq = layout.num_questions
+    k = np.zeros(nq, np.uint8)
+    for q, ch in parse_answer_key_string(answer_key_str or "", layout).items():
+        k[q - 1] = ord(ch)
+    keyed = k > 0
+
+    buf = "".join(p[:nq].ljust(nq, PACK_BLANK) for p in packed_list).encode("ascii", "replace")
+    a = np.frombuffer(buf, np.uint8).reshape(len(packed_list), nq)
+
+    hit = (a == k) & keyed
+    correct = hit.sum(axis=1)
+    blank = ((a == ord(PACK_BLANK)) & keyed).sum(axis=1)
+    multi = ((a == ord(PACK_MULTI)) & keyed).sum(axis=1)
+    total = int(keyed.sum())
+    return {
+        "correct": correct,
+        "wrong": total - correct - blank - multi,
+        "blank": blank,
+        "multi": multi,
+        "total": total,
+        "per_question": hit.sum(axis=0),
+    }
+
+# =====================================
+# MAIN ENTRY สำหรับ app.py
+# =====================================
+
+def process_auto(img_bgr, answer_key_str: str, num_questions: int = 60, engine: str = None):
+    layout = get_layout(num_questions)
+    effective_key = parse_answer_key_string(answer_key_str, layout) if answer_key_str else ANSWER_KEY_DEFAULT
+
+    read = get_engine(engine)
+    if read is read_answers_cascade:
+        # pass สองดูเฉพาะข้อในเฉลย (ไม่มีเฉลย = ทุกข้อ)
+        answers, debug_img = read(img_bgr, layout, questions=list(effective_key) or None)
+    else:
+        answers, debug_img = read(img_bgr, layout)
+
+    detail, stats = summarize_answers(answers, effective_key)
+
+    return answers, effective_key, detail, stats, debug_img
+
+def direct_size(imgsz: int = DIRECT_IMGSZ):
+    """ขนาด (w, h) ของ sheet ที่ด้านยาว = imgsz (เท่ากับที่ YOLO letterbox sheet เต็มลงมา)"""
+    r = imgsz / float(max(layouts.SHEET_WIDTH, layouts.SHEET_HEIGHT))
+    return int(round(layouts.SHEET_WIDTH * r)), int(round(layouts.SHEET_HEIGHT * r))
+
+def process_sheet(geom, answer_key_str: str, num_questions: int = 60, engine: str = None,
+                  debug=True, conf_thres: float = CONF_THRES):
+    """
+    ตรวจจากรูปถ่าย + มุมที่หาเจอ (utils.detect_sheet) แทน process_auto(auto_detect_and_warp(...))
+    - yolo: warp ครั้งเดียวตรงไปขนาด inference แล้วแปลงกล่องกลับเป็นพิกัด template
+    - engine อื่นใช้ sheet ความละเอียดเต็มอยู่แล้ว -> warp เต็มแล้ว process_auto
+    debug: True = debug_img เต็มขนาด | False = None | "lazy" = Overlay (warp / วาด / marks เมื่อถูกขอ)
+    """
+    if (engine or DEFAULT_ENGINE) != "yolo":
+        return process_auto(geom.warp(), answer_key_str, num_questions, engine)
+
+    layout = get_layout(num_questions)
+    size = direct_size()
+    small = geom.warp(size)
+
+    boxes, confs = _predict_boxes(small, conf_thres, DIRECT_IMGSZ)[0]
+    boxes = boxes * np.array([layouts.SHEET_WIDTH / size[0], layouts.SHEET_HEIGHT / size[1]] * 2, np.float32)
+    print(f"{layout.tag} YOLO marks: {len(boxes)} (direct {size[0]}x{size[1]})")
+
+    conf_mat, centers, slot_pos = conf_matrix_from_detections(boxes, confs, layout)
+    answers = answers_from_matrix(conf_mat, layout.options)
+    if debug == "lazy":
+        debug_img = Overlay(geom, centers, slot_pos, confs, layout)
+    elif debug:
+        debug_img = draw_detections(geom.warp(), centers, slot_pos, confs, layout)
+    else:
+        debug_img = None
+
+    effective_key = parse_answer_key_string(answer_key_str, layout) if answer_key_str else ANSWER_KEY_DEFAULT
+    detail, stats = summarize_answers(answers, effective_key)
+    return answers, effective_key, detail, stats, debug_img
+
+class Overlay:
+    """
+    debug overlay แบบ lazy (เก็บใน results cache) ; ถือไว้แค่รูปย่อที่ใช้หามุม ไม่ถือรูปเต็ม
+    - sheet(width): sheet เปล่าที่ warp ตรงไปความกว้างที่ขอ (browser วาดรอยเองจาก marks())
+    - overlay(width): sheet + จุด template + ป้ายรอยฝน วาดฝั่ง server (สำรองเมื่อไม่มี canvas)
+    """
+
+    def __init__(self, geom, centers, slot_pos, confs, layout):
+        self.geom = geom.downsized()
+        self.centers = centers
+        self.slot_pos = slot_pos
+        self.confs = confs
+        self.layout = layout
+
+    def sheet(self, width: int = layouts.SHEET_WIDTH):
+        height = int(round(width * layouts.SHEET_HEIGHT / float(layouts.SHEET_WIDTH)))
+        return self.geom.warp((int(width), height))
+
+    def __call__(self, width: int = layouts.SHEET_WIDTH):
+        return draw_detections(self.sheet(width), self.centers, self.slot_pos, self.confs, self.layout)
+
+    def marks(self):
+        return marks_payload(self.centers, self.slot_pos, self.confs, self.layout)
+
+def marks_payload(centers, slot_pos, confs, layout):
+    """
+    ข้อมูลวาด overlay ฝั่ง browser (ขนาดเล็ก, พิกัด template เป็น int):
+    slots = [x0, y0, x1, y1, ...] ; marks = [[x, y, ข้อ (0-based), ตัวเลือก, conf x100], ...]
+    """
+    keep = (slot_pos >= 0) & (layout.slot_q[np.maximum(slot_pos, 0)] >= 0)
+    pos = slot_pos[keep]
+    xy = np.round(np.asarray(centers)[keep]).astype(int)
+    conf = np.round(np.asarray(confs, np.float32)[keep] * 100).astype(int)
+    return {
+        "w": layouts.SHEET_WIDTH,
+        "h": layouts.SHEET_HEIGHT,
+        "opts": "".join(layout.options),
+        "slots": np.round(layout.slot_xy).astype(int).ravel().tolist(),
+        "marks": [
+            [int(x), int(y), int(layout.slot_q[p]), int(layout.slot_opt[p]), int(c)]
+            for (x, y), p, c in zip(xy, pos, conf)
+        ],
+    }
+
+def process_batch(images, answer_key_str: str, num_questions: int = 60, conf_thres: float = CONF_THRES,
+                  engine: str = None):
+    """
+    ตรวจหลายแผ่นพร้อมกัน: ส่งรูปที่ warp แล้วทั้งชุดเข้า model.predict ทีละ batch
+    คืนค่า list ของ (answers, effective_key, detail, stats, debug_img) เรียงตาม images
+    (engine อื่นที่ไม่ใช่ yolo ไม่มี batch จริง จะตรวจทีละแผ่น)
+    """
+    images = list(images)
+    if not images:
+        return []
+
+    if (engine or DEFAULT_ENGINE) != "yolo":
+        return [process_auto(img, answer_key_str, num_questions, engine) for img in images]
+
+    layout = get_layout(num_questions)
+    effective_key = parse_answer_key_string(answer_key_str, layout) if answer_key_str else ANSWER_KEY_DEFAULT
+
+    t0 = time.perf_counter()
+    out = []
+    for start in range(0, len(images), PREDICT_BATCH):
+        chunk = images[start:start + PREDICT_BATCH]
+        results = load_model().predict(source=chunk, conf=conf_thres, verbose=False)
+
+        for img_bgr, det in zip(chunk, results):
+            boxes = det.boxes.xyxy.cpu().numpy()
+            confs = det.boxes.conf.cpu().numpy()
+            answers, debug_img = answers_from_detections(img_bgr, boxes, confs, layout)
+            detail, stats = summarize_answers(answers, effective_key)
+            out.append((answers, effective_key, detail, stats, debug_img))
+
+    dt = time.perf_counter() - t0
+    print(f"{layout.tag} Batch: {len(images)} sheets in {dt * 1000:.0f} ms ({len(images) / dt:.2f} sheets/s)")
+    return out
@@ -0,0 +1,86 @@
+# onnx_backend.py
+"""
+YOLO บน onnxruntime (CPU) แทน ultralytics/torch
+- export .pt -> .onnx ครั้งแรก แล้ว cache ไว้ข้างไฟล์ weights
+- predict() คืนผลหน้าตาเดียวกับ ultralytics (ดู yolo_ops.Results)
+"""
+import os
+
+import numpy as np
+
+import yolo_ops
+
+ONNX_IMGSZ = int(os.getenv("ONNX_IMGSZ", "640"))
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))  # 0 = ให้ onnxruntime เลือกเอง
+NMS_IOU = float(os.getenv("NMS_IOU", "0.7"))
+
+
+def onnx_path_for(model_path: str) -> str:
+    return os.path.splitext(model_path)[0] + ".onnx"
+
+
+def export_onnx(model_path: str, imgsz: int = ONNX_IMGSZ) -> str:
+    """
+    export bestX.pt -> bestX.onnx (ข้างไฟล์เดิม)
+    - ถ้ามี .onnx ที่ใหม่กว่า .pt อยู่แล้ว ใช้ของเดิม
+    - dynamic=True เพื่อให้ส่ง batch / imgsz อื่นได้
+    """
+    out_path = onnx_path_for(model_path)
+    if os.path.exists(out_path) and os.path.getmtime(out_path) >= os.path.getmtime(model_path):
+        return out_path
+
+    from ultralytics import YOLO
+
+    print(f"[MODEL] Exporting ONNX: {model_path} -> {out_path}")
+    exported = YOLO(model_path).export(format="onnx", imgsz=imgsz, dynamic=True, simplify=False, verbose=False)
+    exported = str(exported)
+    if os.path.abspath(exported) != os.path.abspath(out_path):
+        os.replace(exported, out_path)
+    return out_path
+
+
+class OnnxYOLO:
+    """ตัวแทน ultralytics.YOLO สำหรับ predict อย่างเดียว"""
+
+    def __init__(self, onnx_path: str, intra_op_threads: int = ONNX_THREADS):
+        import onnxruntime as ort
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads > 0:
+            opts.intra_op_num_threads = intra_op_threads
+
+        self.path = onnx_path
+        self.session = ort.InferenceSession(onnx_path, sess_options=opts, providers=["CPUExecutionProvider"])
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+
+        # input แบบ fixed (เช่น [1,3,640,640]) ต้องส่งทีละรูป / ขนาดตามที่ export
+        b, _, h, _ = inp.shape
+        self.fixed_batch = b if isinstance(b, int) else None
+        self.fixed_imgsz = h if isinstance(h, int) else None
+
+    def predict(self, source, conf: float = 0.25, iou: float = NMS_IOU, imgsz: int = ONNX_IMGSZ,
+                max_det: int = 300, verbose: bool = False, **_):
+        sources = source if isinstance(source, (list, tuple)) else [source]
+        if not sources:
+            return []
+        size = self.fixed_imgsz or int(imgsz)
+
+        prepped = [yolo_ops.letterbox(img, size) for img in sources]
+        blob = yolo_ops.to_blob([p[0] for p in prepped])
+
+        if self.fixed_batch and self.fixed_batch != len(sources):
+            preds = np.concatenate(
+                [self.session.run(None, {self.input_name: blob[i:i + 1]})[0] for i in range(len(sources))],
+                axis=0,
+            )
+        else:
+            preds = self.session.run(None, {self.input_name: blob})[0]
+
+        results = []
+        for img, (_, gain, pad), pred in zip(sources, prepped, preds):
+            xyxy, confs, cls = yolo_ops.postprocess(pred, conf, iou, max_det)
+            xyxy = yolo_ops.scale_boxes(xyxy, gain, pad, img.shape)
+            results.append(yolo_ops.Results(yolo_ops.Boxes(xyxy, confs, cls), img.shape))
+        return results
@@ -0,0 +1,105 @@
+# patch_classifier.py
+"""
+Engine จำแนก bubble ทีละช่องจาก crop เล็ก ๆ (ตำแหน่งตายตัวหลัง warp)
+
+- ตัดทุก slot ของ template ออกมาเป็น tensor (S, P, P) ทีเดียวด้วย numpy fancy indexing
+- logistic regression บน pixel ของ patch -> ความน่าจะเป็นว่าช่องนั้นถูกฝน
+- weights มาจาก train_patch_classifier.py (label จาก YOLO model ปัจจุบัน)
+"""
+import os
+import threading
+
+import cv2
+import numpy as np
+
+import layouts
+from bubble_reader import draw_marked
+from slot_index import answers_from_matrix
+
+PATCH_MODEL_PATH = os.getenv("PATCH_MODEL_PATH", "runs/patch/patch_lr.npz")
+PATCH_SIZE = 24          # ขนาด patch (px หลังย่อ)
+PATCH_SCALE = 0.5        # ย่อ sheet ก่อนตัด (patch 24px = 48px ที่ขนาด sheet เต็ม)
+PATCH_THRES = float(os.getenv("PATCH_THRES", "0.5"))
+
+_lock = threading.Lock()
+_model = None
+
+
+# =========================
+# Crops / features
+# =========================
+def extract_patches(img_bgr, layout, size: int = PATCH_SIZE, scale: float = PATCH_SCALE):
+    """sheet -> (S, size, size) uint8 gray ตามลำดับ slot ของ layout"""
+    gray = img_bgr if img_bgr.ndim == 2 else cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
+    h, w = gray.shape[:2]
+    sx = scale * layouts.SHEET_WIDTH / float(w)
+    sy = scale * layouts.SHEET_HEIGHT / float(h)
+    gray = cv2.resize(gray, (int(round(w * sx)), int(round(h * sy))), interpolation=cv2.INTER_AREA)
+
+    off = np.arange(size) - size // 2
+    cx = np.round(layout.slot_xy[:, 0] * scale).astype(np.int64)
+    cy = np.round(layout.slot_xy[:, 1] * scale).astype(np.int64)
+    xs = np.clip(cx[:, None] + off[None, :], 0, gray.shape[1] - 1)
+    ys = np.clip(cy[:, None] + off[None, :], 0, gray.shape[0] - 1)
+    return gray[ys[:, :, None], xs[:, None, :]]
+
+
+def patch_features(patches):
+    """(S,P,P) uint8 -> (S, P*P) float32 ; หมึก = ค่าบวก, ตัดผลของแสงทั้งแผ่นด้วย median"""
+    x = patches.reshape(len(patches), -1).astype(np.float32) / 255.0
+    return np.median(x) - x
+
+
+def sigmoid(z):
+    return 1.0 / (1.0 + np.exp(-np.clip(z, -30, 30)))
+
+
+# =========================
+# Model
+# =========================
+def save_model(path, w, b, meta=None):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    np.savez(path, w=np.asarray(w, np.float32), b=np.float32(b),
+             patch_size=PATCH_SIZE, patch_scale=PATCH_SCALE, **(meta or {}))
+
+
+def load_model(path: str = None):
+    """โหลด weights ครั้งเดียวต่อ process -> (w, b)"""
+    global _model
+    path = path or PATCH_MODEL_PATH
+    with _lock:
+        if _model is None or _model[0] != path:
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Patch model not found: {path} (รัน python train_patch_classifier.py ก่อน)")
+            data = np.load(path)
+            if int(data["patch_size"]) != PATCH_SIZE or float(data["patch_scale"]) != PATCH_SCALE:
+                raise ValueError(f"Patch model {path} ไม่ตรงกับ PATCH_SIZE/PATCH_SCALE ปัจจุบัน")
+            _model = (path, data["w"].astype(np.float32), float(data["b"]))
+            print(f"[PATCH] Loaded: {path}")
+        return _model[1], _model[2]
+
+
+def bubble_probabilities(img_bgr, layout):
+    """matrix (ข้อ x ตัวเลือก) ของความน่าจะเป็นว่าแต่ละ bubble ถูกฝน"""
+    w, b = load_model()
+    p = sigmoid(patch_features(extract_patches(img_bgr, layout)) @ w + b)
+
+    mat = np.zeros((layout.num_questions, layout.num_options), dtype=np.float32)
+    mapped = layout.slot_q >= 0
+    mat[layout.slot_q[mapped], layout.slot_opt[mapped]] = p[mapped]
+    return mat
+
+
+def read_answers_patch(
+    img_bgr,
+    layout,
+    prob_thres: float = PATCH_THRES,
+    draw_template_points: bool = True
+):
+    """หน้าตาเดียวกับ omr.read_answers_from_image_bgr -> (answers, debug_img)"""
+    probs = bubble_probabilities(img_bgr, layout)
+    marked = np.where(probs >= prob_thres, probs, 0.0)
+    answers = answers_from_matrix(marked, layout.options)
+    print(f"{layout.tag} PATCH marks: {int((marked > 0).sum())}")
+
+    return answers, draw_marked(img_bgr, layout, marked, draw_template_points)
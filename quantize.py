@@ -0,0 +1,139 @@
+# quantize.py
+"""
+สร้าง bestX.int8.onnx (INT8 static quantization) จาก bestX.pt
+
+ขั้นตอน:
+1) export .pt -> .onnx (FP32) ผ่าน onnx_backend.export_onnx
+2) calibrate ด้วยรูปกระดาษคำตอบที่ warp แล้ว (--calib)
+3) accuracy gate: เทียบคำตอบรายข้อของ INT8 กับ FP32 บน corpus (--corpus)
+   ถ้า agreement < --min-agreement จะไม่ยอมติดตั้งไฟล์ INT8 (exit code 1)
+
+ตัวอย่าง:
+    python quantize.py --calib sheets/calib --corpus sheets/eval --num-questions 60
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import datetime, timezone
+
+os.environ.setdefault("MODEL_BACKEND", "onnx")
+
+import bench  # noqa: E402
+import model_loader  # noqa: E402
+import onnx_backend  # noqa: E402
+import yolo_ops  # noqa: E402
+
+
+class SheetCalibrationReader:
+    """CalibrationDataReader ของ onnxruntime: ป้อนรูป sheet ทีละรูปแบบ letterbox"""
+
+    def __init__(self, sheets, input_name, imgsz):
+        self._items = iter(
+            {input_name: yolo_ops.to_blob([yolo_ops.letterbox(img, imgsz)[0]])}
+            for img in sheets
+        )
+
+    def get_next(self):
+        return next(self._items, None)
+
+
+def quantize(fp32_path, out_path, calib_sheets, imgsz=onnx_backend.ONNX_IMGSZ):
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_static
+    import onnxruntime as ort
+
+    input_name = ort.InferenceSession(fp32_path, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+    quantize_static(
+        fp32_path,
+        out_path,
+        SheetCalibrationReader(calib_sheets, input_name, imgsz),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+        calibrate_method=CalibrationMethod.MinMax,
+    )
+
+
+def read_answers(model, omr, layout, img):
+    det = model.predict(source=img, conf=omr.CONF_THRES, verbose=False)[0]
+    answers, _ = omr.answers_from_detections(
+        img, det.boxes.xyxy.cpu().numpy(), det.boxes.conf.cpu().numpy(),
+        layout, draw_template_points=False,
+    )
+    return answers
+
+
+def answer_agreement(ref_model, cand_model, omr, layout, sheets):
+    """สัดส่วนข้อที่ candidate ตอบตรงกับ reference (นับ blank/MULTI ด้วย)"""
+    same = 0
+    total = 0
+    for img in sheets:
+        a = read_answers(ref_model, omr, layout, img)
+        b = read_answers(cand_model, omr, layout, img)
+        same += sum(1 for q in a if a[q] == b.get(q))
+        total += len(a)
+    return (same / total) if total else 0.0, same, total
+
+
+def main():
+    ap = argparse.ArgumentParser(description="INT8 quantization + accuracy gate")
+    ap.add_argument("--model", default=model_loader.DEFAULT_MODEL_PATH)
+    ap.add_argument("--calib", required=True, help="โฟลเดอร์รูป sheet สำหรับ calibration")
+    ap.add_argument("--corpus", required=True, help="โฟลเดอร์รูป sheet สำหรับเทียบคำตอบกับ FP32")
+    ap.add_argument("--num-questions", type=int, default=60)
+    ap.add_argument("--min-agreement", type=float, default=model_loader.INT8_MIN_AGREEMENT)
+    ap.add_argument("--calib-limit", type=int, default=200)
+    args = ap.parse_args()
+
+    fp32_path = onnx_backend.export_onnx(args.model)
+    out_path = model_loader.int8_path_for(args.model)
+    tmp_path = out_path + ".tmp"
+
+    calib = [img for _, img in bench.load_images(args.calib, args.calib_limit)]
+    corpus = [img for _, img in bench.load_images(args.corpus)]
+    if not calib or not corpus:
+        print("[INT8] ต้องมีรูปทั้ง --calib และ --corpus")
+        return 2
+
+    # ไฟล์ .tmp ไม่ค้าง ไม่ว่าจะ error / REFUSED
+    try:
+        print(f"[INT8] Calibrating on {len(calib)} sheets -> {tmp_path}")
+        quantize(fp32_path, tmp_path, calib)
+
+        omr = bench.get_omr()
+        layout = omr.get_layout(args.num_questions)
+        ref = model_loader.get_model(args.model, backend="onnx")
+        cand = onnx_backend.OnnxYOLO(tmp_path)
+
+        agreement, same, total = answer_agreement(ref, cand, omr, layout, corpus)
+        print(f"[INT8] Agreement vs FP32: {same}/{total} = {agreement:.4f} (min {args.min_agreement:.4f})")
+
+        if agreement < args.min_agreement:
+            print("[INT8] REFUSED: agreement ต่ำกว่าเกณฑ์ ไม่ติดตั้งไฟล์ INT8")
+            return 1
+
+        # report ผูกกับไฟล์ด้วย sha256 : หยุดก่อนเขียน report ใหม่ -> gate ไม่ยอมใช้ report เก่า
+        sha256 = model_loader.file_sha256(tmp_path)
+        os.replace(tmp_path, out_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    with open(model_loader.int8_report_path_for(args.model), "w", encoding="utf-8") as f:
+        json.dump({
+            "source": os.path.basename(fp32_path),
+            "sha256": sha256,
+            "agreement": agreement,
+            "questions": total,
+            "sheets": len(corpus),
+            "calib_sheets": len(calib),
+            "min_agreement": args.min_agreement,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }, f, indent=2)
+    print(f"[INT8] OK -> {out_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+# results.py
+"""
+cache ผลตรวจอายุสั้น (ใน process) สำหรับรูป debug overlay
+
+- put() เก็บ overlay ไว้กับ result_id แทนการฝังรูป base64 ลงใน result.html
+- overlay เป็นได้ทั้งรูป BGR (engine ที่วาดมาแล้ว -> ย่อเหลือ OVERLAY_STORE_WIDTH ก่อนเก็บ)
+  หรือ omr.Overlay ที่ warp + วาดเมื่อมีคนขอจริงเท่านั้น (omr.process_sheet debug="lazy")
+- plain=True: sheet เปล่า (ไม่วาด) ให้ browser วาดรอยเองจาก marks ; overlay ที่วาดมาแล้วได้รูปเดิม
+- encode (webp/jpeg ตามความกว้าง) ครั้งแรกที่ถูกขอ แล้วเก็บ bytes ไว้ใช้ซ้ำ
+- เก็บ RESULT_TTL_SEC วินาที / สูงสุด RESULT_CACHE_MAX รายการ (เก่าสุดออกก่อน)
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import cv2
+
+RESULT_TTL_SEC = int(os.getenv("RESULT_TTL_SEC", "900"))
+RESULT_CACHE_MAX = int(os.getenv("RESULT_CACHE_MAX", "64"))
+OVERLAY_WIDTH = int(os.getenv("OVERLAY_WIDTH", "640"))              # ความกว้างเริ่มต้นที่หน้า result ขอ
+OVERLAY_MAX_WIDTH = int(os.getenv("OVERLAY_MAX_WIDTH", "1600"))
+OVERLAY_STORE_WIDTH = int(os.getenv("OVERLAY_STORE_WIDTH", "1000"))  # overlay ที่วาดมาแล้ว ย่อเหลือเท่านี้ก่อนเก็บ
+OVERLAY_QUALITY = int(os.getenv("OVERLAY_QUALITY", "80"))
+OVERLAY_FORMATS = {
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY, "image/webp"),
+    "jpeg": (".jpg", cv2.IMWRITE_JPEG_QUALITY, "image/jpeg"),
+}
+
+_lock = threading.Lock()
+_results = OrderedDict()
+_stats = {"put": 0, "renders": 0, "encodes": 0, "hits": 0, "render_ms": 0.0, "bytes_out": 0}
+
+
+def _cleanup_locked(now):
+    while _results and (len(_results) > RESULT_CACHE_MAX or now - next(iter(_results.values()))["created_at"] > RESULT_TTL_SEC):
+        _results.popitem(last=False)
+
+
+def _fit_width(img, width):
+    h, w = img.shape[:2]
+    if w == width:
+        return img
+    interp = cv2.INTER_AREA if width < w else cv2.INTER_LINEAR
+    return cv2.resize(img, (int(width), int(round(h * width / float(w)))), interpolation=interp)
+
+
+def put(owner: str, overlay) -> str:
+    """เก็บ overlay (รูป BGR หรือ render(width)) -> result_id"""
+    if overlay is not None and not callable(overlay) and overlay.shape[1] > OVERLAY_STORE_WIDTH:
+        overlay = _fit_width(overlay, OVERLAY_STORE_WIDTH)
+
+    now = time.time()
+    entry = {
+        "id": uuid.uuid4().hex,
+        "owner": owner,
+        "created_at": now,
+        "overlay": overlay,
+        "lock": threading.Lock(),   # กัน render ซ้ำเมื่อขอพร้อมกัน
+        "encoded": {},              # (fmt, width, plain) -> bytes
+    }
+    with _lock:
+        _results[entry["id"]] = entry
+        _stats["put"] += 1
+        _cleanup_locked(now)
+    return entry["id"]
+
+
+def get(result_id: str, owner: str = None):
+    with _lock:
+        _cleanup_locked(time.time())
+        entry = _results.get(result_id)
+        if entry is None or (owner is not None and entry["owner"] != owner):
+            return None
+        return entry
+
+
+def clamp_width(width) -> int:
+    try:
+        width = int(width)
+    except (TypeError, ValueError):
+        return OVERLAY_WIDTH
+    return max(64, min(OVERLAY_MAX_WIDTH, width))
+
+
+def etag(result_id: str, fmt: str, width: int, plain: bool = False) -> str:
+    # ผลของ result_id หนึ่งไม่เปลี่ยนแล้ว -> etag = id + ขนาด + format พอ
+    return f'"{result_id}-{fmt}-{width}{"-plain" if plain else ""}"'
+
+
+def has_marks(entry) -> bool:
+    """overlay นี้ให้ browser วาดเองได้ (มี sheet เปล่า + marks)"""
+    return hasattr(entry["overlay"], "marks")
+
+
+def _render(overlay, width, plain):
+    if plain and hasattr(overlay, "sheet"):
+        return overlay.sheet(width)
+    return overlay(width) if callable(overlay) else _fit_width(overlay, width)
+
+
+def overlay_bytes(entry, fmt: str = "jpeg", width: int = OVERLAY_WIDTH, plain: bool = False):
+    """-> (bytes, mimetype) ; render + encode ครั้งแรกที่ขอขนาด/format นี้ แล้ว cache ไว้"""
+    ext, flag, mimetype = OVERLAY_FORMATS[fmt]
+    key = (fmt, width, bool(plain))
+    with entry["lock"]:
+        data = entry["encoded"].get(key)
+        if data is None:
+            t0 = time.perf_counter()
+            overlay = entry["overlay"]
+            img = _render(overlay, width, plain)
+            ok, buf = cv2.imencode(ext, img, [int(flag), OVERLAY_QUALITY])
+            if not ok:
+                raise ValueError(f"encode {fmt} failed")
+            data = entry["encoded"][key] = buf.tobytes()
+            with _lock:
+                _stats["renders" if callable(overlay) else "encodes"] += 1
+                _stats["render_ms"] += (time.perf_counter() - t0) * 1000
+        else:
+            with _lock:
+                _stats["hits"] += 1
+    with _lock:
+        _stats["bytes_out"] += len(data)
+    return data, mimetype
+
+
+def stats():
+    with _lock:
+        st = dict(_stats)
+        st["cached"] = len(_results)
+    return st
@@ -0,0 +1,127 @@
+# roi_tiles.py
+"""
+ตัดเฉพาะพื้นที่คำตอบ (คอลัมน์ bubble จาก template) แล้วแบ่งเป็น tile ขนาดที่ model เทรนมา (640)
+
+- ไม่ต้องส่ง header / ช่องชื่อ / ขอบกระดาษเข้า model
+- tile ซ้อนกัน TILE_OVERLAP px (มากกว่าขนาด bubble) -> รอยที่โดนขอบ tile ตัด จะเห็นเต็มใน tile ข้าง ๆ
+- กล่องจากทุก tile ถูกแปลงกลับเป็นพิกัด sheet แล้วตัดซ้ำด้วย NMS
+"""
+import math
+import os
+
+import cv2
+import numpy as np
+
+import layouts
+from yolo_ops import nms
+
+TILE_SIZE = int(os.getenv("TILE_SIZE", "640"))          # = imgsz ที่ model เทรนมา
+TILE_OVERLAP = int(os.getenv("TILE_OVERLAP", "64"))     # px (หลังย่อ)
+TILE_SCALE = float(os.getenv("TILE_SCALE", "0.5"))      # ย่อพื้นที่คำตอบก่อนตัด tile (1.0 = ความละเอียดเต็ม)
+TILE_NMS_IOU = float(os.getenv("TILE_NMS_IOU", "0.5"))
+ROI_PAD = 40                                            # px รอบคอลัมน์ (พิกัด sheet)
+EDGE_EPS = 2                                            # กล่องที่ชิดขอบ tile ด้านใน <= นี้ถือว่าโดนตัด
+
+
+def tile_starts(length: int, tile: int = TILE_SIZE, overlap: int = TILE_OVERLAP):
+    """จุดเริ่มของ tile ตามแกนเดียว ให้ tile สุดท้ายจบพอดีขอบ และซ้อนกันอย่างน้อย overlap"""
+    if length <= tile:
+        return [0]
+    n = math.ceil((length - overlap) / float(tile - overlap))
+    return [int(v) for v in np.linspace(0, length - tile, n).round()]
+
+
+def plan_tiles(layout, img_shape, scale: float = TILE_SCALE, tile: int = TILE_SIZE,
+               overlap: int = TILE_OVERLAP, pad: float = ROI_PAD):
+    """
+    -> list ของ (block_xyxy ในพิกัดรูป, tile_xyxy ในพิกัด block ที่ย่อแล้ว)
+    พิกัด template อ้างอิง SHEET_WIDTH x SHEET_HEIGHT ; รูปขนาดอื่นจะถูก scale ให้
+    """
+    h, w = img_shape[:2]
+    sx, sy = w / float(layouts.SHEET_WIDTH), h / float(layouts.SHEET_HEIGHT)
+
+    plan = []
+    for x0, y0, x1, y1 in layout.blocks:
+        bx0 = int(max(0, math.floor((x0 - pad) * sx)))
+        by0 = int(max(0, math.floor((y0 - pad) * sy)))
+        bx1 = int(min(w, math.ceil((x1 + pad) * sx)))
+        by1 = int(min(h, math.ceil((y1 + pad) * sy)))
+        bw = int(round((bx1 - bx0) * scale))
+        bh = int(round((by1 - by0) * scale))
+        for ty in tile_starts(bh, tile, overlap):
+            for tx in tile_starts(bw, tile, overlap):
+                plan.append(((bx0, by0, bx1, by1), (tx, ty, min(tx + tile, bw), min(ty + tile, bh))))
+    return plan
+
+
+def crop_tiles(img_bgr, plan, scale: float = TILE_SCALE):
+    """ย่อแต่ละ block ครั้งเดียว แล้วตัด tile ตาม plan -> list ของรูป"""
+    scaled = {}
+    tiles = []
+    for block, (tx0, ty0, tx1, ty1) in plan:
+        if block not in scaled:
+            bx0, by0, bx1, by1 = block
+            roi = img_bgr[by0:by1, bx0:bx1]
+            if scale != 1.0:
+                size = (int(round(roi.shape[1] * scale)), int(round(roi.shape[0] * scale)))
+                roi = cv2.resize(roi, size, interpolation=cv2.INTER_AREA)
+            scaled[block] = roi
+        tiles.append(scaled[block][ty0:ty1, tx0:tx1])
+    return tiles
+
+
+def stitch(detections, plan, scale: float = TILE_SCALE, iou_thres: float = TILE_NMS_IOU):
+    """
+    detections: list ของ (xyxy, conf) ต่อ tile (พิกัด tile) ตามลำดับ plan
+    -> (xyxy, conf) ในพิกัดรูป หลังทิ้งกล่องที่โดนขอบ tile ตัด + NMS ข้าม tile
+    """
+    all_boxes, all_confs = [], []
+    for (xyxy, conf), (block, (tx0, ty0, tx1, ty1)) in zip(detections, plan):
+        b = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+        c = np.asarray(conf, dtype=np.float32).reshape(-1)
+        if not len(b):
+            continue
+
+        bx0, by0, bx1, by1 = block
+        bw = round((bx1 - bx0) * scale)
+        bh = round((by1 - by0) * scale)
+        tw, th = tx1 - tx0, ty1 - ty0
+
+        # ขอบ tile ที่อยู่ข้างใน block (มี tile ข้าง ๆ เห็นรอยนี้เต็ม ๆ อยู่แล้ว)
+        cut = np.zeros(len(b), dtype=bool)
+        if tx0 > 0:
+            cut |= b[:, 0] <= EDGE_EPS
+        if ty0 > 0:
+            cut |= b[:, 1] <= EDGE_EPS
+        if tx1 < bw:
+            cut |= b[:, 2] >= tw - EDGE_EPS
+        if ty1 < bh:
+            cut |= b[:, 3] >= th - EDGE_EPS
+        b, c = b[~cut], c[~cut]
+
+        b = (b + np.array([tx0, ty0, tx0, ty0], np.float32)) / scale + np.array([bx0, by0, bx0, by0], np.float32)
+        all_boxes.append(b)
+        all_confs.append(c)
+
+    if not all_boxes:
+        return np.zeros((0, 4), np.float32), np.zeros((0,), np.float32)
+
+    boxes, confs = np.concatenate(all_boxes), np.concatenate(all_confs)
+    keep = nms(boxes, confs, iou_thres)
+    return boxes[keep], confs[keep]
+
+
+def pixel_stats(plan, img_shape, imgsz_full: int = TILE_SIZE):
+    """จำนวน pixel: ทั้งแผ่น / พื้นที่คำตอบ / ที่เข้า model (tile) / ที่เข้า model แบบย่อทั้งแผ่น"""
+    h, w = img_shape[:2]
+    blocks = {block for block, _ in plan}
+    roi = sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in blocks)
+    tiles = sum((x1 - x0) * (y1 - y0) for _, (x0, y0, x1, y1) in plan)
+    r = imgsz_full / float(max(h, w))
+    return {
+        "sheet_px": h * w,
+        "roi_px": roi,
+        "tile_px": tiles,
+        "tiles": len(plan),
+        "full_model_px": int(round(h * r) * round(w * r)),
+    }
@@ -0,0 +1,105 @@
+# slot_index.py
+"""
+Grid-bucket index ของ slot ใน template
+- แบ่งพื้นที่เป็นช่องขนาด max_dist x max_dist
+- แต่ละช่องเก็บ slot ของช่องตัวเอง + 8 ช่องรอบ ๆ (pad ด้วย -1)
+  => จุดที่อยู่ห่าง slot ไม่เกิน max_dist ต้องเจอ slot นั้นใน candidate ของช่องตัวเองเสมอ
+- assign(): หา slot ที่ใกล้ที่สุดของทุกจุดพร้อมกันด้วย numpy (ไม่มี loop ต่อกล่อง)
+"""
+import numpy as np
+
+
+class SlotIndex:
+    def __init__(self, slot_xy, max_dist: float):
+        self.slot_xy = np.asarray(slot_xy, dtype=np.float32).reshape(-1, 2)
+        self.max_dist = float(max_dist)
+        self.cell = self.max_dist
+
+        lo = self.slot_xy.min(axis=0) - self.max_dist
+        hi = self.slot_xy.max(axis=0) + self.max_dist
+        self.origin = lo
+        self.nx, self.ny = (np.floor((hi - lo) / self.cell).astype(int) + 1).tolist()
+
+        # slot -> ช่องของตัวเอง
+        cx, cy = self._cells(self.slot_xy)
+        buckets = [[] for _ in range(self.nx * self.ny)]
+        for i, (x, y) in enumerate(zip(cx, cy)):
+            buckets[y * self.nx + x].append(i)
+
+        # ช่อง -> candidate (ช่องตัวเอง + 8 ช่องรอบ)
+        cand = []
+        for y in range(self.ny):
+            for x in range(self.nx):
+                c = []
+                for yy in range(max(0, y - 1), min(self.ny, y + 2)):
+                    for xx in range(max(0, x - 1), min(self.nx, x + 2)):
+                        c.extend(buckets[yy * self.nx + xx])
+                cand.append(sorted(c))
+
+        k = max(1, max(len(c) for c in cand))
+        self.candidates = np.full((len(cand), k), -1, dtype=np.int32)
+        for i, c in enumerate(cand):
+            self.candidates[i, :len(c)] = c
+
+    def _cells(self, pts):
+        c = np.floor((pts - self.origin) / self.cell).astype(np.int64)
+        return c[:, 0], c[:, 1]
+
+    def assign(self, points):
+        """
+        points: (N,2) -> (N,) index ของ slot ที่ใกล้สุด (ระยะ < max_dist) หรือ -1
+        ถ้าระยะเท่ากันเลือก slot ที่ index น้อยกว่า (เหมือน loop เดิม)
+        """
+        pts = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+        out = np.full(len(pts), -1, dtype=np.int64)
+        if not len(pts):
+            return out
+
+        cx, cy = self._cells(pts)
+        inside = (cx >= 0) & (cx < self.nx) & (cy >= 0) & (cy < self.ny)
+        if not inside.any():
+            return out
+
+        p = pts[inside]
+        cand = self.candidates[cy[inside] * self.nx + cx[inside]]  # (M,K)
+        valid = cand >= 0
+
+        d = p[:, None, :] - self.slot_xy[np.where(valid, cand, 0)]
+        d2 = np.where(valid, (d * d).sum(axis=2), np.inf)
+
+        best = d2.argmin(axis=1)
+        rows = np.arange(len(p))
+        hit = d2[rows, best] < self.max_dist * self.max_dist
+        out[np.flatnonzero(inside)[hit]] = cand[rows[hit], best[hit]]
+        return out
+
+
+def build_conf_matrix(slot_pos, confs, slot_q, slot_opt, num_questions: int, num_options: int):
+    """
+    slot_pos: ผลจาก SlotIndex.assign, slot_q/slot_opt: ตาราง slot -> (ข้อ 0-based, ตัวเลือก) (-1 = ไม่ได้ map)
+    คืนค่า matrix (ข้อ x ตัวเลือก) ของ conf สูงสุดต่อช่อง (0 = ไม่มีรอย)
+    """
+    mat = np.zeros((num_questions, num_options), dtype=np.float32)
+    slot_pos = np.asarray(slot_pos)
+    ok = slot_pos >= 0
+    if not ok.any():
+        return mat
+
+    q = slot_q[slot_pos[ok]]
+    o = slot_opt[slot_pos[ok]]
+    mapped = q >= 0
+    np.maximum.at(mat, (q[mapped], o[mapped]), np.asarray(confs, dtype=np.float32)[ok][mapped])
+    return mat
+
+
+def answers_from_matrix(mat, options):
+    """matrix -> {ข้อ: ตัวเลือก / "MULTI" / None} (ข้อเริ่มที่ 1)"""
+    marked = mat > 0
+    counts = marked.sum(axis=1)
+    best = mat.argmax(axis=1)
+
+    answers = {}
+    for q in range(mat.shape[0]):
+        n = counts[q]
+        answers[q + 1] = None if n == 0 else (options[best[q]] if n == 1 else "MULTI")
+    return answers
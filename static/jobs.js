@@ -0,0 +1,45 @@
+// jobs.js : ส่งงานตรวจเข้าคิว (/jobs/submit) -> poll สถานะ -> ไปหน้าผลเมื่อเสร็จ
+// ถ้า fetch ใช้ไม่ได้ / network ล้ม จะ submit ฟอร์มแบบเดิม (fallbackAction)
+(function () {
+  const POLL_MS = 700;
+  const sleep = (ms) => new Promise((r) => setTimeout(r, ms));
+
+  // key ต่อคำขอตรวจ (ส่งซ้ำด้วย key เดิม -> server คืนผลเดิม ไม่ตัดเครดิตซ้ำ)
+  window.newIdempotencyKey = function () {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    return Date.now().toString(36) + "-" + Math.random().toString(36).slice(2);
+  };
+
+  window.submitGradeJob = async function (form, opts) {
+    const { fallbackAction, onState, onFail } = opts || {};
+    try {
+      const res = await fetch("/jobs/submit", { method: "POST", body: new FormData(form), credentials: "same-origin" });
+      const job = await res.json().catch(() => ({}));
+      if (!res.ok || !job.ok) {
+        if (job.redirect) { window.location.href = job.redirect; return; }
+        onFail && onFail(job.message || "ส่งงานตรวจไม่สำเร็จ กรุณาลองใหม่");
+        return;
+      }
+
+      onState && onState("queued");
+      for (;;) {
+        await sleep(POLL_MS);
+        const r = await fetch(job.status_url, { credentials: "same-origin" });
+        const st = await r.json().catch(() => ({}));
+        if (!r.ok) { onFail && onFail(st.message || "ไม่พบงานตรวจ"); return; }
+        onState && onState(st.state);
+        if (st.state === "done" || st.state === "error") {
+          window.location.href = job.result_url;
+          return;
+        }
+      }
+    } catch (e) {
+      if (fallbackAction) {
+        form.action = fallbackAction;
+        form.submit();
+      } else {
+        onFail && onFail("เชื่อมต่อไม่สำเร็จ กรุณาลองใหม่");
+      }
+    }
+  };
+})();
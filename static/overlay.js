@@ -0,0 +1,54 @@
+// overlay.js : วาด debug overlay (จุด template + ป้ายรอยฝน) บน canvas ทับ sheet เปล่าจาก /results/<id>/overlay?plain=1
+// ข้อมูลมาจาก <script id="debugMarks"> (omr.marks_payload: พิกัด template 1600x2300) ; วาดใหม่เมื่อขนาดเปลี่ยน
+// วัดผล: window.overlayDrawMs = เวลาวาด, window.overlayReadyMs = เวลาตั้งแต่เริ่มโหลดหน้าจนวาดเสร็จ
+(function () {
+  const holder = document.getElementById("debugMarks");
+  const img = document.getElementById("debugSheet");
+  const canvas = document.getElementById("debugCanvas");
+  if (!holder || !img || !canvas || !canvas.getContext) return;
+  const data = JSON.parse(holder.textContent);
+
+  function draw() {
+    const w = img.clientWidth, h = img.clientHeight;
+    if (!w || !h) return;
+    const t0 = performance.now();
+    const dpr = window.devicePixelRatio || 1;
+
+    canvas.style.left = img.offsetLeft + "px";
+    canvas.style.top = img.offsetTop + "px";
+    canvas.style.width = w + "px";
+    canvas.style.height = h + "px";
+    canvas.width = Math.round(w * dpr);
+    canvas.height = Math.round(h * dpr);
+
+    const ctx = canvas.getContext("2d");
+    const sx = canvas.width / data.w, sy = canvas.height / data.h;
+    ctx.clearRect(0, 0, canvas.width, canvas.height);
+
+    // จุด template ทุก slot (path เดียว fill ครั้งเดียว)
+    const r = Math.max(1, 3 * sx);
+    ctx.fillStyle = "rgb(0, 100, 255)";
+    ctx.beginPath();
+    for (let i = 0; i < data.slots.length; i += 2) {
+      const x = data.slots[i] * sx, y = data.slots[i + 1] * sy;
+      ctx.moveTo(x + r, y);
+      ctx.arc(x, y, r, 0, 2 * Math.PI);
+    }
+    ctx.fill();
+
+    // ป้าย "ข้อ+ตัวเลือก conf" ที่รอยฝน
+    ctx.fillStyle = "rgb(255, 255, 0)";
+    ctx.font = "bold " + Math.max(9, Math.round(20 * sx)) + "px sans-serif";
+    for (const [x, y, q, o, c] of data.marks) {
+      ctx.fillText((q + 1) + data.opts[o] + " " + (c / 100).toFixed(2), x * sx, y * sy);
+    }
+
+    window.overlayDrawMs = performance.now() - t0;
+    window.overlayReadyMs = performance.now();
+  }
+
+  if (img.complete && img.naturalWidth) draw();
+  img.addEventListener("load", draw);
+  window.addEventListener("resize", draw);
+  document.addEventListener("fullscreenchange", () => requestAnimationFrame(draw));
+})();
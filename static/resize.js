@@ -0,0 +1,108 @@
+// resize.js : ย่อรูปกระดาษคำตอบใน browser ให้เท่าความละเอียดที่ server ใช้จริง แล้ว encode JPEG ใหม่ก่อนอัปโหลด
+// ค่าเป้าหมายมาจาก server (upload.html -> data-upload-config) ; ย่อไม่ได้ / ไฟล์ไม่เล็กลง -> ส่งไฟล์เดิม
+// วัดผล: window.uploadResizeInfo = { origBytes, bytes, ms, width, height, resized }
+(function () {
+  // ย่อครั้งเดียวไม่เกินครึ่ง (ย่อทีละขั้นให้ตัวอักษร/วงกลมไม่แตก)
+  function drawScaled(src, sw, sh, tw, th) {
+    let canvas = document.createElement("canvas");
+    let cur = src, cw = sw, ch = sh;
+    while (cw / 2 >= tw && ch / 2 >= th) {
+      const step = document.createElement("canvas");
+      step.width = Math.round(cw / 2);
+      step.height = Math.round(ch / 2);
+      const sctx = step.getContext("2d");
+      sctx.imageSmoothingQuality = "high";
+      sctx.drawImage(cur, 0, 0, step.width, step.height);
+      cur = step; cw = step.width; ch = step.height;
+    }
+    canvas.width = tw;
+    canvas.height = th;
+    const ctx = canvas.getContext("2d");
+    ctx.imageSmoothingQuality = "high";
+    ctx.drawImage(cur, 0, 0, tw, th);
+    return canvas;
+  }
+
+  async function decode(file) {
+    // createImageBitmap หมุนตาม EXIF ให้ (เหมือน cv2.imdecode ฝั่ง server) และไม่ block main thread
+    if (window.createImageBitmap) {
+      try {
+        const bmp = await createImageBitmap(file, { imageOrientation: "from-image" });
+        return { src: bmp, w: bmp.width, h: bmp.height, close: () => bmp.close && bmp.close() };
+      } catch (e) { /* ลองผ่าน <img> แทน */ }
+    }
+    const url = URL.createObjectURL(file);
+    try {
+      const img = new Image();
+      img.decoding = "async";
+      img.src = url;
+      await img.decode();
+      return { src: img, w: img.naturalWidth, h: img.naturalHeight, close: () => {} };
+    } finally {
+      URL.revokeObjectURL(url);
+    }
+  }
+
+  function toBlob(canvas, quality) {
+    return new Promise((resolve) => canvas.toBlob(resolve, "image/jpeg", quality));
+  }
+
+  // file -> File ที่ย่อแล้ว หรือ null (ใช้ไฟล์เดิม)
+  async function resizeFile(file, maxSide, quality, maxBytes) {
+    if (!file || !/^image\//.test(file.type || "image/")) return null;
+    const pic = await decode(file);
+    try {
+      const scale = Math.min(1, maxSide / Math.max(pic.w, pic.h));
+      // ขนาดพอดีอยู่แล้ว + เป็น JPEG ที่ไม่เกิน limit ของ server -> ไม่ต้อง encode ซ้ำ
+      if (scale === 1 && /jpe?g$/i.test(file.type) && !(maxBytes && file.size > maxBytes)) return null;
+      const tw = Math.max(1, Math.round(pic.w * scale));
+      const th = Math.max(1, Math.round(pic.h * scale));
+      const blob = await toBlob(drawScaled(pic.src, pic.w, pic.h, tw, th), quality);
+      if (!blob || blob.size >= file.size) return null;
+      const name = (file.name || "sheet").replace(/\.[^.]+$/, "") + ".jpg";
+      return { file: new File([blob], name, { type: "image/jpeg", lastModified: Date.now() }), width: tw, height: th };
+    } finally {
+      pic.close();
+    }
+  }
+
+  // แทนไฟล์ใน <input type=file> ด้วยรูปที่ย่อแล้ว (ฟอร์มแบบเดิม + FormData ได้ไฟล์ใหม่ทั้งคู่)
+  // ไฟล์เดิมเก็บไว้ใน input.originalFile ; error ใด ๆ -> คืนไฟล์เดิม ไม่ขวางการส่ง
+  window.prepareSheetUpload = async function (input, maxSide, cfg) {
+    cfg = cfg || {};
+    const original = input.originalFile || (input.files && input.files[0]);
+    if (!original || cfg.enabled === false || !maxSide || !window.DataTransfer) return false;
+    input.originalFile = original;
+
+    const t0 = performance.now();
+    let out = null;
+    try {
+      out = await resizeFile(original, maxSide, cfg.quality || 0.9, cfg.max_bytes);
+    } catch (e) {
+      out = null;
+    }
+
+    const dt = new DataTransfer();
+    dt.items.add(out ? out.file : original);
+    try {
+      input.files = dt.files;
+    } catch (e) {
+      return false;
+    }
+
+    window.uploadResizeInfo = {
+      origBytes: original.size,
+      bytes: out ? out.file.size : original.size,
+      ms: Math.round(performance.now() - t0),
+      width: out ? out.width : null,
+      height: out ? out.height : null,
+      resized: !!out,
+    };
+    return !!out;
+  };
+
+  // เลือกไฟล์ใหม่ -> ลืมไฟล์เดิมที่เก็บไว้
+  window.resetSheetUpload = function (input) {
+    input.originalFile = null;
+  };
+})();
@@ -0,0 +1,112 @@
+# train_patch_classifier.py
+"""
+เทรน patch classifier (logistic regression) โดยใช้ YOLO model ปัจจุบันเป็นคนติด label
+
+- รูป sheet ที่เก็บไว้ (warp แล้ว หรือรูปถ่ายที่ warp อัตโนมัติได้) -> YOLO -> slot ไหนมีรอยฝน = 1
+- patch ของทุก slot -> feature -> logistic regression (numpy, full-batch gradient descent + L2)
+- แบ่ง validation ตามแผ่น แล้วรายงาน accuracy / precision / recall / agreement รายข้อเทียบ YOLO
+
+ตัวอย่าง:
+    python train_patch_classifier.py --sheets sheets/ --num-questions 60
+"""
+import argparse
+import sys
+
+import numpy as np
+
+import bench
+import patch_classifier as pc
+from slot_index import answers_from_matrix
+
+
+def yolo_labels(omr, layout, img):
+    """label ต่อ slot (ตามลำดับ layout) จาก YOLO: 1 = มีรอยฝน conf >= CONF_THRES"""
+    det = omr.model.predict(source=img, conf=omr.CONF_THRES, verbose=False)[0]
+    conf_mat, _, _ = omr.conf_matrix_from_detections(
+        det.boxes.xyxy.cpu().numpy(), det.boxes.conf.cpu().numpy(), layout
+    )
+    mapped = layout.slot_q >= 0
+    labels = np.zeros(len(layout.slot_q), dtype=np.float32)
+    labels[mapped] = conf_mat[layout.slot_q[mapped], layout.slot_opt[mapped]] >= omr.CONF_THRES
+    return labels, conf_mat
+
+
+def train_logreg(X, y, epochs: int = 300, lr: float = 0.5, l2: float = 1e-3):
+    """logistic regression แบบถ่วงน้ำหนัก class (ช่องที่ฝนมีน้อยกว่าช่องว่างมาก)"""
+    n, d = X.shape
+    w = np.zeros(d, dtype=np.float32)
+    b = 0.0
+
+    pos = max(float(y.sum()), 1.0)
+    neg = max(float(n - y.sum()), 1.0)
+    sw = np.where(y > 0, n / (2 * pos), n / (2 * neg)).astype(np.float32)
+
+    for epoch in range(epochs):
+        p = pc.sigmoid(X @ w + b)
+        g = sw * (p - y)
+        w -= lr * (X.T @ g / n + l2 * w)
+        b -= lr * float(g.mean())
+        if epoch % 50 == 0 or epoch == epochs - 1:
+            loss = -np.mean(sw * (y * np.log(p + 1e-7) + (1 - y) * np.log(1 - p + 1e-7)))
+            print(f"[PATCH] epoch {epoch:4d} loss={loss:.4f}")
+    return w, b
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Train bubble patch classifier from YOLO labels")
+    ap.add_argument("--sheets", required=True, help="โฟลเดอร์รูป sheet ที่เก็บไว้")
+    ap.add_argument("--num-questions", type=int, default=60)
+    ap.add_argument("--out", default=pc.PATCH_MODEL_PATH)
+    ap.add_argument("--val-ratio", type=float, default=0.2)
+    ap.add_argument("--epochs", type=int, default=300)
+    ap.add_argument("--limit", type=int, default=None)
+    args = ap.parse_args()
+
+    omr = bench.get_omr()
+    layout = omr.get_layout(args.num_questions)
+    mapped = layout.slot_q >= 0
+
+    sheets = [img for _, img in bench.load_images(args.sheets, args.limit)]
+    if len(sheets) < 2:
+        print("[PATCH] ต้องมีรูปอย่างน้อย 2 แผ่น")
+        return 2
+
+    feats, labels, yolo_answers = [], [], []
+    for img in sheets:
+        y, conf_mat = yolo_labels(omr, layout, img)
+        feats.append(pc.patch_features(pc.extract_patches(img, layout))[mapped])
+        labels.append(y[mapped])
+        yolo_answers.append(answers_from_matrix(conf_mat, layout.options))
+
+    n_val = max(1, int(len(sheets) * args.val_ratio))
+    n_train = len(sheets) - n_val
+    X_train, y_train = np.concatenate(feats[:n_train]), np.concatenate(labels[:n_train])
+    print(f"[PATCH] train sheets={n_train} patches={len(X_train)} positives={int(y_train.sum())} | val sheets={n_val}")
+
+    w, b = train_logreg(X_train, y_train, epochs=args.epochs)
+
+    X_val, y_val = np.concatenate(feats[n_train:]), np.concatenate(labels[n_train:])
+    pred = pc.sigmoid(X_val @ w + b) >= pc.PATCH_THRES
+    tp = int((pred & (y_val > 0)).sum())
+    acc = float((pred == (y_val > 0)).mean())
+    precision = tp / max(int(pred.sum()), 1)
+    recall = tp / max(int(y_val.sum()), 1)
+
+    same = total = 0
+    for f, ref in zip(feats[n_train:], yolo_answers[n_train:]):
+        probs = np.zeros((layout.num_questions, layout.num_options), dtype=np.float32)
+        probs[layout.slot_q[mapped], layout.slot_opt[mapped]] = pc.sigmoid(f @ w + b)
+        got = answers_from_matrix(np.where(probs >= pc.PATCH_THRES, probs, 0.0), layout.options)
+        same += sum(1 for q in ref if ref[q] == got[q])
+        total += len(ref)
+
+    print(f"[PATCH] val bubble acc={acc:.4f} precision={precision:.4f} recall={recall:.4f}")
+    print(f"[PATCH] val answer agreement vs YOLO: {same}/{total} = {same / max(total, 1):.4f}")
+
+    pc.save_model(args.out, w, b, meta={"num_questions": layout.num_questions, "train_sheets": n_train})
+    print(f"[PATCH] saved -> {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,10 +3,14 @@ import cv2
 import numpy as np
 import smtplib
 import os
+import threading
+import time
 from dotenv import load_dotenv
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
+import corners
+
 load_dotenv()
 
 # =========================
@@ -30,6 +34,32 @@ AUTO_CROP_BOTTOM = 40
 AUTO_CROP_LEFT = 0
 AUTO_CROP_RIGHT = 0
 
+# ด้านยาวของรูปย่อที่ใช้หาขอบกระดาษ / fiducial
+AUTO_DETECT_SIDE = 1000
+
+# วิธีหามุม: auto (fiducial ก่อน แล้วไล่ strategy หาขอบกระดาษ) | markers | contour | legacy (Canny อย่างเดียว)
+CORNER_MODE = os.getenv("CORNER_MODE", "auto").strip().lower()
+
+# =========================
+# Upload decode config
+# =========================
+# รูปที่ใหญ่เกินนี้ปฏิเสธตั้งแต่อ่าน header (ไม่ decode) ; 48MP จากมือถือยังผ่าน
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", "60000000"))
+MAX_IMAGE_SIDE = int(os.getenv("MAX_IMAGE_SIDE", "12000"))
+REDUCED_DECODE = (os.getenv("REDUCED_DECODE", "1") == "1")
+
+# libjpeg ย่อระหว่าง decode ได้ 1/2, 1/4, 1/8 (ไม่ต้องสร้างรูปเต็มก่อน)
+_REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+# ขนาดไฟล์ / เวลา decode ต่อแผ่น (presized = รูปที่ browser ย่อมาให้แล้ว ไม่ต้องย่อซ้ำ)
+_decode_lock = threading.Lock()
+DECODE_STATS = {"count": 0, "bytes": 0, "decode_ms": 0.0, "presized": 0, "presized_bytes": 0}
+
 
 # =========================
 # Perspective helpers
@@ -58,49 +88,215 @@ def warp_from_four_points(image, pts):
     return cv2.warpPerspective(image, M, (TARGET_WIDTH, TARGET_HEIGHT))
 
 
-def auto_detect_and_warp(image_bgr):
+class SheetGeometry:
+    """
+    มุมกระดาษที่หาเจอในรูปถ่าย (พิกัดรูปต้นฉบับ) + รูปย่อที่ใช้หามุม
+    warp(size) = ย่อ + homography + crop AUTO_CROP_* + resize รวมเป็น perspective transform เดียว
+    """
+
+    def __init__(self, image, corners, small=None, small_scale=1.0, method=None, score=None):
+        self.image = image
+        self.corners = order_points(corners)
+        self.small = small
+        self.small_scale = small_scale
+        self.method = method
+        self.score = score
+
+    def transform(self, size, scale=1.0):
+        """3x3 จากพิกัดรูป (ย่อด้วย scale) -> sheet ขนาด size=(w, h) ที่ crop ขอบแล้ว"""
+        w, h = size
+        sx = w / float(TARGET_WIDTH - AUTO_CROP_LEFT - AUTO_CROP_RIGHT)
+        sy = h / float(TARGET_HEIGHT - AUTO_CROP_TOP - AUTO_CROP_BOTTOM)
+        dst = np.array([
+            [0, 0],
+            [TARGET_WIDTH - 1, 0],
+            [TARGET_WIDTH - 1, TARGET_HEIGHT - 1],
+            [0, TARGET_HEIGHT - 1],
+        ], dtype="float32")
+        dst = (dst - [AUTO_CROP_LEFT, AUTO_CROP_TOP]) * [sx, sy]
+        return cv2.getPerspectiveTransform(self.corners * scale, dst.astype("float32"))
+
+    def sheet_side(self, scale=1.0):
+        """ความยาวขอบที่ยาวที่สุดของกระดาษในรูป (px)"""
+        edges = self.corners - np.roll(self.corners, 1, axis=0)
+        return float(np.sqrt((edges ** 2).sum(axis=1)).max()) * scale
+
+    def downsized(self):
+        """geometry เดียวกันแต่ถือแค่รูปย่อ (เก็บไว้นาน ๆ ได้โดยไม่กินหน่วยความจำเท่ารูปเต็ม)"""
+        if self.small is None or self.small is self.image:
+            return self
+        return SheetGeometry(self.small, self.corners * self.small_scale, method=self.method, score=self.score)
+
+    def warp(self, size=(TARGET_WIDTH, TARGET_HEIGHT)):
+        """sheet ขนาด size ; ถ้ารูปย่อละเอียดพอสำหรับขนาดปลายทาง warp จากรูปย่อเลย (ไม่แตะรูปเต็ม)"""
+        src, scale = self.image, 1.0
+        if self.small is not None and self.sheet_side(self.small_scale) >= max(size):
+            src, scale = self.small, self.small_scale
+        M = self.transform(size, scale)
+        return cv2.warpPerspective(src, M, (int(size[0]), int(size[1])), flags=cv2.INTER_LINEAR)
+
+
+def detect_sheet(image_bgr, mode=None, layout=None, budget_ms=None):
+    """
+    หามุมกระดาษจากรูปย่อ (ด้านยาว AUTO_DETECT_SIDE) -> SheetGeometry หรือ None
+    mode (ค่าเริ่มต้น CORNER_MODE): auto = fiducial ก่อนแล้วไล่ strategy หาขอบ | markers | contour | legacy
+    layout: ให้คะแนน quad ด้วยตำแหน่ง bubble ของ template (ไม่ส่ง = ใช้รูปทรงกระดาษ)
+    geom.method / geom.score บอกว่า strategy ไหนชนะ (ดู corners.py)
+    """
     if image_bgr is None:
         return None
 
-    orig = image_bgr.copy()
-    h, w = orig.shape[:2]
+    h, w = image_bgr.shape[:2]
     if h <= 0 or w <= 0:
         return None
 
-    scale = 1000.0 / max(w, h)
-    resized = cv2.resize(orig, (int(w * scale), int(h * scale))) if scale < 1 else orig.copy()
-    scale = min(scale, 1.0)
-
+    scale = AUTO_DETECT_SIDE / float(max(w, h))
+    if scale < 1:
+        resized = cv2.resize(image_bgr, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+    else:
+        resized, scale = image_bgr, 1.0
     gray = cv2.cvtColor(resized, cv2.COLOR_BGR2GRAY)
-    gray = cv2.GaussianBlur(gray, (5, 5), 0)
-    edges = cv2.Canny(gray, 50, 150)
-    edges = cv2.dilate(edges, None, iterations=2)
-    edges = cv2.erode(edges, None, iterations=1)
 
-    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    if not contours:
+    found = corners.find_corners(
+        gray, lambda quad, size: SheetGeometry(None, quad).transform(size),
+        layout=layout, mode=(mode or CORNER_MODE).strip().lower(), budget_ms=budget_ms,
+    )
+    if found is None:
         return None
 
-    contours = sorted(contours, key=cv2.contourArea, reverse=True)
-    img_area = resized.shape[0] * resized.shape[1]
-
-    for min_ratio in (0.10, 0.05, 0.02):
-        for cnt in contours:
-            if cv2.contourArea(cnt) < img_area * min_ratio:
-                continue
-            peri = cv2.arcLength(cnt, True)
-            approx = cv2.approxPolyDP(cnt, 0.02 * peri, True)
-            if len(approx) == 4 and cv2.isContourConvex(approx):
-                warped = warp_from_four_points(orig, approx.reshape(4, 2) / scale)
-                hf, wf = warped.shape[:2]
-                crop = warped[
-                    AUTO_CROP_TOP:hf - AUTO_CROP_BOTTOM,
-                    AUTO_CROP_LEFT:wf - AUTO_CROP_RIGHT
-                ]
-                return cv2.resize(crop, (TARGET_WIDTH, TARGET_HEIGHT))
+    quad, method, score = found
+    return SheetGeometry(image_bgr, quad / scale, resized, scale, method, score)
+
+
+def auto_detect_and_warp(image_bgr, size=(TARGET_WIDTH, TARGET_HEIGHT)):
+    """หามุม + warp ไปขนาด size (ค่าเริ่มต้น = ขนาด sheet เต็ม) ; หาไม่เจอ -> None"""
+    geom = detect_sheet(image_bgr)
+    return geom.warp(size) if geom is not None else None
+
+
+# =========================
+# Upload decode
+# =========================
+class ImageRejected(ValueError):
+    """ไฟล์รูปเสีย / ไม่รองรับ / ใหญ่เกิน (message แสดงให้ผู้ใช้ได้เลย)"""
+
+
+def _probe_jpeg(data):
+    i, n = 2, len(data)
+    while i + 3 < n:
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:          # fill byte
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            i += 2
+            continue
+        if marker in (0xD9, 0xDA):  # จบ/เริ่ม scan ก่อนเจอ SOF = ไฟล์เสีย
+            return None
+        seg_len = int.from_bytes(data[i + 2:i + 4], "big")
+        if seg_len < 2:
+            return None
+        if marker in _JPEG_SOF:
+            if i + 9 > n:
+                return None
+            h = int.from_bytes(data[i + 5:i + 7], "big")
+            w = int.from_bytes(data[i + 7:i + 9], "big")
+            return w, h
+        i += 2 + seg_len
+    return None
+
+
+def _probe_webp(data):
+    chunk = data[12:16]
+    if chunk == b"VP8 " and len(data) >= 30 and data[23:26] == b"\x9d\x01\x2a":
+        return (int.from_bytes(data[26:28], "little") & 0x3FFF,
+                int.from_bytes(data[28:30], "little") & 0x3FFF)
+    if chunk == b"VP8L" and len(data) >= 25 and data[20] == 0x2F:
+        bits = int.from_bytes(data[21:25], "little")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X" and len(data) >= 30:
+        return int.from_bytes(data[24:27], "little") + 1, int.from_bytes(data[27:30], "little") + 1
     return None
 
 
+def probe_image_header(data):
+    """อ่านแค่ header -> (format, width, height) หรือ None ถ้าไม่ใช่ JPEG/PNG/WebP ที่อ่านได้"""
+    if not data:
+        return None
+    if data[:3] == b"\xff\xd8\xff":
+        fmt, size = "jpeg", _probe_jpeg(data)
+    elif data[:8] == b"\x89PNG\r\n\x1a\n" and data[12:16] == b"IHDR" and len(data) >= 24:
+        fmt, size = "png", (int.from_bytes(data[16:20], "big"), int.from_bytes(data[20:24], "big"))
+    elif data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        fmt, size = "webp", _probe_webp(data)
+    else:
+        return None
+    if not size or size[0] <= 0 or size[1] <= 0:
+        return None
+    return fmt, size[0], size[1]
+
+
+def check_image_header(data):
+    """ตรวจ header ก่อน decode -> (format, w, h) ; ไฟล์เสีย/ใหญ่เกิน -> ImageRejected"""
+    info = probe_image_header(data)
+    if info is None:
+        raise ImageRejected("❌ ไม่สามารถอ่านไฟล์รูปได้ (ไฟล์เสียหรือไม่รองรับ) กรุณาลองถ่าย/เลือกใหม่")
+    _, w, h = info
+    if w * h > MAX_IMAGE_PIXELS or max(w, h) > MAX_IMAGE_SIDE:
+        raise ImageRejected(f"❌ รูปใหญ่เกินไป ({w}x{h}) กรุณาลดขนาดหรือถ่ายใหม่")
+    return info
+
+
+def reduced_decode_flag(fmt, w, h, max_side):
+    """flag ของ imdecode ที่ย่อมากที่สุดโดยด้านยาวยังไม่ต่ำกว่า max_side (เฉพาะ JPEG) -> (flag, factor)"""
+    if fmt == "jpeg" and max_side and REDUCED_DECODE:
+        for factor, flag in _REDUCED_FLAGS:
+            if max(w, h) / factor >= max_side:
+                return flag, factor
+    return cv2.IMREAD_COLOR, 1
+
+
+def decode_image_bytes(data, max_side=None):
+    """
+    bytes -> รูป BGR ที่ด้านยาวไม่เกิน max_side
+    - ตรวจ header ก่อน (ไฟล์เสีย/ใหญ่เกิน ไม่ต้อง decode)
+    - JPEG ใหญ่: decode แบบย่อ 1/2..1/8 ให้ใกล้ max_side เลย แล้วค่อย resize ส่วนที่เหลือ
+    """
+    t0 = time.perf_counter()
+    fmt, w, h = check_image_header(data)
+    flag, _ = reduced_decode_flag(fmt, w, h, max_side)
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), flag)
+    if img is None:
+        raise ImageRejected("❌ ไม่สามารถอ่านไฟล์รูปได้ (ไฟล์เสียหรือไม่รองรับ) กรุณาลองถ่าย/เลือกใหม่")
+
+    ih, iw = img.shape[:2]
+    if max_side and max(ih, iw) > max_side:
+        scale = max_side / float(max(ih, iw))
+        img = cv2.resize(img, (int(iw * scale), int(ih * scale)), interpolation=cv2.INTER_AREA)
+
+    presized = bool(max_side) and max(w, h) <= max_side
+    with _decode_lock:
+        DECODE_STATS["count"] += 1
+        DECODE_STATS["bytes"] += len(data)
+        DECODE_STATS["decode_ms"] += (time.perf_counter() - t0) * 1000
+        if presized:
+            DECODE_STATS["presized"] += 1
+            DECODE_STATS["presized_bytes"] += len(data)
+    return img
+
+
+def decode_stats():
+    with _decode_lock:
+        st = dict(DECODE_STATS)
+    n = st["count"]
+    st["avg_bytes"] = int(st["bytes"] / n) if n else 0
+    st["avg_decode_ms"] = round(st["decode_ms"] / n, 2) if n else 0.0
+    st["decode_ms"] = round(st["decode_ms"], 1)
+    return st
+
+
 # =========================
 # Answer key normalizer
 # =========================
@@ -0,0 +1,146 @@
+# yolo_ops.py
+"""
+ชิ้นส่วน pre/post-process ของ YOLO ที่เขียนเอง (ไม่พึ่ง ultralytics/torch)
+- letterbox: ย่อ + เติมขอบให้เป็นสี่เหลี่ยมจัตุรัสแบบเดียวกับ ultralytics
+- nms: Non-Maximum Suppression แบบ numpy
+- Results/Boxes: หน้าตาเหมือนผลของ ultralytics พอให้ omr ใช้ต่อได้โดยไม่ต้องแก้
+"""
+import cv2
+import numpy as np
+
+LETTERBOX_COLOR = (114, 114, 114)
+
+
+# =========================
+# Results shim
+# =========================
+class _Array:
+    """ห่อ numpy ให้เรียก .cpu().numpy() ได้เหมือน torch.Tensor"""
+
+    def __init__(self, arr):
+        self._arr = np.asarray(arr)
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self._arr
+
+    def __len__(self):
+        return len(self._arr)
+
+
+class Boxes:
+    def __init__(self, xyxy, conf, cls=None):
+        xyxy = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+        conf = np.asarray(conf, dtype=np.float32).reshape(-1)
+        cls = np.zeros_like(conf) if cls is None else np.asarray(cls, dtype=np.float32).reshape(-1)
+        self.xyxy = _Array(xyxy)
+        self.conf = _Array(conf)
+        self.cls = _Array(cls)
+
+    def __len__(self):
+        return len(self.conf)
+
+
+class Results:
+    def __init__(self, boxes: Boxes, orig_shape):
+        self.boxes = boxes
+        self.orig_shape = tuple(orig_shape[:2])
+
+
+# =========================
+# Pre-process
+# =========================
+def letterbox(img_bgr, new_size: int = 640):
+    """
+    ย่อรูปให้ด้านยาว = new_size แล้วเติมขอบเทาให้เป็น new_size x new_size
+    คืนค่า: (img, gain, (pad_x, pad_y))
+    """
+    h, w = img_bgr.shape[:2]
+    gain = min(new_size / h, new_size / w)
+    nw, nh = int(round(w * gain)), int(round(h * gain))
+
+    if (nw, nh) != (w, h):
+        img_bgr = cv2.resize(img_bgr, (nw, nh), interpolation=cv2.INTER_LINEAR)
+
+    pad_x = (new_size - nw) / 2.0
+    pad_y = (new_size - nh) / 2.0
+    top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+    left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+    out = cv2.copyMakeBorder(img_bgr, top, bottom, left, right, cv2.BORDER_CONSTANT, value=LETTERBOX_COLOR)
+    return out, gain, (left, top)
+
+
+def to_blob(images_bgr):
+    """list ของรูป BGR (ขนาดเท่ากัน) -> float32 NCHW RGB 0..1"""
+    batch = np.stack(images_bgr, axis=0)[..., ::-1]
+    batch = batch.transpose(0, 3, 1, 2).astype(np.float32) / 255.0
+    return np.ascontiguousarray(batch)
+
+
+# =========================
+# Post-process
+# =========================
+def nms(boxes, scores, iou_thres: float = 0.7):
+    """greedy NMS -> index ที่เก็บไว้ (เรียงตาม score มาก->น้อย)"""
+    if len(boxes) == 0:
+        return np.zeros((0,), dtype=np.int64)
+
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = np.maximum(x2 - x1, 0) * np.maximum(y2 - y1, 0)
+    order = np.argsort(-scores, kind="stable")
+
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        if order.size == 1:
+            break
+        rest = order[1:]
+        xx1 = np.maximum(x1[i], x1[rest])
+        yy1 = np.maximum(y1[i], y1[rest])
+        xx2 = np.minimum(x2[i], x2[rest])
+        yy2 = np.minimum(y2[i], y2[rest])
+        inter = np.maximum(xx2 - xx1, 0) * np.maximum(yy2 - yy1, 0)
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_thres]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def postprocess(pred, conf_thres: float, iou_thres: float = 0.7, max_det: int = 300):
+    """
+    pred: output ของ YOLOv8 หนึ่งรูป shape (4 + nc, N) เป็น cx,cy,w,h + class scores
+    คืนค่า: xyxy (K,4), conf (K,), cls (K,) ในพิกัดของรูป letterbox
+    """
+    pred = pred.T
+    scores_all = pred[:, 4:]
+    cls = scores_all.argmax(axis=1)
+    conf = scores_all[np.arange(len(pred)), cls]
+
+    m = conf > conf_thres
+    pred, conf, cls = pred[m], conf[m], cls[m]
+    if not len(pred):
+        return np.zeros((0, 4), np.float32), np.zeros((0,), np.float32), np.zeros((0,), np.float32)
+
+    cx, cy, w, h = pred[:, 0], pred[:, 1], pred[:, 2], pred[:, 3]
+    xyxy = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+
+    # แยก NMS ตาม class ด้วยการเลื่อนกล่องแต่ละ class ออกจากกัน
+    offset = cls[:, None].astype(np.float32) * 7680.0
+    keep = nms(xyxy + offset, conf, iou_thres)[:max_det]
+    return xyxy[keep].astype(np.float32), conf[keep].astype(np.float32), cls[keep].astype(np.float32)
+
+
+def scale_boxes(xyxy, gain: float, pad, orig_shape):
+    """พิกัด letterbox -> พิกัดรูปต้นฉบับ"""
+    if not len(xyxy):
+        return xyxy
+    out = xyxy.copy()
+    out[:, [0, 2]] -= pad[0]
+    out[:, [1, 3]] -= pad[1]
+    out /= gain
+    h, w = orig_shape[:2]
+    out[:, [0, 2]] = out[:, [0, 2]].clip(0, w)
+    out[:, [1, 3]] = out[:, [1, 3]].clip(0, h)
+    return out